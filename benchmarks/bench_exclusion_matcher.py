@@ -0,0 +1,58 @@
+"""Compare the compiled ExclusionMatcher against the old per-pattern fnmatch loop.
+
+Usage: python benchmarks/bench_exclusion_matcher.py [--paths N]
+"""
+import os
+import sys
+import fnmatch
+import random
+import argparse
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from lib.exclusion_matcher import ExclusionMatcher
+
+def make_patterns(count):
+    kinds = ['*.{0}', 'build{0}', 'cache_{0}/', 'src/gen{0}/*', 'docs/**/*.{0}', 'tmp{0}?']
+    return [kinds[i % len(kinds)].format(f'x{i}') for i in range(count)]
+
+def make_paths(count):
+    rng = random.Random(42)
+    dirs = ['src', 'src/app', 'src/app/views', 'docs', 'docs/guide/intro', 'tests', 'lib/vendor/pkg']
+    exts = ['py', 'js', 'md', 'txt', 'json']
+    return [f"{rng.choice(dirs)}/file{i}.{rng.choice(exts)}" for i in range(count)]
+
+def fnmatch_loop(paths, patterns):
+    excluded = 0
+    for path in paths:
+        for pattern in patterns:
+            if fnmatch.fnmatch(path, pattern):
+                excluded += 1
+                break
+    return excluded
+
+def compiled_matcher(paths, patterns):
+    matcher = ExclusionMatcher('.', patterns, read_nested=False)
+    return sum(1 for path in paths if matcher.is_excluded(path))
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--paths', type=int, default=20000)
+    args = parser.parse_args()
+    paths = make_paths(args.paths)
+
+    print(f"{'patterns':>8} {'fnmatch (s)':>12} {'compiled (s)':>13} {'speedup':>8}")
+    for count in (10, 100, 1000):
+        patterns = make_patterns(count)
+        old = timed(fnmatch_loop, paths, patterns)
+        new = timed(compiled_matcher, paths, patterns)
+        print(f"{count:>8} {old:>12.3f} {new:>13.3f} {old / new:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Compare the peak memory of planning a sync with path dicts against the compact FileTree.
+
+Each variant runs in its own process, builds the source and target listings
+of a synthetic tree (the target is shifted by a tenth, so there is
+something to copy and to delete), and plans the copies and deletions; the
+peak RSS of that process is reported.
+
+Usage: python benchmarks/bench_file_tree.py [--files N]
+"""
+import os
+import sys
+import random
+import argparse
+import subprocess
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from lib.file_tree import FileTree, PathList
+
+def make_listing(files, seed, first=0):
+    """Yield (rel_dir, [(name, size, mtime), ...]) for a tree of about `files` files, 50 per directory"""
+    rng = random.Random(seed)
+    for index in range(first, first + files, 50):
+        rel_dir = os.path.join('project', f'module_{index // 5000}', f'package_{index // 500}', f'dir_{index // 50}')
+        yield rel_dir, [(f'source_file_{index + offset}.py', rng.randint(0, 1 << 20), 1700000000.0 + rng.random())
+                        for offset in range(50)]
+
+def plan_with_dicts(files):
+    source = {}
+    target = {}
+    for rel_dir, entries in make_listing(files, 1):
+        for name, size, mtime in entries:
+            source[os.path.join(rel_dir, name)] = (size, mtime)
+    for rel_dir, entries in make_listing(files, 2, files // 10):
+        for name, size, mtime in entries:
+            target[os.path.join(rel_dir, name)] = (size, mtime)
+    files_to_copy = [rel_path for rel_path, stats in source.items()
+                     if rel_path not in target or stats[1] > target[rel_path][1]]
+    files_to_delete = [rel_path for rel_path in target if rel_path not in source]
+    return len(files_to_copy), len(files_to_delete)
+
+def plan_with_tree(files):
+    source = FileTree()
+    target = FileTree()
+    for rel_dir, entries in make_listing(files, 1):
+        source.add_dir(rel_dir, entries)
+    for rel_dir, entries in make_listing(files, 2, files // 10):
+        target.add_dir(rel_dir, entries)
+    files_to_copy = PathList(source)
+    for file_id, rel_path, stats in source.entries():
+        target_stats = target.get(rel_path)
+        if target_stats is None or stats[1] > target_stats[1]:
+            files_to_copy.append(file_id)
+    files_to_delete = target.difference(source)
+    return len(files_to_copy), len(files_to_delete)
+
+def peak_rss_mib():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def child(variant, files):
+    start = time.perf_counter()
+    counts = plan_with_dicts(files) if variant == 'dicts' else plan_with_tree(files)
+    print(f"{peak_rss_mib():.1f} {time.perf_counter() - start:.2f} {counts[0]} {counts[1]}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=1000000)
+    parser.add_argument('--child', choices=('dicts', 'tree'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child, args.files)
+        return
+
+    baseline = float(subprocess.run([sys.executable, '-c', 'import resource; print(resource.getrusage('
+                                     'resource.RUSAGE_SELF).ru_maxrss / 1024)'],
+                                    capture_output=True, text=True, check=True).stdout)
+    print(f"{args.files} files per side, interpreter baseline {baseline:.1f} MiB")
+    print(f"{'variant':>8} {'peak RSS (MiB)':>15} {'plan (MiB)':>11} {'time (s)':>9} {'copy':>8} {'delete':>8}")
+    results = {}
+    for variant in ('dicts', 'tree'):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--files', str(args.files),
+                                 '--child', variant], capture_output=True, text=True, check=True).stdout
+        peak, seconds, copy_count, delete_count = output.split()
+        results[variant] = float(peak) - baseline
+        print(f"{variant:>8} {float(peak):>15.1f} {results[variant]:>11.1f} {float(seconds):>9.2f} "
+              f"{copy_count:>8} {delete_count:>8}")
+    print(f"FileTree plan uses {results['dicts'] / max(results['tree'], 0.1):.1f}x less memory")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Compare scanning source and target one after the other, single-threaded, against concurrent threaded scans.
+
+The target simulates a network mount by sleeping before every directory
+listing; the source is read at local disk speed.
+
+Usage: python benchmarks/bench_scan.py [--dirs N] [--files-per-dir N] [--latency MS] [--threads N]
+"""
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from lib.sync_engine import SyncEngine
+from lib.exclusion_matcher import ExclusionMatcher
+
+class QuietApp:
+    def log_message(self, message, message_type='info'):
+        pass
+
+def make_tree(root, dirs, files_per_dir):
+    for index in range(dirs):
+        folder = os.path.join(root, f'group_{index // 20}', f'dir_{index}')
+        os.makedirs(folder)
+        for number in range(files_per_dir):
+            with open(os.path.join(folder, f'file_{number}.txt'), 'w') as f:
+                f.write(str(number))
+
+def slow_scandir(scandir, slow_root, latency):
+    def scandir_with_latency(path='.'):
+        if str(path).startswith(slow_root):
+            time.sleep(latency)
+        return scandir(path)
+    return scandir_with_latency
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dirs', type=int, default=1000)
+    parser.add_argument('--files-per-dir', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=2.0, help='milliseconds per target directory listing')
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix='bench_scan_')
+    try:
+        source = os.path.join(work, 'source')
+        target = os.path.join(work, 'target')
+        make_tree(source, args.dirs, args.files_per_dir)
+        make_tree(target, args.dirs, args.files_per_dir)
+        os.scandir = slow_scandir(os.scandir, target, args.latency / 1000)
+        engine = SyncEngine(QuietApp())
+        matcher = ExclusionMatcher(source, [], [], read_nested=False)
+
+        print(f"{args.dirs} directories per side, {args.latency} ms per target listing")
+        print(f"{'mode':>12} {'time (s)':>9} {'files':>8}")
+        start = time.perf_counter()
+        source_files = engine.scan_folder(source, matcher)
+        target_files = engine.scan_folder(target, matcher)
+        sequential = time.perf_counter() - start
+        print(f"{'sequential':>12} {sequential:>9.2f} {len(source_files) + len(target_files):>8}")
+
+        start = time.perf_counter()
+        source_files, target_files = engine.scan_concurrently(
+            lambda: engine.scan_folder(source, matcher, threads=args.threads),
+            lambda: engine.scan_folder(target, matcher, threads=args.threads))
+        concurrent = time.perf_counter() - start
+        print(f"{'concurrent':>12} {concurrent:>9.2f} {len(source_files) + len(target_files):>8}")
+        print(f"Concurrent scan is {sequential / concurrent:.1f}x faster")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
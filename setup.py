@@ -33,11 +33,12 @@ setup(
     ],
     python_requires=">=3.6",
     install_requires=[
-        "watchdog>=2.1.0",
+        "watchdog>=4.0.0",
     ],
     entry_points={
         "console_scripts": [
             "folder-syncer=main:main",
+            "folder-syncer-cli=cli:main",
         ],
         "gui_scripts": [
             "folder-syncer-gui=main:main",
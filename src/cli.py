@@ -0,0 +1,350 @@
+"""Headless entry point: one-shot sync, trial run, plan apply, or a watching daemon, with JSON summaries on stdout
+
+Nothing here imports tkinter, and watchdog is only loaded in watch mode, so
+a one-shot sync starts scanning right after the engine modules load.
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+class ConsoleApp:
+    """Stands in for the UI message handler: logs to stderr and applies monitored changes directly"""
+    def __init__(self, settings, json_output=False):
+        self.settings = settings
+        self.json_output = json_output
+        self.sync_engine = None
+        self.errors = 0
+        self.totals = {'copied': 0, 'moved': 0, 'deleted': 0}
+        self.lock = threading.Lock()
+
+    def log_message(self, message, message_type='info'):
+        if message_type == 'error':
+            with self.lock:
+                self.errors += 1
+            logging.error(message)
+        elif message_type == 'ignored':
+            logging.debug(message)
+        else:
+            logging.info(message)
+
+    def auto_sync_enabled(self):
+        return True
+
+    def handle_changes(self, changes):
+        results = self.sync_engine.sync_changes(self.settings['left_folder'], self.settings['right_folder'],
+                                                changes, self.settings['delete_files'])
+        with self.lock:
+            for key in self.totals:
+                self.totals[key] += len(results[key])
+        if self.json_output and any(results.values()):
+            emit({'event': 'synced', 'copied': results['copied'],
+                  'moved': [list(pair) for pair in results['moved']], 'deleted': results['deleted']})
+
+    def handle_catch_up(self):
+        if not self.sync_engine.metadata_index:
+            return
+        summary = self.sync_engine.catch_up(self.settings['left_folder'], self.settings['right_folder'],
+                                            self.settings['delete_files'])
+        with self.lock:
+            for key in self.totals:
+                self.totals[key] += summary[key]
+        if self.json_output:
+            record = {'event': 'catch_up'}
+            record.update(summary, duration=round(summary['duration'], 3))
+            emit(record)
+
+def emit(record):
+    sys.stdout.write(json.dumps(record) + '\n')
+    sys.stdout.flush()
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='folder-syncer-cli', description=__doc__.splitlines()[0])
+    parser.add_argument('mode', choices=('sync', 'trial', 'apply', 'watch'),
+                        help="sync once, show what a sync would do, apply a saved trial plan, "
+                             "or keep syncing changes as they happen")
+    parser.add_argument('source', nargs='?', help="source (left) folder; defaults to the configured one")
+    parser.add_argument('targets', nargs='*', metavar='target',
+                        help="target (right) folder; defaults to the configured one. Several targets are synced "
+                             "from one scan of the source, reading each file once")
+    parser.add_argument('--config', default='syncer_config.json', help="settings file (default: %(default)s)")
+    parser.add_argument('--profile', action='append', default=None, metavar='NAME',
+                        help="run a named profile from the settings file instead of one pair, repeatable")
+    parser.add_argument('--all-profiles', action='store_true', help="run every profile in the settings file")
+    parser.add_argument('--exclude', action='append', default=None, metavar='PATTERN',
+                        help="exclusion pattern in .gitignore syntax; replaces the configured ones, repeatable. "
+                             "With apply, leaves out the plan's operations on matching paths")
+    parser.add_argument('--plan', metavar='FILE',
+                        help="with trial, save the planned operations to FILE; with apply, the plan to carry out")
+    parser.add_argument('--include', action='append', default=None, metavar='PATTERN',
+                        help="with apply, only carry out operations on paths matching this pattern, repeatable")
+    parser.add_argument('--only', action='append', default=None, choices=('move', 'copy', 'touch', 'delete'),
+                        help="with apply, only carry out operations of this kind, repeatable")
+    parser.add_argument('--stale', choices=('replan', 'reject'), default='replan',
+                        help="with apply, what to do with files changed since the trial run: decide again from "
+                             "their current state, or skip them (default: %(default)s)")
+    parser.add_argument('--delete', dest='delete_files', action='store_true', default=None,
+                        help="delete target files missing from the source")
+    parser.add_argument('--no-delete', dest='delete_files', action='store_false',
+                        help="never delete anything in the target")
+    parser.add_argument('--use-index', dest='use_index', action='store_true', default=None,
+                        help="use the metadata index to detect renamed files by inode")
+    parser.add_argument('--no-index', dest='use_index', action='store_false')
+    parser.add_argument('--compare', dest='compare_mode', choices=('mtime', 'hash'), default=None,
+                        help="how to decide whether a file changed")
+    parser.add_argument('--json', action='store_true', help="print JSON summaries on stdout")
+    parser.add_argument('-v', '--verbose', action='count', default=0, help="log progress to stderr (-vv for debug)")
+    return parser.parse_args(argv)
+
+def resolve_settings(args, config):
+    """Command-line flags override the saved settings"""
+    settings = dict(config)
+    if args.source:
+        settings['left_folder'] = args.source
+    if args.targets:
+        settings['right_folder'] = args.targets[0]
+    if args.exclude is not None:
+        settings['exclusions'] = '\n'.join(args.exclude)
+    for key in ('delete_files', 'use_index', 'compare_mode'):
+        value = getattr(args, key)
+        if value is not None:
+            settings[key] = value
+    settings.setdefault('delete_files', True)
+    settings.setdefault('use_index', False)
+    settings.setdefault('compare_mode', 'mtime')
+    settings['additional_patterns'] = [p.strip() for p in settings.get('exclusions', '').split('\n') if p.strip()]
+    return settings
+
+def build_engine(app, config_manager, settings, watching):
+    from lib.sync_engine import SyncEngine
+    sync_engine = SyncEngine(app)
+    # The index also holds the journal that watch mode catches up from
+    if settings['use_index'] or watching:
+        from lib.metadata_index import MetadataIndex
+        sync_engine.metadata_index = MetadataIndex(config_manager.get_data_path('syncer_index.db'))
+    if settings['compare_mode'] == 'hash':
+        from lib.hash_cache import HashCache
+        sync_engine.hash_cache = HashCache(config_manager.get_data_path('syncer_hashes.db'))
+    from lib.sync_journal import SyncJournal
+    sync_engine.journal = SyncJournal(config_manager.get_data_path('syncer_journal.db'))
+    sync_engine.configure(settings)
+    sync_engine.set_exclusions(settings['left_folder'], settings['additional_patterns'])
+    app.sync_engine = sync_engine
+    return sync_engine
+
+def run_once(app, sync_engine, settings, trial_run, plan_path=None):
+    start_time = time.monotonic()
+    gitignore_patterns = list(sync_engine.exclusions.gitignore_patterns)
+    copied, deleted = sync_engine.sync_folders(
+        settings['left_folder'], settings['right_folder'], gitignore_patterns, settings['additional_patterns'],
+        settings['delete_files'], trial_run, use_index=settings['use_index'],
+        compare_mode=settings['compare_mode'], plan_path=plan_path)
+    summary = {
+        'event': 'summary',
+        'mode': 'trial' if trial_run else 'sync',
+        'source': settings['left_folder'],
+        'target': settings['right_folder'],
+        'copied': copied,
+        'deleted': deleted,
+        'errors': app.errors,
+        'duration': round(time.monotonic() - start_time, 3),
+    }
+    if plan_path:
+        summary['plan'] = plan_path
+    return summary
+
+def run_apply(args, config_manager, config):
+    """Carry out a plan saved by a trial run, filtered by the command line; returns an exit code"""
+    from lib.sync_plan import SyncPlan, PlanError
+    if not args.plan:
+        logging.error("apply needs the plan to carry out: --plan FILE")
+        return 2
+    if args.source or args.targets or args.profile or args.all_profiles:
+        logging.error("The folders of apply come from the plan")
+        return 2
+    try:
+        plan = SyncPlan.load(args.plan)
+    except (OSError, PlanError) as e:
+        logging.error(f"Could not read plan {args.plan}: {str(e)}")
+        return 2
+    for side, folder in (('source', plan.source), ('target', plan.target)):
+        if not os.path.isdir(folder):
+            logging.error(f"The {side} folder of the plan does not exist: {folder}")
+            return 2
+    plan = plan.filtered(args.only, args.include or (), args.exclude or ())
+
+    start_time = time.monotonic()
+    args.source, args.exclude = plan.source, None
+    args.targets = [plan.target]
+    settings = resolve_settings(args, config)
+    settings['compare_mode'] = plan.options.get('compare_mode', 'mtime')
+    app = ConsoleApp(settings, args.json)
+    sync_engine = build_engine(app, config_manager, settings, False)
+    results = sync_engine.apply_plan(plan, stale=args.stale)
+    summary = {'event': 'summary', 'mode': 'apply', 'plan': args.plan, 'source': plan.source, 'target': plan.target}
+    summary.update(results, errors=app.errors, duration=round(time.monotonic() - start_time, 3))
+    if args.json:
+        emit(summary)
+    else:
+        print(f"apply: {results['copied']} copied, {results['moved']} moved, {results['deleted']} deleted, "
+              f"{results['stale']} changed since planning ({results['rejected']} skipped), "
+              f"{app.errors} errors in {summary['duration']}s")
+    return 1 if app.errors else 0
+
+def run_fan_out(app, sync_engine, settings, target_folders, trial_run):
+    start_time = time.monotonic()
+    gitignore_patterns = list(sync_engine.exclusions.gitignore_patterns)
+    results = sync_engine.sync_to_targets(
+        settings['left_folder'], target_folders, gitignore_patterns, settings['additional_patterns'],
+        settings['delete_files'], trial_run, compare_mode=settings['compare_mode'])
+    if not app.json_output:
+        for target_folder, counts in results.items():
+            print(f"{target_folder}: {counts['copied']} copied, {counts['moved']} moved, "
+                  f"{counts['deleted']} deleted, {counts['errors']} errors")
+    return {
+        'event': 'summary',
+        'mode': 'trial' if trial_run else 'sync',
+        'source': settings['left_folder'],
+        'targets': results,
+        'copied': sum(counts['copied'] for counts in results.values()),
+        'deleted': sum(counts['deleted'] for counts in results.values()),
+        'errors': app.errors,
+        'duration': round(time.monotonic() - start_time, 3),
+    }
+
+def wait_for_signal():
+    stop_event = threading.Event()
+    # Both Ctrl+C and a service manager's SIGTERM end the daemon cleanly
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    while not stop_event.wait(1.0):
+        pass
+
+def run_watch(app, settings):
+    from lib.file_monitor import FileMonitor
+    start_time = time.monotonic()
+    file_monitor = FileMonitor(app)
+    file_monitor.configure(settings)
+    if not file_monitor.start(settings['left_folder'], catch_up=True):
+        return None
+    if app.json_output:
+        emit({'event': 'watching', 'source': settings['left_folder'], 'target': settings['right_folder']})
+    wait_for_signal()
+    # Pending changes are synced before stopping
+    file_monitor.stop()
+    summary = {'event': 'summary', 'mode': 'watch', 'source': settings['left_folder'],
+               'target': settings['right_folder']}
+    summary.update(app.totals, errors=app.errors, duration=round(time.monotonic() - start_time, 3))
+    return summary
+
+def run_profiles(args, config_manager, config):
+    """Run several profiles at once through the scheduler; returns an exit code"""
+    profiles = config_manager.get_profiles(config)
+    names = sorted(profiles) if args.all_profiles else args.profile
+    selected = {}
+    for name in names:
+        if name not in profiles:
+            logging.error(f"No profile named {name} in {args.config}")
+            return 2
+        settings = resolve_settings(args, profiles[name])
+        for key, side in (('left_folder', 'source'), ('right_folder', 'target')):
+            if not settings.get(key) or not os.path.isdir(settings[key]):
+                logging.error(f"The {side} folder of profile {name} is not set or does not exist: "
+                              f"{settings.get(key) or '(none)'}")
+                return 2
+        selected[name] = settings
+    if not selected:
+        logging.error(f"No profiles in {args.config}")
+        return 2
+
+    app = ConsoleApp(config, args.json)
+
+    def on_result(record):
+        with app.lock:
+            for key in app.totals:
+                value = record.get(key, 0)
+                app.totals[key] += value if isinstance(value, int) else len(value)
+        if args.json:
+            emit(record)
+        elif record['event'] == 'summary':
+            print(f"{record['profile']}: {record['copied']} copied, {record['deleted']} deleted, "
+                  f"{record['errors']} errors in {record['duration']}s")
+
+    from lib.sync_scheduler import SyncScheduler
+    start_time = time.monotonic()
+    scheduler = SyncScheduler(app, config_manager, config, selected, on_result)
+    if args.mode == 'watch':
+        scheduler.start()
+        if args.json:
+            emit({'event': 'watching', 'profiles': sorted(selected)})
+        wait_for_signal()
+    else:
+        scheduler.run_all(args.mode == 'trial')
+    # Pending changes are synced before stopping
+    scheduler.stop()
+    summary = {'event': 'summary', 'mode': args.mode, 'profiles': sorted(selected)}
+    summary.update(app.totals, errors=app.errors, duration=round(time.monotonic() - start_time, 3))
+    if args.json:
+        emit(summary)
+    else:
+        print(f"{args.mode}: {summary['copied']} copied, {summary['deleted']} deleted, "
+              f"{summary['errors']} errors in {summary['duration']}s across {len(selected)} profiles")
+    return 1 if summary['errors'] else 0
+
+def main(argv=None):
+    args = parse_args(argv)
+    level = logging.WARNING if args.verbose == 0 else logging.INFO if args.verbose == 1 else logging.DEBUG
+    logging.basicConfig(level=level, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+
+    from lib.config_manager import ConfigManager
+    config_manager = ConfigManager(args.config)
+    config = config_manager.load_config()
+    if args.mode == 'apply':
+        return run_apply(args, config_manager, config)
+    if args.profile or args.all_profiles:
+        if args.source or args.targets:
+            logging.error("Folders cannot be given together with --profile or --all-profiles")
+            return 2
+        return run_profiles(args, config_manager, config)
+    if args.plan and args.mode != 'trial':
+        logging.error("--plan saves a plan in trial mode, or names the plan to apply")
+        return 2
+    settings = resolve_settings(args, config)
+    target_folders = args.targets or [settings.get('right_folder')]
+    folders = [('source', settings.get('left_folder'))] + [('target', folder) for folder in target_folders]
+    for side, folder in folders:
+        if not folder or not os.path.isdir(folder):
+            logging.error(f"The {side} folder is not set or does not exist: {folder or '(none)'}")
+            return 2
+    if len(target_folders) > 1 and (args.mode == 'watch' or args.plan):
+        logging.error("Watching and saved plans support a single target folder")
+        return 2
+
+    app = ConsoleApp(settings, args.json)
+    sync_engine = build_engine(app, config_manager, settings, args.mode == 'watch')
+    if args.mode == 'watch':
+        summary = run_watch(app, settings)
+        if summary is None:
+            return 1
+    elif len(target_folders) > 1:
+        summary = run_fan_out(app, sync_engine, settings, target_folders, args.mode == 'trial')
+    else:
+        summary = run_once(app, sync_engine, settings, args.mode == 'trial', args.plan)
+
+    if args.json:
+        emit(summary)
+    else:
+        print(f"{summary['mode']}: {summary['copied']} copied, {summary['deleted']} deleted, "
+              f"{summary['errors']} errors in {summary['duration']}s")
+    return 1 if summary['errors'] else 0
+
+if __name__ == "__main__":
+    # Needed for the hashing process pool in frozen builds
+    import multiprocessing
+    multiprocessing.freeze_support()
+    sys.exit(main())
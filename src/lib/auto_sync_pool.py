@@ -0,0 +1,120 @@
+import time
+import threading
+import logging
+from collections import deque, Counter
+
+DEFAULT_AUTO_SYNC_WORKERS = 4
+DEFAULT_MAX_QUEUED = 64
+
+class _Task:
+    __slots__ = ('keys', 'shared', 'func', 'enqueued')
+
+    def __init__(self, keys, shared, func):
+        self.keys = keys
+        self.shared = shared
+        self.func = func
+        self.enqueued = time.monotonic()
+
+class AutoSyncPool:
+    """Bounded worker pool that keeps tasks touching the same paths in submission order
+
+    Each task carries the set of paths it touches. A task only starts once no
+    running or earlier queued task shares one of its paths, so operations on
+    a path never overtake each other while unrelated paths run concurrently.
+    Shared keys only conflict with the same key held exclusively, which lets
+    file changes share their parent directories while a change to one of
+    those directories waits for them (and they for it).
+    submit() blocks when max_queued tasks are waiting, which pushes back on
+    the caller instead of growing the queue without bound.
+    """
+    def __init__(self, workers=DEFAULT_AUTO_SYNC_WORKERS, max_queued=DEFAULT_MAX_QUEUED):
+        self.workers = max(1, int(workers))
+        self.max_queued = max(1, int(max_queued))
+        self.condition = threading.Condition()
+        self.pending = deque()
+        self.busy_keys = set()
+        self.busy_shared = Counter()
+        self.active = 0
+        self.completed = 0
+        self.latencies = deque(maxlen=100)
+        self.running = True
+        self.threads = [threading.Thread(target=self._worker, name=f'auto-sync-{i}', daemon=True)
+                        for i in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, keys, func, shared_keys=()):
+        with self.condition:
+            while self.running and len(self.pending) >= self.max_queued:
+                self.condition.wait()
+            if not self.running:
+                return False
+            self.pending.append(_Task(frozenset(keys), frozenset(shared_keys), func))
+            self.condition.notify_all()
+            return True
+
+    def shutdown(self):
+        """Finish every queued task, then stop the workers"""
+        with self.condition:
+            while self.pending or self.active:
+                self.condition.wait()
+            self.running = False
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+
+    def stats(self):
+        with self.condition:
+            latencies = list(self.latencies)
+            return {
+                'queued': len(self.pending),
+                'active': self.active,
+                'completed': self.completed,
+                'avg_latency': sum(latencies) / len(latencies) if latencies else 0.0,
+                'max_latency': max(latencies) if latencies else 0.0,
+            }
+
+    def _next_runnable(self):
+        blocked = set(self.busy_keys)
+        blocked_shared = set(self.busy_shared)
+        for index, task in enumerate(self.pending):
+            if (blocked.isdisjoint(task.keys) and blocked_shared.isdisjoint(task.keys) and
+                    blocked.isdisjoint(task.shared)):
+                del self.pending[index]
+                return task
+            blocked.update(task.keys)
+            blocked_shared.update(task.shared)
+        return None
+
+    def _worker(self):
+        while True:
+            with self.condition:
+                task = None
+                while self.running:
+                    task = self._next_runnable()
+                    if task:
+                        break
+                    self.condition.wait()
+                if task is None:
+                    return
+                self.busy_keys.update(task.keys)
+                self.busy_shared.update(task.shared)
+                self.active += 1
+                # A queue slot opened up for a blocked submit()
+                self.condition.notify_all()
+            try:
+                task.func()
+            except Exception as e:
+                logging.error(f"Error in auto-sync task: {str(e)}", exc_info=True)
+            latency = time.monotonic() - task.enqueued
+            logging.debug(f"Auto-sync task for {len(task.keys)} paths finished in {latency:.3f}s")
+            with self.condition:
+                self.busy_keys.difference_update(task.keys)
+                self.busy_shared.subtract(task.shared)
+                for key in task.shared:
+                    if self.busy_shared[key] <= 0:
+                        del self.busy_shared[key]
+                self.active -= 1
+                self.completed += 1
+                self.latencies.append(latency)
+                self.condition.notify_all()
@@ -1,10 +1,17 @@
 import json
 import os
 
+# Settings that belong to one folder pair; everything else in the file is shared by all profiles
+PROFILE_KEYS = ('left_folder', 'right_folder', 'exclusions')
+
 class ConfigManager:
     def __init__(self, config_file="syncer_config.json"):
         self.config_file = config_file
         
+    def get_data_path(self, filename):
+        """Path for an auxiliary data file stored next to the config file"""
+        return os.path.join(os.path.dirname(os.path.abspath(self.config_file)), filename)
+        
     def load_config(self):
         try:
             if os.path.exists(self.config_file):
@@ -23,3 +30,40 @@ class ConfigManager:
         except Exception as e:
             print(f"Error saving config: {str(e)}")
             return False
+            
+    def get_profiles(self, config=None):
+        """Named folder pairs, each merged over the shared settings
+        
+        Profiles live under "profiles" in the config file and only need the
+        keys that differ from the top-level settings. The top-level pair,
+        which the window edits, is available as "default" unless a profile
+        of that name exists.
+        """
+        if config is None:
+            config = self.load_config()
+        shared = {key: value for key, value in config.items() if key != 'profiles' and key not in PROFILE_KEYS}
+        profiles = {}
+        if config.get('left_folder') and config.get('right_folder'):
+            profiles['default'] = dict(config)
+            profiles['default'].pop('profiles', None)
+        for name, profile in config.get('profiles', {}).items():
+            settings = dict(shared)
+            settings.update(profile)
+            profiles[name] = settings
+        return profiles
+        
+    def get_profile(self, name, config=None):
+        return self.get_profiles(config).get(name)
+        
+    def save_profile(self, name, profile):
+        """Add or replace a named profile, keeping the rest of the config file as it is"""
+        config = self.load_config()
+        config.setdefault('profiles', {})[name] = profile
+        return self.save_config(config)
+        
+    def delete_profile(self, name):
+        config = self.load_config()
+        if name not in config.get('profiles', {}):
+            return False
+        del config['profiles'][name]
+        return self.save_config(config)
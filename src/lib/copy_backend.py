@@ -0,0 +1,355 @@
+import os
+import sys
+import errno
+import shutil
+import hashlib
+import threading
+import logging
+from collections import Counter
+from lib.delta_transfer import DELTA_BLOCK_SIZE
+from lib.durable_writes import DurableWrites, fsync_path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# _IOW(0x94, 9, int) from linux/fs.h
+FICLONE = 0x40049409
+
+CHUNK_SIZE = 8 * 1024 * 1024
+BUFFER_SIZE = 1024 * 1024
+
+# Copies in progress are written next to the target under this suffix,
+# which the exclusion rules always skip
+PARTIAL_SUFFIX = '.syncer-part'
+# Longest file name, in bytes, that common file systems accept
+NAME_MAX = 255
+
+def partial_path(target):
+    """The temporary name a copy of target is written under, shortened when the name would be too long
+    
+    Names near NAME_MAX are cut and given a hash of the full name instead,
+    which keeps the partial file of a given target the same across runs.
+    """
+    folder, name = os.path.split(target)
+    partial = f'.{name}{PARTIAL_SUFFIX}'
+    if len(os.fsencode(partial)) <= NAME_MAX:
+        return os.path.join(folder, partial)
+    encoded = os.fsencode(name)
+    digest = hashlib.sha1(encoded).hexdigest()[:16]
+    keep = NAME_MAX - len(f'.~{digest}{PARTIAL_SUFFIX}')
+    # Cut on a character boundary
+    prefix = encoded[:keep].decode('utf-8', 'ignore')
+    return os.path.join(folder, f'.{prefix}~{digest}{PARTIAL_SUFFIX}')
+
+def remove_partial(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+# Errors meaning "this method does not work between these filesystems",
+# as opposed to a real I/O problem with the file being copied
+UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EINVAL,
+                      errno.ENOSYS, errno.ENOTTY, errno.EBADF, errno.EPERM}
+
+class UnsupportedMethod(Exception):
+    pass
+
+class CopyBackend:
+    """Copies file data with the fastest method the source and target filesystems support
+
+    On Linux the order tried is FICLONE reflink, os.copy_file_range,
+    os.sendfile and finally a buffered read/write loop. Methods that fail
+    with an "unsupported" error are remembered per (source device, target
+    device) pair and skipped from then on. Metadata is preserved like
+    shutil.copy2. Other platforms use shutil.copyfile and copystat.
+
+    Whole-file copies are written to a partial file next to the target and
+    put into place by self.durability, which also decides when they are
+    flushed to disk.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.unsupported = {}
+        self.method_counts = Counter()
+        methods = []
+        if sys.platform.startswith('linux'):
+            if fcntl is not None:
+                methods.append('reflink')
+            if hasattr(os, 'copy_file_range'):
+                methods.append('copy_file_range')
+            if hasattr(os, 'sendfile'):
+                methods.append('sendfile')
+            methods.append('buffered')
+        self.methods = methods
+        self.durability = DurableWrites()
+
+    def copy(self, source, target):
+        """Copy source to target including metadata; returns the name of the method used"""
+        temp = partial_path(target)
+        try:
+            if not self.methods:
+                shutil.copyfile(source, temp)
+                if self.durability.flush_each():
+                    fsync_path(temp)
+                method = 'copy2'
+            else:
+                with open(source, 'rb') as fsrc, open(temp, 'wb') as fdst:
+                    method = self.copy_data(fsrc, fdst)
+                    self.durability.written(fdst)
+            shutil.copystat(source, temp)
+            self.durability.publish(temp, target, os.path.getsize(temp))
+        except BaseException:
+            remove_partial(temp)
+            raise
+        with self.lock:
+            self.method_counts[method] += 1
+        return method
+
+    def copy_many(self, source, targets, delta_targets=()):
+        """Copy source to several targets while reading it only once
+        
+        Targets on the source's device are reflinked where possible, which
+        reads nothing. The rest are written from a single pass over the
+        source: one remaining target goes through copy_data, several share
+        each buffer read, and targets in delta_targets are updated in place
+        with only the blocks that differ written. Other targets are written
+        to partial files and put into place like copy() does. Returns
+        {target: (method, bytes written)}, or the exception for each target
+        that failed; an unreadable source raises.
+        """
+        # Where each target's data is written: the target itself for delta targets, else its partial file
+        written_to = {target: target if target in delta_targets else partial_path(target) for target in targets}
+        try:
+            results = self._write_many(source, written_to, delta_targets)
+        except BaseException:
+            for target, path in written_to.items():
+                if path != target:
+                    remove_partial(path)
+            raise
+        size = os.path.getsize(source)
+        for target, result in results.items():
+            path = written_to[target]
+            if isinstance(result, Exception):
+                if path != target:
+                    remove_partial(path)
+                continue
+            try:
+                shutil.copystat(source, path)
+                if path != target:
+                    self.durability.publish(path, target, size)
+                else:
+                    self.durability.updated_in_place(target, result[1])
+            except OSError as e:
+                results[target] = e
+                if path != target:
+                    remove_partial(path)
+                continue
+            with self.lock:
+                self.method_counts[result[0]] += 1
+        return results
+
+    def _write_many(self, source, written_to, delta_targets):
+        results = {}
+        streams = []
+        with open(source, 'rb') as fsrc:
+            source_stat = os.fstat(fsrc.fileno())
+            try:
+                for target, path in written_to.items():
+                    delta = target in delta_targets
+                    try:
+                        fdst = open(path, 'r+b' if delta else 'wb')
+                    except OSError as e:
+                        results[target] = e
+                        continue
+                    streams.append((target, fdst, delta))
+                    if not delta and self.try_reflink(fsrc, fdst, source_stat.st_dev):
+                        results[target] = ('reflink', 0)
+                copying = [stream for stream in streams if stream[0] not in results]
+                if len(copying) == 1 and not copying[0][2]:
+                    target, fdst, _ = copying[0]
+                    try:
+                        results[target] = (self.copy_data(fsrc, fdst), source_stat.st_size)
+                    except OSError as e:
+                        results[target] = e
+                elif copying:
+                    results.update(self._fan_out(fsrc, copying))
+            finally:
+                for target, fdst, delta in streams:
+                    try:
+                        if not delta and not isinstance(results.get(target), Exception):
+                            self.durability.written(fdst)
+                    except OSError as e:
+                        results[target] = e
+                    try:
+                        fdst.close()
+                    except OSError as e:
+                        # Network file systems may only report write errors on close
+                        results[target] = e
+        return results
+
+    def try_reflink(self, fsrc, fdst, source_dev):
+        if not self.may_reflink(source_dev, os.fstat(fdst.fileno()).st_dev):
+            return False
+        try:
+            self._copy_reflink(fsrc.fileno(), fdst.fileno())
+            return True
+        except OSError as e:
+            if e.errno in UNSUPPORTED_ERRNOS:
+                with self.lock:
+                    self.unsupported.setdefault((source_dev, source_dev), set()).add('reflink')
+            return False
+
+    def _fan_out(self, fsrc, streams):
+        """Write each buffer read from fsrc to every stream; a failing target drops out alone"""
+        results = {}
+        written = {target: 0 for target, _, _ in streams}
+        active = list(streams)
+        offset = 0
+        while active:
+            chunk = fsrc.read(BUFFER_SIZE)
+            if not chunk:
+                break
+            for stream in list(active):
+                target, fdst, delta = stream
+                try:
+                    if delta:
+                        written[target] += self._write_changed(fdst, chunk, offset)
+                    else:
+                        fdst.write(chunk)
+                        written[target] += len(chunk)
+                except OSError as e:
+                    results[target] = e
+                    active.remove(stream)
+            offset += len(chunk)
+        for target, fdst, delta in active:
+            try:
+                if delta:
+                    fdst.truncate(offset)
+                results[target] = ('delta' if delta else 'fan_out', written[target])
+            except OSError as e:
+                results[target] = e
+        return results
+
+    def _write_changed(self, fdst, chunk, offset):
+        fdst.seek(offset)
+        existing = fdst.read(len(chunk))
+        if existing == chunk:
+            return 0
+        written = 0
+        for start in range(0, len(chunk), DELTA_BLOCK_SIZE):
+            block = chunk[start:start + DELTA_BLOCK_SIZE]
+            if block != existing[start:start + DELTA_BLOCK_SIZE]:
+                fdst.seek(offset + start)
+                fdst.write(block)
+                written += len(block)
+        return written
+
+    def may_reflink(self, source_dev, target_dev):
+        """Whether a reflink between these devices might work (not yet seen to fail)"""
+        return ('reflink' in self.methods and source_dev == target_dev and
+                'reflink' not in self.unsupported.get((source_dev, target_dev), ()))
+
+    def copy_data(self, fsrc, fdst):
+        """Copy the contents of one open file into another, trying each method in turn"""
+        key = (os.fstat(fsrc.fileno()).st_dev, os.fstat(fdst.fileno()).st_dev)
+        for method in self.methods:
+            if method in self.unsupported.get(key, ()):
+                continue
+            try:
+                getattr(self, f'_copy_{method}')(fsrc.fileno(), fdst.fileno())
+                return method
+            except UnsupportedMethod:
+                pass
+            except OSError as e:
+                if e.errno not in UNSUPPORTED_ERRNOS or method == 'buffered':
+                    raise
+            with self.lock:
+                if method not in self.unsupported.setdefault(key, set()):
+                    self.unsupported[key].add(method)
+                    logging.info(f"Copy method {method} not supported for devices {key}, falling back")
+            # Start the next method from a clean target
+            os.lseek(fsrc.fileno(), 0, os.SEEK_SET)
+            os.lseek(fdst.fileno(), 0, os.SEEK_SET)
+            os.ftruncate(fdst.fileno(), 0)
+        raise OSError(errno.ENOTSUP, "No copy method available")
+
+    def copy_range(self, fsrc, fdst, offset, length):
+        """Copy up to length bytes starting at offset between two open files; returns the bytes copied"""
+        src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+        key = (os.fstat(src_fd).st_dev, os.fstat(dst_fd).st_dev)
+        copied = 0
+        if 'copy_file_range' in self.methods and 'copy_file_range' not in self.unsupported.get(key, ()):
+            try:
+                while copied < length:
+                    count = os.copy_file_range(src_fd, dst_fd, min(CHUNK_SIZE, length - copied),
+                                               offset + copied, offset + copied)
+                    if count == 0:
+                        break
+                    copied += count
+                if copied or offset >= os.fstat(src_fd).st_size:
+                    return copied
+            except OSError as e:
+                if e.errno not in UNSUPPORTED_ERRNOS:
+                    raise
+                with self.lock:
+                    self.unsupported.setdefault(key, set()).add('copy_file_range')
+        os.lseek(src_fd, offset + copied, os.SEEK_SET)
+        os.lseek(dst_fd, offset + copied, os.SEEK_SET)
+        while copied < length:
+            chunk = os.read(src_fd, min(BUFFER_SIZE, length - copied))
+            if not chunk:
+                break
+            view = memoryview(chunk)
+            while view:
+                written = os.write(dst_fd, view)
+                view = view[written:]
+                copied += written
+        return copied
+
+    def _copy_reflink(self, src_fd, dst_fd):
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+
+    def _copy_copy_file_range(self, src_fd, dst_fd):
+        offset = 0
+        while True:
+            copied = os.copy_file_range(src_fd, dst_fd, CHUNK_SIZE, offset, offset)
+            if copied == 0:
+                break
+            offset += copied
+        # Some filesystems (procfs, some FUSE mounts) report EOF immediately
+        if offset == 0 and os.fstat(src_fd).st_size > 0:
+            raise UnsupportedMethod()
+
+    def _copy_sendfile(self, src_fd, dst_fd):
+        offset = 0
+        while True:
+            sent = os.sendfile(dst_fd, src_fd, offset, CHUNK_SIZE)
+            if sent == 0:
+                break
+            offset += sent
+        if offset == 0 and os.fstat(src_fd).st_size > 0:
+            raise UnsupportedMethod()
+
+    def _copy_buffered(self, src_fd, dst_fd):
+        while True:
+            chunk = os.read(src_fd, BUFFER_SIZE)
+            if not chunk:
+                break
+            view = memoryview(chunk)
+            while view:
+                written = os.write(dst_fd, view)
+                view = view[written:]
+
+    def snapshot_counts(self):
+        with self.lock:
+            return Counter(self.method_counts)
+
+    def summary(self, since=None):
+        """Describe how many copies used each method, optionally only since an earlier snapshot"""
+        counts = self.snapshot_counts()
+        if since:
+            counts -= since
+        return ', '.join(f"{method}={count}" for method, count in sorted(counts.items()))
@@ -0,0 +1,60 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+DEFAULT_COPY_WORKERS = min(8, (os.cpu_count() or 1) + 4)
+
+class CopyExecutor:
+    """Runs per-file operations on a bounded thread pool
+
+    Results are reported through on_result on the calling thread, in
+    completion order, so callers can update counters and progress without
+    locking. With a single worker the items are processed serially in order.
+    Given a shared pool, operations run there instead of on a private one,
+    with at most max_in_flight of them queued at a time.
+    """
+    def __init__(self, workers=DEFAULT_COPY_WORKERS, max_in_flight=None, pool=None):
+        self.workers = max(1, int(workers))
+        self.max_in_flight = max_in_flight or self.workers * 4
+        self.pool = pool
+
+    def run(self, items, operation, on_result, cancel_check=None):
+        """Apply operation to every item; returns False if cancelled before all were dispatched"""
+        if self.workers == 1:
+            for item in items:
+                if cancel_check and cancel_check():
+                    return False
+                on_result(item, operation(item))
+            return True
+
+        if self.pool:
+            return self._run_on(self.pool, items, operation, on_result, cancel_check)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='copy') as pool:
+            return self._run_on(pool, items, operation, on_result, cancel_check)
+
+    def _run_on(self, pool, items, operation, on_result, cancel_check):
+        cancelled = False
+        pending = {}
+        for item in items:
+            if cancel_check and cancel_check():
+                cancelled = True
+                break
+            pending[pool.submit(operation, item)] = item
+            if len(pending) >= self.max_in_flight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                self._report(done, pending, on_result)
+        # Let transfers that already started finish so no file is left half-written
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            self._report(done, pending, on_result)
+        return not cancelled
+
+    def _report(self, done, pending, on_result):
+        for future in done:
+            item = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                logging.error(f"Error processing {item}: {str(e)}", exc_info=True)
+                result = False
+            on_result(item, result)
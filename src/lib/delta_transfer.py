@@ -0,0 +1,50 @@
+import threading
+
+DELTA_BLOCK_SIZE = 128 * 1024
+DEFAULT_DELTA_THRESHOLD = 64 * 1024 * 1024
+
+class DeltaStats:
+    """Thread-safe totals of bytes written by delta transfers versus full file sizes"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files = 0
+        self.bytes_written = 0
+        self.bytes_total = 0
+
+    def add(self, written, total):
+        with self.lock:
+            self.files += 1
+            self.bytes_written += written
+            self.bytes_total += total
+
+    def snapshot(self):
+        with self.lock:
+            return self.files, self.bytes_written, self.bytes_total
+
+def delta_copy(source, target, block_size=DELTA_BLOCK_SIZE):
+    """Update target in place so its content matches source, writing only the blocks that differ
+
+    Both files are read block by block at the same offsets; a block is
+    written only if its bytes differ, and the target is truncated or
+    extended to the source size. This suits files that change in place
+    (VM images, databases). Inserted data shifts every following block,
+    and those blocks are then all rewritten. Returns the number of bytes
+    written.
+    """
+    written = 0
+    offset = 0
+    with open(source, 'rb', buffering=0) as fsrc, open(target, 'r+b', buffering=0) as fdst:
+        while True:
+            source_block = fsrc.read(block_size)
+            if not source_block:
+                break
+            target_block = fdst.read(len(source_block))
+            if source_block != target_block:
+                fdst.seek(offset)
+                view = memoryview(source_block)
+                while view:
+                    view = view[fdst.write(view):]
+                written += len(source_block)
+            offset += len(source_block)
+        fdst.truncate(offset)
+    return written
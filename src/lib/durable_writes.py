@@ -0,0 +1,182 @@
+import os
+import sys
+import ctypes
+import threading
+import logging
+
+# 'none' leaves flushing to the OS, 'file' flushes every copy before it is renamed
+# into place, 'batch' flushes and renames the copies of a batch together
+FSYNC_MODES = ('none', 'file', 'batch')
+DEFAULT_FSYNC_MODE = 'none'
+# A batch is committed early once this many files or bytes are waiting
+COMMIT_FILES = 1000
+COMMIT_BYTES = 512 * 1024 * 1024
+
+def fsync_path(path):
+    """Flush a file's data to disk by path (on Windows the file must be writable)"""
+    fd = os.open(path, os.O_RDWR if os.name == 'nt' else os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def load_syncfs():
+    """libc's syncfs, which flushes a whole file system in one call, or None where there is none"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        syncfs = ctypes.CDLL(None, use_errno=True).syncfs
+    except (OSError, AttributeError):
+        return None
+    syncfs.argtypes = [ctypes.c_int]
+    syncfs.restype = ctypes.c_int
+    return syncfs
+
+_syncfs = load_syncfs()
+
+def sync_filesystem(path):
+    """Flush everything written to the file system holding path; False if that is not possible"""
+    if _syncfs is None:
+        return False
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError as e:
+        logging.debug(f"Could not open {path} to flush its file system: {str(e)}")
+        return False
+    try:
+        if _syncfs(fd) != 0:
+            logging.debug(f"syncfs failed for {path}: {os.strerror(ctypes.get_errno())}")
+            return False
+        return True
+    finally:
+        os.close(fd)
+
+def fsync_directory(path):
+    """Flush a directory entry change such as a rename; a no-op where directories cannot be opened"""
+    if os.name == 'nt':
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError as e:
+        logging.warning(f"Could not open directory {path} to flush it: {str(e)}")
+        return
+    try:
+        os.fsync(fd)
+    except OSError as e:
+        # Some file systems (and some network mounts) do not support fsync on directories
+        logging.debug(f"Could not flush directory {path}: {str(e)}")
+    finally:
+        os.close(fd)
+
+class DurableWrites:
+    """Puts copies written under a temporary name into place, flushed according to the fsync mode
+
+    Copies are written to a hidden sibling of the target and renamed over
+    it, so readers never see half-written files. With 'file' or 'batch' the
+    data is on disk before the rename, so a crash cannot leave a truncated
+    file carrying the source's timestamp. In 'batch' mode renames are held
+    back until commit(); until then the old target stays in place. On
+    Linux a commit flushes each file system holding waiting files with one
+    syncfs call, renames the files, then calls syncfs again for the
+    renames, instead of an fsync per file and directory; elsewhere (or if
+    syncfs fails) the files and directories are flushed one by one.
+    Windows has no directory flush, and there 'batch' flushes each file as
+    it is written.
+    """
+    def __init__(self, mode=DEFAULT_FSYNC_MODE):
+        self.mode = mode
+        self.lock = threading.Lock()
+        # temp path -> target path (None for files updated in place), in write order
+        self.pending = {}
+        self.pending_bytes = 0
+        # (target, error) of files that could not be put into place by a commit
+        self.failures = []
+
+    def flush_each(self):
+        """Whether each written file should be flushed before it is closed"""
+        return self.mode == 'file' or (self.mode == 'batch' and os.name == 'nt')
+
+    def written(self, fdst):
+        """Called with a temporary file still open once its contents are written"""
+        if self.flush_each():
+            fdst.flush()
+            os.fsync(fdst.fileno())
+
+    def publish(self, temp, target, size=0):
+        """Rename a completed temporary file over target, now or at the next commit"""
+        if self.mode != 'batch':
+            os.replace(temp, target)
+            if self.mode == 'file':
+                fsync_directory(os.path.dirname(target))
+            return
+        self._defer(temp, target, size)
+
+    def updated_in_place(self, path, size=0):
+        """Called after a file was modified in place (delta transfers) to flush it like a copy"""
+        if self.flush_each():
+            fsync_path(path)
+        elif self.mode == 'batch':
+            self._defer(path, None, size)
+
+    def _defer(self, path, target, size):
+        with self.lock:
+            self.pending[path] = target
+            self.pending_bytes += size
+            due = len(self.pending) >= COMMIT_FILES or self.pending_bytes >= COMMIT_BYTES
+        if due:
+            self.commit()
+
+    def commit(self):
+        """Flush and rename every waiting file, then flush their directories; returns the number committed"""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.pending_bytes = 0
+        if not pending:
+            return 0
+        flushed_devices = self._sync_filesystems(pending) if os.name != 'nt' else set()
+        directories = set()
+        committed = 0
+        for path, target in pending.items():
+            try:
+                if os.name != 'nt' and os.stat(path).st_dev not in flushed_devices:
+                    fsync_path(path)
+                if target is not None:
+                    os.replace(path, target)
+                    directories.add(os.path.dirname(target))
+                committed += 1
+            except OSError as e:
+                with self.lock:
+                    self.failures.append((target or path, e))
+        # The renames of each file system flushed as a whole are flushed the same way
+        by_device = {}
+        for directory in directories:
+            try:
+                by_device.setdefault(os.stat(directory).st_dev, []).append(directory)
+            except OSError:
+                continue
+        for device, device_directories in by_device.items():
+            if device in flushed_devices and sync_filesystem(device_directories[0]):
+                continue
+            for directory in device_directories:
+                fsync_directory(directory)
+        logging.debug(f"Committed {committed} written files in {len(directories)} directories "
+                      f"({len(flushed_devices)} file systems flushed whole)")
+        return committed
+
+    def _sync_filesystems(self, pending):
+        """Flush each file system holding pending files with one syncfs call; returns the devices flushed"""
+        if _syncfs is None:
+            return set()
+        paths_by_device = {}
+        for path in pending:
+            try:
+                paths_by_device.setdefault(os.stat(path).st_dev, path)
+            except OSError:
+                # Reported when the file itself is flushed and renamed
+                continue
+        return {device for device, path in paths_by_device.items() if sync_filesystem(path)}
+
+    def take_failures(self):
+        with self.lock:
+            failures, self.failures = self.failures, []
+        return failures
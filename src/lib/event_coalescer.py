@@ -0,0 +1,263 @@
+import os
+import time
+import threading
+import logging
+from collections import namedtuple
+
+# kind is 'created', 'modified', 'deleted' or 'moved' for files and 'dir_created',
+# 'dir_deleted' or 'dir_moved' for whole directories; src_path is only set for moves
+Change = namedtuple('Change', ['kind', 'path', 'src_path'])
+
+DIR_KINDS = ('dir_created', 'dir_deleted', 'dir_moved')
+
+DEFAULT_QUIET_PERIOD = 1.0
+DEFAULT_MAX_DELAY = 5.0
+
+class _Pending:
+    __slots__ = ('kind', 'src_path', 'modified', 'first_seen', 'last_seen')
+
+    def __init__(self, kind, src_path, now):
+        self.kind = kind
+        self.src_path = src_path
+        self.modified = False
+        self.first_seen = now
+        self.last_seen = now
+
+class EventCoalescer:
+    """Collapses bursts of file events per path and flushes them in batches on a trailing edge
+
+    A path is flushed once no event has arrived for it during quiet_period,
+    or once max_delay has passed since its first event, so the last write of
+    a burst is never dropped. create->modify->modify becomes a single create,
+    create->delete cancels out, and flushed paths are removed from the queue.
+    Directory changes absorb the file changes below them: events inside a
+    created directory are left to its subtree scan, events inside a deleted
+    one are dropped, and pending paths inside a moved one are re-rooted at
+    the new location. flush_callback receives a list of Change tuples on the
+    coalescer thread.
+    """
+    def __init__(self, flush_callback, quiet_period=DEFAULT_QUIET_PERIOD, max_delay=DEFAULT_MAX_DELAY):
+        self.flush_callback = flush_callback
+        self.quiet_period = quiet_period
+        self.max_delay = max(max_delay, quiet_period)
+        self.pending = {}
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self._run, name='event-coalescer', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the flush thread, delivering whatever is still pending"""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def add(self, kind, rel_path, src_path=None):
+        now = time.monotonic()
+        with self.condition:
+            was_empty = not self.pending
+            if kind == 'moved':
+                self._add_move(src_path, rel_path, now)
+            elif kind == 'dir_moved':
+                self._add_dir_move(src_path, rel_path, now)
+            elif kind == 'dir_deleted':
+                self._add_dir_delete(rel_path, now)
+            elif kind == 'dir_created':
+                self._add_dir_create(rel_path, now)
+            elif not self._covered(rel_path, kind, now):
+                self._merge(rel_path, kind, now)
+            if was_empty:
+                self.condition.notify()
+
+    def _merge(self, rel_path, kind, now):
+        entry = self.pending.get(rel_path)
+        if entry is None:
+            self.pending[rel_path] = _Pending(kind, None, now)
+            return
+        entry.last_seen = now
+        if kind == 'deleted':
+            if entry.kind == 'created':
+                # Created and deleted within the window: nothing to do
+                del self.pending[rel_path]
+            elif entry.kind == 'moved':
+                # The moved file is gone again, so only the old path needs removing
+                del self.pending[rel_path]
+                self._merge(entry.src_path, 'deleted', now)
+            else:
+                entry.kind = 'deleted'
+        elif entry.kind == 'deleted':
+            # Deleted and recreated: the target copy must be replaced
+            entry.kind = 'modified'
+        elif entry.kind == 'moved':
+            entry.modified = True
+
+    def _pending_ancestor(self, rel_path):
+        parent = os.path.dirname(rel_path)
+        while parent:
+            entry = self.pending.get(parent)
+            if entry is not None and entry.kind in DIR_KINDS:
+                return parent, entry
+            parent = os.path.dirname(parent)
+        return None, None
+        
+    def _covered(self, rel_path, kind, now):
+        """Whether a pending directory change already accounts for a file event"""
+        parent, entry = self._pending_ancestor(rel_path)
+        if entry is None or entry.kind == 'dir_moved':
+            return False
+        entry.last_seen = now
+        if entry.kind == 'dir_deleted' and kind != 'deleted':
+            # The directory came back; reconcile it as a whole
+            entry.kind = 'dir_created'
+            entry.modified = True
+        return True
+        
+    def _absorb_descendants(self, rel_dir, now):
+        """Drop pending changes below rel_dir, keeping the deletion of paths moved in from elsewhere"""
+        prefix = rel_dir + os.sep
+        for path in [path for path in self.pending if path.startswith(prefix)]:
+            entry = self.pending.pop(path, None)
+            if entry is None or entry.kind not in ('moved', 'dir_moved') or entry.src_path.startswith(prefix):
+                continue
+            if entry.kind == 'moved':
+                if not self._covered(entry.src_path, 'deleted', now):
+                    self._merge(entry.src_path, 'deleted', now)
+            else:
+                self._add_dir_delete(entry.src_path, now)
+                    
+    def _add_dir_create(self, rel_dir, now):
+        if self._covered(rel_dir, 'created', now):
+            return
+        self._absorb_descendants(rel_dir, now)
+        entry = self.pending.get(rel_dir)
+        if entry is not None and entry.kind in ('dir_created', 'dir_moved'):
+            entry.last_seen = now
+            return
+        created = _Pending('dir_created', None, now)
+        # For directories, modified marks one that may already exist on the target
+        created.modified = entry is not None
+        self.pending[rel_dir] = created
+        
+    def _add_dir_delete(self, rel_dir, now):
+        if self._covered(rel_dir, 'deleted', now):
+            return
+        self._absorb_descendants(rel_dir, now)
+        entry = self.pending.pop(rel_dir, None)
+        if entry is not None and entry.kind == 'dir_created' and not entry.modified:
+            # Created and deleted within the window
+            return
+        if entry is not None and entry.kind == 'dir_moved':
+            # The target still has the directory under its old name
+            previous = self.pending.get(entry.src_path)
+            if previous is None:
+                self.pending[entry.src_path] = _Pending('dir_deleted', None, now)
+            elif previous.kind == 'dir_created':
+                previous.modified = True
+            return
+        self.pending[rel_dir] = _Pending('dir_deleted', None, now)
+        
+    def _add_dir_move(self, src_dir, dest_dir, now):
+        if self._covered(dest_dir, 'created', now):
+            self._add_dir_delete(src_dir, now)
+            return
+        if self._covered(src_dir, 'deleted', now):
+            self._add_dir_create(dest_dir, now)
+            return
+        previous = self.pending.pop(src_dir, None)
+        if previous is not None and previous.kind == 'dir_created' and not previous.modified:
+            # Never reached the target under its old name
+            self._absorb_descendants(src_dir, now)
+            self._add_dir_create(dest_dir, now)
+            return
+        origin = previous.src_path if previous is not None and previous.kind == 'dir_moved' else src_dir
+        # Whatever was pending at the destination is superseded by the moved directory
+        self._absorb_descendants(dest_dir, now)
+        self.pending.pop(dest_dir, None)
+        
+        # Pending paths inside the directory now live under dest_dir. They must
+        # not be flushed ahead of the rename, so their timers restart with it.
+        prefix = src_dir + os.sep
+        for path in [path for path in self.pending if path.startswith(prefix)]:
+            entry = self.pending.pop(path)
+            entry.first_seen = entry.last_seen = now
+            self.pending[dest_dir + path[len(src_dir):]] = entry
+        for entry in self.pending.values():
+            if entry.src_path and entry.src_path.startswith(prefix):
+                entry.src_path = dest_dir + entry.src_path[len(src_dir):]
+                entry.first_seen = entry.last_seen = now
+        self.pending[dest_dir] = _Pending('dir_moved', origin, now)
+        
+    def _add_move(self, src_path, dest_path, now):
+        parent, ancestor = self._pending_ancestor(dest_path)
+        if ancestor is not None and ancestor.kind == 'dir_moved':
+            if src_path == ancestor.src_path + dest_path[len(parent):]:
+                # Per-file echo of a directory rename that is already pending
+                return
+        elif ancestor is not None:
+            # Landed inside a directory that will be reconciled as a whole
+            self._covered(dest_path, 'created', now)
+            if not self._covered(src_path, 'deleted', now):
+                self._merge(src_path, 'deleted', now)
+            return
+        if self._covered(src_path, 'deleted', now):
+            # Moved out of a directory that is reconciled as a whole
+            self._merge(dest_path, 'created', now)
+            return
+        previous = self.pending.pop(src_path, None)
+        if previous is not None and previous.kind == 'created':
+            # Never reached the target under its old name
+            self._merge(dest_path, 'created', now)
+            return
+        if previous is not None and previous.kind == 'moved':
+            # Chained rename a -> b -> c is a single rename a -> c
+            src_path, modified = previous.src_path, previous.modified
+        else:
+            modified = previous is not None and previous.kind == 'modified'
+        self.pending.pop(dest_path, None)
+        entry = _Pending('moved', src_path, now)
+        entry.modified = modified
+        self.pending[dest_path] = entry
+
+    def _take_due(self, now, flush_all):
+        due = [path for path, entry in self.pending.items()
+               if flush_all or now - entry.last_seen >= self.quiet_period
+               or now - entry.first_seen >= self.max_delay]
+        changes = []
+        for path in due:
+            entry = self.pending.pop(path)
+            changes.append(Change(entry.kind, path, entry.src_path))
+            if entry.kind == 'moved' and entry.modified:
+                changes.append(Change('modified', path, None))
+        return changes
+
+    def _next_deadline(self, now):
+        if not self.pending:
+            return None
+        return max(0.0, min(min(entry.last_seen + self.quiet_period, entry.first_seen + self.max_delay)
+                            for entry in self.pending.values()) - now)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                running = self.running
+                changes = self._take_due(time.monotonic(), flush_all=not running)
+                if not changes and running:
+                    self.condition.wait(self._next_deadline(time.monotonic()))
+                    continue
+            if changes:
+                try:
+                    self.flush_callback(changes)
+                except Exception as e:
+                    logging.error(f"Error processing batch of {len(changes)} changes: {str(e)}", exc_info=True)
+            if not running:
+                return
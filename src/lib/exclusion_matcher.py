@@ -0,0 +1,197 @@
+import os
+import re
+import logging
+from collections import namedtuple
+
+# Files the syncer writes into targets itself (partial copies, see copy_backend.PARTIAL_SUFFIX);
+# never synced and never deleted as extraneous
+INTERNAL_PATTERNS = ('.*.syncer-part',)
+
+# Immutable view of the exclusion rules for one source folder, swapped as a whole when they change
+ExclusionSnapshot = namedtuple('ExclusionSnapshot',
+                               ['source_folder', 'gitignore_patterns', 'additional_patterns', 'matcher'])
+
+def translate_glob(pattern):
+    """Translate a gitignore glob (without '!' or trailing '/') into a regex body"""
+    result = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if pattern[i:i + 2] == '**' and (i == 0 or pattern[i - 1] == '/'):
+                if pattern[i + 2:i + 3] == '/':
+                    # Leading '**/' or middle '/**/' matches zero or more directories
+                    result.append('(?:.*/)?')
+                    i += 3
+                    continue
+                if i + 2 == n:
+                    # Trailing '/**' matches everything inside
+                    result.append('.*')
+                    i += 2
+                    continue
+            while pattern[i:i + 1] == '*':
+                i += 1
+            result.append('[^/]*')
+            continue
+        elif c == '?':
+            result.append('[^/]')
+        elif c == '[':
+            j = i + 1
+            if pattern[j:j + 1] in ('!', '^'):
+                j += 1
+            if pattern[j:j + 1] == ']':
+                j += 1
+            while j < n and pattern[j] != ']':
+                j += 1
+            if j >= n:
+                result.append('\\[')
+            else:
+                body = pattern[i + 1:j].replace('\\', '\\\\')
+                if body[:1] in ('!', '^'):
+                    body = '^' + body[1:]
+                result.append(f'[{body}]')
+                i = j
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            result.append(re.escape(pattern[i]))
+        else:
+            result.append(re.escape(c))
+        i += 1
+    return ''.join(result)
+
+def parse_gitignore_line(line):
+    """Parse one gitignore line into (regex, negated, dir_only), or None for blanks/comments"""
+    line = line.rstrip('\n').rstrip('\r')
+    if not line or line.startswith('#'):
+        return None
+    # Trailing spaces are ignored unless escaped with a backslash
+    stripped = line.rstrip(' ')
+    if stripped.endswith('\\') and len(stripped) < len(line):
+        stripped += ' '
+    line = stripped
+    if not line:
+        return None
+    negated = line.startswith('!')
+    if negated:
+        line = line[1:]
+    elif line.startswith('\\!') or line.startswith('\\#'):
+        line = line[1:]
+    dir_only = line.endswith('/')
+    line = line.rstrip('/')
+    if not line:
+        return None
+    # A slash anywhere but the end anchors the pattern to the .gitignore directory
+    if '/' in line:
+        body = translate_glob(line.lstrip('/'))
+    else:
+        body = '(?:.*/)?' + translate_glob(line)
+    return body, negated, dir_only
+
+class RuleSet:
+    """Rules from one source (a .gitignore file or the exclusions box), compiled into combined regexes"""
+    def __init__(self, lines):
+        self.rules = [rule for rule in (parse_gitignore_line(line) for line in lines) if rule]
+        self.has_negation = any(negated for _, negated, _ in self.rules)
+        self.file_regex, self.file_negated = self._compile([r for r in self.rules if not r[2]])
+        self.dir_regex, self.dir_negated = self._compile(self.rules)
+
+    def _compile(self, rules):
+        if not rules:
+            return None, ()
+        if not self.has_negation:
+            return re.compile('(?:' + '|'.join(body for body, _, _ in rules) + ')', re.DOTALL), ()
+        # Alternatives are ordered last rule first, so the first alternative that
+        # matches is the rule that decides, and lastindex tells us which one it was
+        ordered = list(reversed(rules))
+        regex = re.compile('|'.join(f'({body})' for body, _, _ in ordered), re.DOTALL)
+        return regex, tuple(negated for _, negated, _ in ordered)
+
+    def match(self, rel_path, is_dir):
+        """Return True (excluded), False (re-included) or None (no rule applies)"""
+        regex, negated = (self.dir_regex, self.dir_negated) if is_dir else (self.file_regex, self.file_negated)
+        if regex is None:
+            return None
+        m = regex.fullmatch(rel_path)
+        if m is None:
+            return None
+        if not negated:
+            return True
+        return not negated[m.lastindex - 1]
+
+    def __bool__(self):
+        return bool(self.rules)
+
+class ExclusionMatcher:
+    """gitignore-style exclusion matcher with nested .gitignore files and per-directory memoization
+
+    Paths are relative to root. Nested .gitignore files are read lazily from
+    root the first time a directory is evaluated. Additional patterns use the
+    same syntax and take precedence over every .gitignore file.
+    """
+    def __init__(self, root, gitignore_patterns=None, additional_patterns=(), read_nested=True):
+        self.root = root
+        self.read_nested = read_nested
+        # Internal patterns come last so they take precedence over user negations
+        self.additional = RuleSet(list(additional_patterns) + list(INTERNAL_PATTERNS))
+        if gitignore_patterns is None:
+            gitignore_patterns = self._read_rules('')
+        self.root_rules = RuleSet(gitignore_patterns)
+        self._rulesets = {}
+        self._dir_cache = {}
+
+    def _read_rules(self, rel_dir):
+        path = os.path.join(self.root, rel_dir, '.gitignore')
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                return f.readlines()
+        except FileNotFoundError:
+            return []
+        except OSError as e:
+            logging.warning(f"Could not read {path}: {str(e)}")
+            return []
+
+    def rulesets_for(self, rel_dir):
+        """Rule sets applying inside rel_dir as (prefix length, RuleSet), highest precedence first"""
+        cached = self._rulesets.get(rel_dir)
+        if cached is not None:
+            return cached
+        if rel_dir:
+            parent = self.rulesets_for(rel_dir.rpartition('/')[0])
+            if self.additional:
+                parent = parent[1:]
+            own = RuleSet(self._read_rules(rel_dir)) if self.read_nested else None
+            chain = (((len(rel_dir) + 1, own),) if own else ()) + parent
+        else:
+            chain = ((0, self.root_rules),) if self.root_rules else ()
+        result = (((0, self.additional),) if self.additional else ()) + chain
+        self._rulesets[rel_dir] = result
+        return result
+
+    def _match(self, rel_path, parent, is_dir):
+        for prefix_len, ruleset in self.rulesets_for(parent):
+            decision = ruleset.match(rel_path[prefix_len:], is_dir)
+            if decision is not None:
+                return decision
+        return False
+
+    def is_dir_excluded(self, rel_dir):
+        rel_dir = rel_dir.replace(os.sep, '/') if os.sep != '/' else rel_dir
+        if not rel_dir or rel_dir == '.':
+            return False
+        cached = self._dir_cache.get(rel_dir)
+        if cached is not None:
+            return cached
+        parent = rel_dir.rpartition('/')[0]
+        # Nothing inside an excluded directory can be re-included
+        result = bool(parent and self.is_dir_excluded(parent)) or self._match(rel_dir, parent, True)
+        self._dir_cache[rel_dir] = result
+        return result
+
+    def is_excluded(self, rel_path, is_dir=False):
+        if is_dir:
+            return self.is_dir_excluded(rel_path)
+        rel_path = rel_path.replace(os.sep, '/') if os.sep != '/' else rel_path
+        parent = rel_path.rpartition('/')[0]
+        if parent and self.is_dir_excluded(parent):
+            return True
+        return self._match(rel_path, parent, False)
@@ -1,41 +1,204 @@
 from watchdog.observers import Observer
+from watchdog.observers.api import BaseObserver
 from watchdog.events import FileSystemEventHandler
 import os
-import time
+import inspect
 import logging
+import threading
+import time
+import weakref
+from lib.event_coalescer import EventCoalescer, Change, DEFAULT_QUIET_PERIOD, DEFAULT_MAX_DELAY
+from lib.auto_sync_pool import AutoSyncPool, DEFAULT_AUTO_SYNC_WORKERS
+from lib.reconciler import Reconciler, DEFAULT_RECONCILE_INTERVAL, DEFAULT_RECONCILE_IDLE
+from lib.polling_observer import (AdaptivePollingObserver, is_network_filesystem, DEFAULT_POLL_MIN_INTERVAL,
+                                  DEFAULT_POLL_MAX_INTERVAL, DEFAULT_POLL_OPS_PER_SECOND)
+
+def read_max_queued_events():
+    """Per-instance inotify queue length; events beyond it are dropped by the kernel"""
+    try:
+        with open('/proc/sys/fs/inotify/max_queued_events') as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return 16384
+
+try:
+    from watchdog.observers.inotify import InotifyEmitter
+    from watchdog.observers.inotify_buffer import InotifyBuffer
+    from watchdog.observers.inotify_c import Inotify, InotifyConstants, inotify_rm_watch
+except Exception:
+    # watchdog's inotify backend only loads on Linux
+    InotifyEmitter = None
+
+def supports_directory_emitter():
+    """Whether the installed watchdog has what DirectoryEmitter builds on (event masks came in watchdog 4.0)"""
+    if InotifyEmitter is None:
+        return False
+    try:
+        buffer_parameters = inspect.signature(InotifyBuffer.__init__).parameters
+    except (TypeError, ValueError):
+        return False
+    return (hasattr(InotifyEmitter, 'get_event_mask_from_filter') and 'event_mask' in buffer_parameters and
+            hasattr(Inotify, 'add_watch') and hasattr(Inotify, '_raise_error') and
+            hasattr(Inotify, '_parse_event_buffer'))
+
+if supports_directory_emitter():
+    # Reader thread of each DirectoryEmitter's inotify buffer -> the emitter
+    overflow_emitters = weakref.WeakKeyDictionary()
+    parse_event_buffer = Inotify._parse_event_buffer
+    
+    def parse_event_buffer_noting_overflow(event_buffer):
+        """Inotify._parse_event_buffer, also passing the kernel's queue-overflow notice to a DirectoryEmitter
+        
+        watchdog skips that notice (it has no watch descriptor) while reading
+        events. The buffer is parsed on the reader thread of one emitter's
+        inotify instance, which tells which emitter overflowed; other
+        emitters are left as they were.
+        """
+        for event in parse_event_buffer(event_buffer):
+            if event[0] == -1 and event[1] & InotifyConstants.IN_Q_OVERFLOW:
+                emitter = overflow_emitters.get(threading.current_thread())
+                if emitter is not None:
+                    emitter.queue_overflowed()
+            yield event
+    Inotify._parse_event_buffer = staticmethod(parse_event_buffer_noting_overflow)
+    
+    class DirectoryEmitter(InotifyEmitter):
+        """An inotify emitter that can watch more directories on its one inotify instance
+        
+        Scheduled non-recursively on a folder it watches only that folder
+        until add_directory() adds others, each as one more watch descriptor
+        on the same file descriptor. Linux allows 128 inotify instances per
+        user by default, so an emitter per directory stops working at about
+        a hundred directories. Scheduled recursively it behaves like
+        watchdog's own emitter.
+        """
+        def __init__(self, event_queue, watch, *args, **kwargs):
+            super().__init__(event_queue, watch, *args, **kwargs)
+            # Opened here instead of on the emitter thread, so directories can be added right after scheduling
+            self._inotify = InotifyBuffer(os.fsencode(watch.path), recursive=watch.is_recursive,
+                                          event_mask=self.get_event_mask_from_filter())
+            self.directory_lock = threading.Lock()
+            # Monitors sharing the emitter may add the same directory
+            self.directory_counts = {}
+            self.overflow_callbacks = []
+            overflow_emitters[self._inotify] = self
+            
+        def on_thread_start(self):
+            pass
+            
+        def add_overflow_callback(self, callback):
+            with self.directory_lock:
+                self.overflow_callbacks.append(callback)
+                
+        def remove_overflow_callback(self, callback):
+            with self.directory_lock:
+                if callback in self.overflow_callbacks:
+                    self.overflow_callbacks.remove(callback)
+                    
+        def queue_overflowed(self):
+            """Called on the reader thread when the kernel dropped events of this inotify instance"""
+            logging.warning(f"The inotify event queue for {self.watch.path} overflowed, events were dropped")
+            with self.directory_lock:
+                callbacks = list(self.overflow_callbacks)
+            for callback in callbacks:
+                callback()
+            
+        def add_directory(self, path):
+            path = os.fsencode(path)
+            with self.directory_lock:
+                count = self.directory_counts.get(path, 0)
+                if count == 0:
+                    self._inotify._inotify.add_watch(path)
+                self.directory_counts[path] = count + 1
+                
+        def remove_directory(self, path):
+            """Stop watching path once every monitor that added it removed it; raises KeyError if already gone"""
+            path = os.fsencode(path)
+            with self.directory_lock:
+                count = self.directory_counts.pop(path, 0) - 1
+                if count > 0:
+                    self.directory_counts[path] = count
+                    return
+                if path == os.fsencode(self.watch.path):
+                    # The folder itself stays watched until the emitter stops
+                    return
+                inotify = self._inotify._inotify
+                # Inotify.remove_watch forgets the path before the kernel's IN_IGNORED arrives, which then
+                # fails the reader thread; removing only the kernel watch lets IN_IGNORED clean up instead
+                with inotify._lock:
+                    wd = inotify._wd_for_path[path]
+                    if inotify_rm_watch(inotify.fd, wd) == -1:
+                        inotify._raise_error()
+                
+    class DirectoryObserver(BaseObserver):
+        """Observer whose watches can be extended directory by directory on a single inotify instance"""
+        def __init__(self, timeout=1.0):
+            super().__init__(DirectoryEmitter, timeout=timeout)
+else:
+    # Older watchdog versions keep the recursive watch
+    DirectoryObserver = None
+
+class SharedObserver(DirectoryObserver or Observer):
+    """An observer several monitors schedule their watches on
+    
+    Two monitors can watch the same directory, in which case watchdog hands
+    both the same watch, so a watch is only removed once its last handler
+    is released.
+    """
+    def release(self, event_handler, watch):
+        with self._lock:
+            handlers = self._handlers.get(watch)
+            if handlers:
+                handlers.discard(event_handler)
+                if handlers:
+                    return
+            self.unschedule(watch)
 
 class FolderChangeHandler(FileSystemEventHandler):
-    def __init__(self, app, source_folder):
+    def __init__(self, app, source_folder, coalescer, monitor=None):
         self.app = app
         self.source_folder = source_folder
-        self.cooldown = {}
-        self.cooldown_time = 1  # seconds
+        self.coalescer = coalescer
+        self.monitor = monitor
+        
+    def check_gitignore(self, *paths):
+        """Recompile the exclusion rules when a .gitignore file changes"""
+        if self.app.sync_engine and any(os.path.basename(path) == '.gitignore' for path in paths):
+            logging.info("A .gitignore file changed, recompiling exclusion rules")
+            self.app.sync_engine.refresh_exclusions()
+            if self.monitor:
+                self.monitor.refresh_watches()
         
     def on_moved(self, event):
         """Called when a file or directory is moved or renamed"""
-        if event.is_directory:
-            return
-            
         try:
+            if self.monitor:
+                self.monitor.note_event(event.src_path)
+            # A moved directory becomes a single rename on the target
+            prefix = 'dir_' if event.is_directory else ''
+            if event.is_directory and self.monitor:
+                self.monitor.unwatch_tree(event.src_path)
+                self.monitor.watch_tree(event.dest_path)
+            self.check_gitignore(event.src_path, event.dest_path)
+            
             # Get relative paths for both source and destination
             src_rel_path = os.path.relpath(event.src_path, self.source_folder)
             dest_rel_path = os.path.relpath(event.dest_path, self.source_folder)
             
-            # Check cooldown
-            current_time = time.time()
-            if src_rel_path in self.cooldown and current_time - self.cooldown[src_rel_path] < self.cooldown_time:
-                return
-            self.cooldown[src_rel_path] = current_time
-            
-            # Check if either path should be excluded
-            if self.app.sync_engine and self.app.sync_engine.should_exclude_file(event.src_path):
+            # Check which of the two paths are excluded
+            sync_engine = self.app.sync_engine
+            src_excluded = sync_engine and sync_engine.should_exclude_file(event.src_path, event.is_directory)
+            dest_excluded = sync_engine and sync_engine.should_exclude_file(event.dest_path, event.is_directory)
+            if src_excluded and dest_excluded:
                 self.app.log_message(f"Ignored rename: {src_rel_path} (matches exclusion pattern)", 'ignored')
                 return
-                
-            # Handle the rename by deleting the old file and copying the new one
-            self.app.log_message(f"File renamed: {src_rel_path} → {dest_rel_path}", 'changed')
-            self.app.handle_file_deletion(src_rel_path)
-            self.app.handle_file_change(dest_rel_path, 'created')
+            if src_excluded:
+                # Moved out of an excluded location: it is new as far as the target is concerned
+                self.coalescer.add(prefix + 'created', dest_rel_path)
+            elif dest_excluded:
+                self.coalescer.add(prefix + 'deleted', src_rel_path)
+            else:
+                self.coalescer.add(prefix + 'moved', dest_rel_path, src_rel_path)
             
         except Exception as e:
             self.app.log_message(f"Error handling rename: {str(e)}", 'error')
@@ -43,25 +206,22 @@ class FolderChangeHandler(FileSystemEventHandler):
     
     def on_created(self, event):
         """Called when a file or directory is created"""
-        if event.is_directory:
-            return
-            
         try:
+            if self.monitor:
+                self.monitor.note_event(event.src_path)
+            if event.is_directory and self.monitor:
+                self.monitor.watch_tree(event.src_path)
+            self.check_gitignore(event.src_path)
             rel_path = os.path.relpath(event.src_path, self.source_folder)
             
-            # Check cooldown
-            current_time = time.time()
-            if rel_path in self.cooldown and current_time - self.cooldown[rel_path] < self.cooldown_time:
-                return
-            self.cooldown[rel_path] = current_time
-            
             # Check if file should be ignored
-            if self.app.sync_engine and self.app.sync_engine.should_exclude_file(event.src_path):
+            if self.app.sync_engine and self.app.sync_engine.should_exclude_file(event.src_path, event.is_directory):
                 self.app.log_message(f"Ignored new file: {rel_path} (matches exclusion pattern)", 'ignored')
                 return
                 
-            self.app.log_message(f"New file detected: {rel_path}", 'new_file')
-            self.app.handle_file_change(rel_path, 'created')
+            # A new directory is synced with one scan of its subtree, which also
+            # covers files written into it before its watch was in place
+            self.coalescer.add('dir_created' if event.is_directory else 'created', rel_path)
             
         except Exception as e:
             self.app.log_message(f"Error handling new file: {str(e)}", 'error')
@@ -73,47 +233,38 @@ class FolderChangeHandler(FileSystemEventHandler):
             return
             
         try:
+            if self.monitor:
+                self.monitor.note_event(event.src_path)
+            self.check_gitignore(event.src_path)
             rel_path = os.path.relpath(event.src_path, self.source_folder)
             
-            # Check cooldown
-            current_time = time.time()
-            if rel_path in self.cooldown and current_time - self.cooldown[rel_path] < self.cooldown_time:
-                return
-            self.cooldown[rel_path] = current_time
-            
             # Check if file should be ignored
             if self.app.sync_engine and self.app.sync_engine.should_exclude_file(event.src_path):
                 self.app.log_message(f"Ignored change: {rel_path} (matches exclusion pattern)", 'ignored')
                 return
                 
-            self.app.log_message(f"File changed: {rel_path}", 'changed')
-            self.app.handle_file_change(rel_path, 'modified')
+            self.coalescer.add('modified', rel_path)
             
         except Exception as e:
             self.app.log_message(f"Error handling change: {str(e)}", 'error')
             logging.error(f"Error handling change: {str(e)}", exc_info=True)
     
     def on_deleted(self, event):
-        """Called when a file is deleted"""
-        if event.is_directory:
-            return
-            
+        """Called when a file or directory is deleted"""
         try:
+            if self.monitor:
+                self.monitor.note_event(event.src_path)
+            if event.is_directory and self.monitor:
+                self.monitor.unwatch_tree(event.src_path)
+            self.check_gitignore(event.src_path)
             rel_path = os.path.relpath(event.src_path, self.source_folder)
             
-            # Check cooldown
-            current_time = time.time()
-            if rel_path in self.cooldown and current_time - self.cooldown[rel_path] < self.cooldown_time:
-                return
-            self.cooldown[rel_path] = current_time
-            
             # Check if file should be ignored
-            if self.app.sync_engine and self.app.sync_engine.should_exclude_file(event.src_path):
+            if self.app.sync_engine and self.app.sync_engine.should_exclude_file(event.src_path, event.is_directory):
                 self.app.log_message(f"Ignored deletion: {rel_path} (matches exclusion pattern)", 'ignored')
                 return
                 
-            self.app.log_message(f"File deleted: {rel_path}", 'deleted')
-            self.app.handle_file_deletion(rel_path)
+            self.coalescer.add('dir_deleted' if event.is_directory else 'deleted', rel_path)
             
         except Exception as e:
             self.app.log_message(f"Error handling deletion: {str(e)}", 'error')
@@ -123,20 +274,370 @@ class FileMonitor:
     def __init__(self, app):
         self.app = app
         self.observer = None
+        # Set by the scheduler so many monitors use one observer thread
+        self.shared_observer = None
+        self.root_watch = None
         self.event_handler = None
+        self.coalescer = None
+        self.sync_pool = None
+        self.quiet_period = DEFAULT_QUIET_PERIOD
+        self.max_delay = DEFAULT_MAX_DELAY
+        self.auto_sync_workers = DEFAULT_AUTO_SYNC_WORKERS
+        # inotify needs one watch per directory, so on Linux only non-excluded directories are watched,
+        # all of them through one inotify instance
+        self.per_directory_watches = DirectoryObserver is not None
+        # The emitter holding the per-directory watches
+        self.directory_emitter = None
+        # 'auto' polls network and FUSE mounts and uses native notification elsewhere
+        self.monitor_mode = 'auto'
+        self.watch_mode = None
+        self.poll_min_interval = DEFAULT_POLL_MIN_INTERVAL
+        self.poll_max_interval = DEFAULT_POLL_MAX_INTERVAL
+        self.poll_ops_per_second = DEFAULT_POLL_OPS_PER_SECOND
+        self.folder = None
+        self.watches = {}
+        self.unwatchable = {}
+        self.watch_lock = threading.Lock()
+        self.reconciler = None
+        self.reconcile_interval = DEFAULT_RECONCILE_INTERVAL
+        self.reconcile_idle = DEFAULT_RECONCILE_IDLE
+        # Raw events within the current second, used to spot kernel queue overflows
+        self.overflow_threshold = read_max_queued_events() // 2
+        self.burst_count = 0
+        self.burst_start = 0.0
+        self.last_event_time = 0.0
+        
+    def configure(self, settings):
+        """Apply event debouncing options from the saved configuration"""
+        self.quiet_period = float(settings.get('debounce_quiet_period', DEFAULT_QUIET_PERIOD))
+        self.max_delay = float(settings.get('debounce_max_delay', DEFAULT_MAX_DELAY))
+        self.auto_sync_workers = int(settings.get('auto_sync_workers', DEFAULT_AUTO_SYNC_WORKERS))
+        self.per_directory_watches = bool(settings.get('per_directory_watches', self.per_directory_watches))
+        self.reconcile_interval = float(settings.get('reconcile_interval', DEFAULT_RECONCILE_INTERVAL))
+        self.reconcile_idle = float(settings.get('reconcile_idle', DEFAULT_RECONCILE_IDLE))
+        self.monitor_mode = settings.get('monitor_mode', 'auto')
+        self.poll_min_interval = float(settings.get('poll_min_interval', DEFAULT_POLL_MIN_INTERVAL))
+        self.poll_max_interval = float(settings.get('poll_max_interval', DEFAULT_POLL_MAX_INTERVAL))
+        self.poll_ops_per_second = int(settings.get('poll_ops_per_second', DEFAULT_POLL_OPS_PER_SECOND))
         
-    def start(self, folder):
+    def get_stats(self):
+        """Queue depth, latency and watch counts of the monitor, or None when not monitoring"""
+        if not self.sync_pool:
+            return None
+        stats = self.sync_pool.stats()
+        with self.watch_lock:
+            stats['watches'] = len(self.watches)
+            stats['unwatchable'] = sorted(self.unwatchable)
+        stats.update(self.reconciler.stats() if self.reconciler else {'dirty': 0, 'reconciled': 0})
+        stats['watch_mode'] = self.watch_mode
+        if self.watch_mode == 'polling' and self.observer:
+            stats['polling'] = self.observer.stats()
+        return stats
+        
+    def note_event(self, path):
+        """Count raw events and flag bursts that may have overflowed the kernel queue
+        
+        Every watch of a monitor, recursive or per directory, sits on one
+        inotify instance with a single queue, so a burst spread over many
+        directories overflows it as easily as one in a single directory, and
+        the whole folder is suspect. In per-directory mode the kernel's own
+        overflow notice also reaches queue_overflowed; this count covers
+        watchdog's recursive emitter, which drops that notice.
+        """
+        now = time.monotonic()
+        self.last_event_time = now
+        if now - self.burst_start >= 1.0:
+            self.burst_start = now
+            self.burst_count = 0
+        if self.watch_mode == 'polling':
+            # Polling loses nothing, it only reports late
+            return
+        self.burst_count += 1
+        if self.burst_count == self.overflow_threshold and self.reconciler:
+            self.reconciler.mark_dirty('', f"{self.burst_count} events within a second, "
+                                           f"events may have been dropped")
+            
+    def queue_overflowed(self):
+        """The kernel dropped events of this monitor's inotify instance; rescan the whole folder"""
+        reconciler = self.reconciler
+        if reconciler:
+            reconciler.mark_dirty('', "the inotify event queue overflowed")
+            
+    def is_idle(self, idle_time):
+        """No raw events for idle_time seconds and nothing waiting to be synced"""
+        if time.monotonic() - self.last_event_time < idle_time:
+            return False
+        if self.coalescer and self.coalescer.pending:
+            return False
+        stats = self.sync_pool.stats() if self.sync_pool else None
+        return stats is not None and stats['queued'] + stats['active'] == 0
+        
+    def get_unwatchable(self):
+        with self.watch_lock:
+            return sorted('' if rel_dir == '.' else rel_dir for rel_dir in self.unwatchable)
+        
+    def submit_rescan(self, rel_dir, reason):
+        """Queue a rescan of one subtree through the auto-sync pool, ordered against live changes"""
+        self.app.log_message(f"Rescanning {rel_dir or 'source folder'} ({reason})", 'info')
+        shared_keys = {''}
+        parent = os.path.dirname(rel_dir)
+        while parent:
+            shared_keys.add(parent)
+            parent = os.path.dirname(parent)
+        shared_keys.discard(rel_dir)
+        changes = [Change('rescan', rel_dir, None)]
+        self.sync_pool.submit({rel_dir}, lambda: self.app.handle_changes(changes), shared_keys)
+        
+    def check_health(self):
+        """Restart watchers that died, marking what they covered for rescanning"""
+        observer = self.observer
+        if observer is None:
+            return
+        if not observer.is_alive():
+            if not self.owns_observer():
+                # The scheduler replaces a shared observer for all of its monitors
+                return
+            self.app.log_message("File system observer stopped unexpectedly, restarting it", 'error')
+            self.restart_observer()
+            return
+        for emitter in list(observer.emitters):
+            # A shared observer also runs the watchers of other monitors
+            if emitter.watch != self.root_watch or emitter.is_alive() or not os.path.isdir(emitter.watch.path):
+                continue
+            logging.warning(f"Watcher for {emitter.watch.path} stopped, restarting it")
+            self.unschedule(emitter.watch)
+            with self.watch_lock:
+                self.watches = {}
+            self.schedule_watches()
+            self.reconciler.mark_dirty('', "its watcher stopped")
+            
+    def scan_journal(self):
+        """Scan the synced state for the next startup's catch-up, while events are still being watched
+        
+        Scanning before the observer stops means a change made during the
+        walk still gets an event; stop() saves the scan only once those
+        events have been synced, so the journal never records a change that
+        was not applied, and at worst understates what was synced, which
+        costs a little extra next time. Subtrees with possibly missed events
+        are left marked as changed.
+        """
+        sync_engine = self.app.sync_engine
+        if not sync_engine or not self.app.auto_sync_enabled():
+            return None
+        unsynced = set(self.get_unwatchable())
+        if self.reconciler:
+            with self.reconciler.condition:
+                unsynced.update(self.reconciler.dirty)
+        return sync_engine.scan_journal(self.folder, unsynced)
+        
+    def create_observer(self):
+        if self.watch_mode == 'polling':
+            return AdaptivePollingObserver(self.is_dir_excluded, self.poll_min_interval, self.poll_max_interval,
+                                           self.poll_ops_per_second)
+        if self.shared_observer:
+            return self.shared_observer
+        if self.watch_mode == 'per_directory':
+            return DirectoryObserver()
+        return Observer()
+        
+    def owns_observer(self):
+        return self.observer is not None and self.observer is not self.shared_observer
+        
+    def schedule_watches(self):
+        if self.watch_mode == 'per_directory':
+            # One emitter on the folder; watch_tree adds the directories below it to the same inotify instance
+            self.root_watch = self.observer.schedule(self.event_handler, self.folder, recursive=False)
+            self.directory_emitter = next(emitter for emitter in self.observer.emitters
+                                          if emitter.watch == self.root_watch)
+            self.directory_emitter.add_overflow_callback(self.queue_overflowed)
+            self.watch_tree(self.folder)
+        else:
+            self.root_watch = self.observer.schedule(self.event_handler, self.folder, recursive=True)
+        
+    def restart_observer(self):
+        """Replace the observer and its watches; events in between are recovered by a rescan"""
+        if self.owns_observer():
+            try:
+                self.observer.stop()
+            except Exception as e:
+                logging.warning(f"Error stopping the old observer: {str(e)}")
+        self.observer = self.create_observer()
+        with self.watch_lock:
+            self.watches = {}
+            self.unwatchable = {}
+        self.schedule_watches()
+        if self.owns_observer():
+            self.observer.start()
+        self.reconciler.mark_dirty('', "the file system observer was restarted")
+        
+    def is_dir_excluded(self, path):
+        sync_engine = self.app.sync_engine
+        return bool(sync_engine) and sync_engine.should_exclude_file(path, is_dir=True)
+        
+    def find_watchable_dirs(self, path):
+        """Directories at and below path that pass the exclusion rules; excluded subtrees are not entered"""
+        found = []
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            if current != self.folder and self.is_dir_excluded(current):
+                continue
+            found.append(current)
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+            except OSError as e:
+                # Still try to watch it; a failure there is recorded as unwatchable
+                logging.warning(f"Could not list {current} for watching: {str(e)}")
+        return found
+        
+    def watch_tree(self, path):
+        """Add a watch to every non-excluded directory at and below path"""
+        if self.watch_mode != 'per_directory' or not self.directory_emitter:
+            return
+        failed = []
+        for directory in self.find_watchable_dirs(path):
+            rel_dir = os.path.relpath(directory, self.folder)
+            with self.watch_lock:
+                if rel_dir in self.watches:
+                    continue
+            try:
+                self.directory_emitter.add_directory(directory)
+            except OSError as e:
+                logging.warning(f"Could not watch {directory}: {str(e)}")
+                failed.append(rel_dir)
+                with self.watch_lock:
+                    self.unwatchable[rel_dir] = str(e)
+                if self.reconciler and self.observer.is_alive():
+                    # Files may already have been written there
+                    self.reconciler.mark_dirty('' if rel_dir == '.' else rel_dir, "directory could not be watched")
+                continue
+            with self.watch_lock:
+                self.watches[rel_dir] = directory
+                self.unwatchable.pop(rel_dir, None)
+        if failed:
+            self.app.log_message(f"Could not watch {len(failed)} directories, changes there will only be "
+                                 f"picked up by a full sync (first: {failed[0]}: {self.unwatchable.get(failed[0])})",
+                                 'error')
+        
+    def unwatch_tree(self, path):
+        """Remove the watches on path and every directory below it"""
+        if self.watch_mode != 'per_directory' or not self.directory_emitter:
+            return
+        rel_dir = os.path.relpath(path, self.folder)
+        prefix = rel_dir + os.sep
+        with self.watch_lock:
+            removed = [(key, watch) for key, watch in self.watches.items()
+                       if key == rel_dir or key.startswith(prefix)]
+            for key, _ in removed:
+                del self.watches[key]
+            for key in [key for key in self.unwatchable if key == rel_dir or key.startswith(prefix)]:
+                del self.unwatchable[key]
+        for key, directory in removed:
+            self.remove_directory(directory)
+            
+    def remove_directory(self, directory):
+        try:
+            self.directory_emitter.remove_directory(directory)
+        except (KeyError, OSError) as e:
+            # The kernel drops the watch by itself once the directory is gone
+            logging.debug(f"Watch on {directory} already gone: {str(e)}")
+            
+    def unschedule(self, watch):
+        try:
+            if self.owns_observer():
+                self.observer.unschedule(watch)
+            else:
+                self.observer.release(self.event_handler, watch)
+        except (KeyError, OSError) as e:
+            # The kernel drops the watch by itself once the directory is gone
+            logging.debug(f"Watch on {watch.path} already gone: {str(e)}")
+        
+    def refresh_watches(self):
+        """Bring the watch set in line with the exclusion rules after they changed"""
+        if self.watch_mode != 'per_directory' or not self.directory_emitter:
+            return
+        wanted = {os.path.relpath(directory, self.folder) for directory in self.find_watchable_dirs(self.folder)}
+        with self.watch_lock:
+            stale = [(key, watch) for key, watch in self.watches.items() if key not in wanted]
+            for key, _ in stale:
+                del self.watches[key]
+            for key in [key for key in self.unwatchable if key not in wanted]:
+                del self.unwatchable[key]
+        for key, directory in stale:
+            self.remove_directory(directory)
+        self.watch_tree(self.folder)
+        logging.info(f"Watch set refreshed: {len(self.watches)} directories watched, {len(stale)} removed")
+        
+    def flush_changes(self, changes):
+        """Report a coalesced batch of changes and pass it on for syncing"""
+        for change in changes:
+            if change.kind == 'created':
+                self.app.log_message(f"New file detected: {change.path}", 'new_file')
+            elif change.kind == 'modified':
+                self.app.log_message(f"File changed: {change.path}", 'changed')
+            elif change.kind == 'deleted':
+                self.app.log_message(f"File deleted: {change.path}", 'deleted')
+            elif change.kind == 'moved':
+                self.app.log_message(f"File renamed: {change.src_path} → {change.path}", 'changed')
+            elif change.kind == 'dir_created':
+                self.app.log_message(f"New directory detected: {change.path}", 'new_file')
+            elif change.kind == 'dir_deleted':
+                self.app.log_message(f"Directory deleted: {change.path}", 'deleted')
+            elif change.kind == 'dir_moved':
+                self.app.log_message(f"Directory renamed: {change.src_path} → {change.path}", 'changed')
+        
+        # Hand the batch to the worker pool; batches sharing a path run in order, and
+        # a directory change also waits for (and holds back) changes below it
+        keys = {change.path for change in changes}
+        keys.update(change.src_path for change in changes if change.src_path)
+        shared_keys = {''}
+        for key in keys:
+            parent = os.path.dirname(key)
+            while parent and parent not in shared_keys:
+                shared_keys.add(parent)
+                parent = os.path.dirname(parent)
+        self.sync_pool.submit(keys, lambda: self.app.handle_changes(changes), shared_keys)
+        
+    def start(self, folder, catch_up=False):
+        """Start watching folder; with catch_up, changes made while not running are synced first"""
         if not folder:
             self.app.log_message("Please select the source folder first!", 'error')
             return False
             
         try:
             logging.info(f"Starting file system monitor for {folder}")
-            self.observer = Observer()
-            self.event_handler = FolderChangeHandler(self.app, folder)
-            self.observer.schedule(self.event_handler, folder, recursive=True)
-            self.observer.start()
-            self.app.log_message("Started monitoring for changes", 'info')
+            if self.monitor_mode == 'polling' or (self.monitor_mode == 'auto' and is_network_filesystem(folder)):
+                # Native notification does not see changes made by other hosts on network mounts
+                self.watch_mode = 'polling'
+            elif self.per_directory_watches and DirectoryObserver is not None:
+                self.watch_mode = 'per_directory'
+            else:
+                self.watch_mode = 'recursive'
+            self.observer = self.create_observer()
+            self.sync_pool = AutoSyncPool(self.auto_sync_workers)
+            self.coalescer = EventCoalescer(self.flush_changes, self.quiet_period, self.max_delay)
+            self.coalescer.start()
+            self.reconciler = Reconciler(self, self.reconcile_interval, self.reconcile_idle)
+            self.event_handler = FolderChangeHandler(self.app, folder, self.coalescer, self)
+            self.folder = folder
+            self.watches = {}
+            self.unwatchable = {}
+            self.schedule_watches()
+            if self.owns_observer():
+                self.observer.start()
+            self.reconciler.start()
+            if catch_up:
+                # Runs exclusively on the root key, so live changes queue up behind it
+                self.sync_pool.submit({''}, self.app.handle_catch_up)
+            if self.watch_mode == 'per_directory':
+                self.app.log_message(f"Started monitoring for changes ({len(self.watches)} directories watched)", 'info')
+            elif self.watch_mode == 'polling':
+                self.app.log_message("Started monitoring for changes by polling (network or FUSE mount)", 'info')
+            else:
+                self.app.log_message("Started monitoring for changes", 'info')
             logging.info("File system monitor started successfully")
             return True
         except Exception as e:
@@ -149,10 +650,39 @@ class FileMonitor:
         if self.observer:
             try:
                 logging.info("Stopping file system monitor")
-                self.observer.stop()
-                self.observer.join()
+                journal = self.scan_journal()
+                if self.reconciler:
+                    self.reconciler.stop()
+                    self.reconciler = None
+                if self.owns_observer():
+                    self.observer.stop()
+                    self.observer.join()
+                else:
+                    # Leave the shared observer running for the other monitors
+                    if self.directory_emitter:
+                        self.directory_emitter.remove_overflow_callback(self.queue_overflowed)
+                        with self.watch_lock:
+                            directories = list(self.watches.values())
+                        for directory in directories:
+                            self.remove_directory(directory)
+                    self.unschedule(self.root_watch)
                 self.observer = None
+                self.root_watch = None
+                self.directory_emitter = None
                 self.event_handler = None
+                with self.watch_lock:
+                    self.watches = {}
+                    self.unwatchable = {}
+                # Deliver changes still waiting for their quiet period
+                if self.coalescer:
+                    self.coalescer.stop()
+                    self.coalescer = None
+                if self.sync_pool:
+                    self.sync_pool.shutdown()
+                    self.sync_pool = None
+                # Every change seen before the scan has now been synced
+                if journal:
+                    self.app.sync_engine.save_journal(journal)
                 self.app.log_message("Stopped monitoring for changes", 'info')
                 logging.info("File system monitor stopped successfully")
             except Exception as e:
@@ -0,0 +1,155 @@
+import os
+from array import array
+from bisect import bisect_right
+
+# Never part of a file name, on any platform
+NAME_SEPARATOR = '/'
+
+class FileTree:
+    """Sizes and mtimes of the files under a folder, stored per directory instead of per path
+
+    Each directory path is stored once. The sorted names of its files are
+    joined into one string, and their name offsets, sizes and mtimes live
+    in typed arrays shared by the whole tree, so a file costs its name
+    length plus about 24 bytes instead of a full path string, a tuple of
+    boxed numbers and a dict slot. It reads like a mapping of
+    rel_path -> (size, mtime); full paths are only built while iterating.
+    File ids are positions in the arrays and are what PathList stores.
+    """
+    def __init__(self):
+        self.dir_paths = []
+        self.dir_ids = {}
+        self.dir_starts = array('q')
+        self.name_blobs = []
+        self.name_offsets = array('L')
+        self.sizes = array('q')
+        self.mtimes = array('d')
+
+    def add_dir(self, rel_dir, entries):
+        """Add the files of one directory as (name, size, mtime) tuples; each directory is added once"""
+        if not entries:
+            return
+        entries.sort()
+        self.dir_ids[rel_dir] = len(self.dir_paths)
+        self.dir_paths.append(rel_dir)
+        self.dir_starts.append(len(self.sizes))
+        offset = 0
+        for name, size, mtime in entries:
+            self.name_offsets.append(offset)
+            self.sizes.append(size)
+            self.mtimes.append(mtime)
+            offset += len(name) + 1
+        self.name_blobs.append(NAME_SEPARATOR.join(name for name, _, _ in entries))
+
+    def _end(self, dir_id):
+        return self.dir_starts[dir_id + 1] if dir_id + 1 < len(self.dir_starts) else len(self.sizes)
+
+    def _name(self, dir_id, file_id):
+        blob = self.name_blobs[dir_id]
+        start = self.name_offsets[file_id]
+        if file_id + 1 < self._end(dir_id):
+            return blob[start:self.name_offsets[file_id + 1] - 1]
+        return blob[start:]
+
+    def find(self, rel_path):
+        """File id of rel_path, or -1"""
+        rel_dir, name = os.path.split(rel_path)
+        dir_id = self.dir_ids.get(rel_dir)
+        if dir_id is None:
+            return -1
+        low, high = self.dir_starts[dir_id], self._end(dir_id)
+        while low < high:
+            middle = (low + high) // 2
+            if self._name(dir_id, middle) < name:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._end(dir_id) and self._name(dir_id, low) == name:
+            return low
+        return -1
+
+    def path(self, file_id):
+        dir_id = bisect_right(self.dir_starts, file_id) - 1
+        return os.path.join(self.dir_paths[dir_id], self._name(dir_id, file_id))
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def __contains__(self, rel_path):
+        return self.find(rel_path) >= 0
+
+    def __getitem__(self, rel_path):
+        file_id = self.find(rel_path)
+        if file_id < 0:
+            raise KeyError(rel_path)
+        return self.sizes[file_id], self.mtimes[file_id]
+
+    def get(self, rel_path, default=None):
+        file_id = self.find(rel_path)
+        return (self.sizes[file_id], self.mtimes[file_id]) if file_id >= 0 else default
+
+    def entries(self):
+        """Yield (file_id, rel_path, (size, mtime)) in tree order"""
+        for dir_id, rel_dir in enumerate(self.dir_paths):
+            file_id = self.dir_starts[dir_id]
+            for name in self.name_blobs[dir_id].split(NAME_SEPARATOR):
+                yield file_id, os.path.join(rel_dir, name), (self.sizes[file_id], self.mtimes[file_id])
+                file_id += 1
+
+    def items(self):
+        for _, rel_path, stats in self.entries():
+            yield rel_path, stats
+
+    def __iter__(self):
+        for dir_id, rel_dir in enumerate(self.dir_paths):
+            for name in self.name_blobs[dir_id].split(NAME_SEPARATOR):
+                yield os.path.join(rel_dir, name)
+
+    def difference(self, other):
+        """Paths of this tree missing from other, as a PathList, comparing sorted names per directory"""
+        missing = PathList(self)
+        for dir_id, rel_dir in enumerate(self.dir_paths):
+            start = self.dir_starts[dir_id]
+            other_id = other.dir_ids.get(rel_dir)
+            if other_id is None:
+                missing.ids.extend(range(start, self._end(dir_id)))
+                continue
+            other_names = other.name_blobs[other_id].split(NAME_SEPARATOR)
+            position = 0
+            for offset, name in enumerate(self.name_blobs[dir_id].split(NAME_SEPARATOR)):
+                while position < len(other_names) and other_names[position] < name:
+                    position += 1
+                if position == len(other_names) or other_names[position] != name:
+                    missing.ids.append(start + offset)
+        return missing
+
+class PathList:
+    """Paths of one FileTree kept as file ids; iterates as rel_path strings like a list would"""
+    def __init__(self, tree, ids=None):
+        self.tree = tree
+        self.ids = ids if ids is not None else array('q')
+
+    def append(self, item):
+        """Add a file by id, or by path when it comes from elsewhere"""
+        if isinstance(item, int):
+            self.ids.append(item)
+            return
+        file_id = self.tree.find(item)
+        if file_id < 0:
+            raise ValueError(f"{item} is not in the scanned tree")
+        self.ids.append(file_id)
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def without(self, rel_paths):
+        return PathList(self.tree, array('q', (file_id for file_id in self.ids
+                                               if self.tree.path(file_id) not in rel_paths)))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        for file_id in self.ids:
+            yield self.tree.path(file_id)
@@ -0,0 +1,159 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+HASH_BUFFER_SIZE = 1024 * 1024
+
+# Below this many files to hash, sending them to the worker processes costs more than it saves
+PROCESS_POOL_THRESHOLD = 32
+
+def pool_context():
+    """Workers start from a clean process: forking a process that runs threads can copy held locks"""
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return multiprocessing.get_context(method)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    inode INTEGER,
+    digest TEXT
+);
+"""
+
+def hash_file(path):
+    """BLAKE2b digest of a file's contents, or None if it cannot be read"""
+    digest = hashlib.blake2b(digest_size=20)
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(HASH_BUFFER_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+    except OSError as e:
+        logging.warning(f"Could not hash {path}: {str(e)}")
+        return None
+    return digest.hexdigest()
+
+class HashCache:
+    """Content hashes cached by (path, size, mtime, inode) in an SQLite file
+
+    A cached digest is only reused while all four values still match, so a
+    file is never rehashed unless it has been touched. Large sets of files
+    are hashed by a pool of worker processes, started on first use and kept
+    until close().
+    """
+    def __init__(self, db_path, workers=None):
+        self.db_path = db_path
+        self.workers = workers or os.cpu_count() or 1
+        self.lock = threading.Lock()
+        self.hashed_count = 0
+        self.cached_count = 0
+        self.pool = None
+        self.pool_workers = 0
+        self.pool_lock = threading.Lock()
+        with self.lock:
+            conn = self._connect()
+            try:
+                conn.executescript(SCHEMA)
+            finally:
+                conn.close()
+
+    def _get_pool(self):
+        with self.pool_lock:
+            if self.pool is not None and self.pool_workers != self.workers:
+                # hash_workers changed since the pool was started
+                self.pool.shutdown(wait=False)
+                self.pool = None
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=pool_context())
+                self.pool_workers = self.workers
+            return self.pool
+
+    def close(self):
+        """Stop the worker processes, if any were started"""
+        with self.pool_lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def _hash_many(self, keys):
+        if len(keys) < PROCESS_POOL_THRESHOLD or self.workers <= 1:
+            return [hash_file(key) for key in keys]
+        pool = self._get_pool()
+        try:
+            return list(pool.map(hash_file, keys, chunksize=8))
+        except BrokenProcessPool as e:
+            logging.warning(f"Hashing worker processes stopped ({str(e)}); hashing in this process")
+            with self.pool_lock:
+                if self.pool is pool:
+                    self.pool = None
+            return [hash_file(key) for key in keys]
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _lookup(self, conn, paths):
+        found = {}
+        paths = list(paths)
+        for i in range(0, len(paths), 500):
+            batch = paths[i:i + 500]
+            placeholders = ','.join('?' * len(batch))
+            for path, size, mtime, inode, digest in conn.execute(
+                    f"SELECT path, size, mtime, inode, digest FROM hashes WHERE path IN ({placeholders})", batch):
+                found[path] = (size, mtime, inode, digest)
+        return found
+
+    def hash_files(self, paths):
+        """Return {path: digest} for the given absolute paths, hashing only what the cache can't answer"""
+        stats = {}
+        for path in paths:
+            try:
+                st = os.stat(path)
+                stats[os.path.abspath(path)] = (path, st.st_size, st.st_mtime, st.st_ino)
+            except OSError as e:
+                logging.warning(f"Could not stat {path} for hashing: {str(e)}")
+
+        with self.lock:
+            conn = self._connect()
+            try:
+                cached = self._lookup(conn, stats)
+            finally:
+                conn.close()
+
+        digests = {}
+        misses = []
+        for key, (path, size, mtime, inode) in stats.items():
+            entry = cached.get(key)
+            if entry and entry[:3] == (size, mtime, inode):
+                digests[path] = entry[3]
+            else:
+                misses.append(key)
+        self.cached_count += len(digests)
+
+        if misses:
+            results = self._hash_many(misses)
+            rows = []
+            for key, digest in zip(misses, results):
+                if digest is None:
+                    continue
+                path, size, mtime, inode = stats[key]
+                digests[path] = digest
+                rows.append((key, size, mtime, inode, digest))
+            self.hashed_count += len(rows)
+            with self.lock:
+                conn = self._connect()
+                try:
+                    with conn:
+                        conn.executemany("INSERT OR REPLACE INTO hashes (path, size, mtime, inode, digest) "
+                                         "VALUES (?, ?, ?, ?, ?)", rows)
+                finally:
+                    conn.close()
+        return digests
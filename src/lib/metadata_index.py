@@ -0,0 +1,186 @@
+import os
+import sqlite3
+import threading
+import time
+import logging
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS {prefix}roots (
+    root TEXT PRIMARY KEY,
+    updated REAL
+);
+CREATE TABLE IF NOT EXISTS {prefix}dirs (
+    root TEXT,
+    path TEXT,
+    mtime REAL,
+    PRIMARY KEY (root, path)
+);
+CREATE TABLE IF NOT EXISTS {prefix}files (
+    root TEXT,
+    dir TEXT,
+    name TEXT,
+    size INTEGER,
+    mtime REAL,
+    inode INTEGER,
+    synced REAL,
+    PRIMARY KEY (root, dir, name)
+);
+"""
+
+# Each kind of snapshot lives in its own tables: 'index' caches the last scan of
+# a folder, 'synced' is the source state known to be fully synced to its target
+TABLE_PREFIXES = {'index': '', 'synced': 'synced_'}
+
+# Directories modified this recently are rescanned next time, since a file
+# created within the same mtime tick would not change the stored value.
+RACY_MTIME_WINDOW = 2.0
+
+class IndexSnapshot:
+    """In-memory view of one indexed folder that tracks which directories changed"""
+    def __init__(self, root, dirs=None, files=None, known=False, kind='index'):
+        self.root = root
+        self.kind = kind
+        self.dirs = dirs or {}    # rel_dir -> directory mtime, None forces a rescan
+        self.files = files or {}  # rel_dir -> {name: [size, mtime, inode, synced]}
+        self.known = known
+        self.dirty = set()
+        self.removed = set()
+        self.subdirs = {}
+        for rel_dir in self.dirs:
+            if rel_dir:
+                self.subdirs.setdefault(os.path.dirname(rel_dir), []).append(os.path.basename(rel_dir))
+
+    def is_current(self, rel_dir, mtime):
+        """Check whether the stored listing of a directory can be reused"""
+        stored = self.dirs.get(rel_dir)
+        return stored is not None and stored == mtime
+
+    def replace_dir(self, rel_dir, mtime, files, subdirs, scan_time):
+        if mtime >= scan_time - RACY_MTIME_WINDOW:
+            mtime = None
+        self.dirs[rel_dir] = mtime
+        self.files[rel_dir] = files
+        self.subdirs[rel_dir] = subdirs
+        self.dirty.add(rel_dir)
+        self.removed.discard(rel_dir)
+
+    def invalidate_dir(self, rel_dir):
+        """Force a rescan of a directory that this process just wrote into"""
+        if rel_dir in self.dirs:
+            self.dirs[rel_dir] = None
+            self.dirty.add(rel_dir)
+
+    def mark_synced(self, rel_path, synced_time):
+        entry = self.files.get(os.path.dirname(rel_path), {}).get(os.path.basename(rel_path))
+        if entry is not None:
+            entry[3] = synced_time
+            self.dirty.add(os.path.dirname(rel_path))
+
+    def copy_from(self, other):
+        """Take over the listings of another snapshot of the same folder, marking only what differs"""
+        for rel_dir, mtime in other.dirs.items():
+            files = other.files.get(rel_dir, {})
+            if rel_dir not in self.dirs or self.dirs[rel_dir] != mtime or self.files.get(rel_dir) != files:
+                self.dirs[rel_dir] = mtime
+                self.files[rel_dir] = {name: list(entry) for name, entry in files.items()}
+                self.dirty.add(rel_dir)
+                self.removed.discard(rel_dir)
+        self.subdirs = {rel_dir: list(names) for rel_dir, names in other.subdirs.items()}
+        self.prune(set(other.dirs))
+
+    def prune(self, seen_dirs):
+        """Forget directories that were not visited by the last walk"""
+        for rel_dir in list(self.dirs):
+            if rel_dir not in seen_dirs:
+                del self.dirs[rel_dir]
+                self.files.pop(rel_dir, None)
+                self.subdirs.pop(rel_dir, None)
+                self.dirty.discard(rel_dir)
+                self.removed.add(rel_dir)
+
+class MetadataIndex:
+    """Persistent SQLite index of file metadata, keyed by the absolute folder path"""
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        with self.lock:
+            conn = self._connect()
+            try:
+                for prefix in TABLE_PREFIXES.values():
+                    conn.executescript(SCHEMA.format(prefix=prefix))
+            finally:
+                conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def load(self, root, kind='index'):
+        """Load the stored state of a folder into an IndexSnapshot"""
+        root = os.path.abspath(root)
+        prefix = TABLE_PREFIXES[kind]
+        dirs = {}
+        files = {}
+        with self.lock:
+            conn = self._connect()
+            try:
+                known = conn.execute(f"SELECT 1 FROM {prefix}roots WHERE root = ?", (root,)).fetchone() is not None
+                if known:
+                    for path, mtime in conn.execute(f"SELECT path, mtime FROM {prefix}dirs WHERE root = ?", (root,)):
+                        dirs[path] = mtime
+                    for rel_dir, name, size, mtime, inode, synced in conn.execute(
+                            f"SELECT dir, name, size, mtime, inode, synced FROM {prefix}files WHERE root = ?", (root,)):
+                        files.setdefault(rel_dir, {})[name] = [size, mtime, inode, synced]
+            finally:
+                conn.close()
+        logging.info(f"Loaded {kind} state for {root}: {len(dirs)} directories")
+        return IndexSnapshot(root, dirs, files, known, kind)
+
+    def save(self, snapshot):
+        """Write back only the directories that changed since the snapshot was loaded"""
+        root = snapshot.root
+        prefix = TABLE_PREFIXES[snapshot.kind]
+        with self.lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    for rel_dir in snapshot.removed:
+                        conn.execute(f"DELETE FROM {prefix}dirs WHERE root = ? AND path = ?", (root, rel_dir))
+                        conn.execute(f"DELETE FROM {prefix}files WHERE root = ? AND dir = ?", (root, rel_dir))
+                    for rel_dir in snapshot.dirty:
+                        conn.execute(f"DELETE FROM {prefix}files WHERE root = ? AND dir = ?", (root, rel_dir))
+                        conn.executemany(
+                            f"INSERT INTO {prefix}files (root, dir, name, size, mtime, inode, synced) "
+                            f"VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            [(root, rel_dir, name, *entry) for name, entry in snapshot.files.get(rel_dir, {}).items()])
+                        if rel_dir in snapshot.dirs:
+                            conn.execute(f"INSERT OR REPLACE INTO {prefix}dirs (root, path, mtime) VALUES (?, ?, ?)",
+                                         (root, rel_dir, snapshot.dirs[rel_dir]))
+                    conn.execute(f"INSERT OR REPLACE INTO {prefix}roots (root, updated) VALUES (?, ?)",
+                                 (root, time.time()))
+            finally:
+                conn.close()
+        logging.info(f"Saved {snapshot.kind} state for {root}: {len(snapshot.dirty)} directories updated, "
+                     f"{len(snapshot.removed)} removed")
+        snapshot.dirty.clear()
+        snapshot.removed.clear()
+        snapshot.known = True
+
+    def invalidate(self, root=None):
+        """Drop the cached scans of one folder, or of every folder when root is None
+        
+        The synced state is kept; it records what reached the target, not how the folder was scanned.
+        """
+        with self.lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    if root is None:
+                        for table in ('roots', 'dirs', 'files'):
+                            conn.execute(f"DELETE FROM {table}")
+                    else:
+                        root = os.path.abspath(root)
+                        for table in ('roots', 'dirs', 'files'):
+                            conn.execute(f"DELETE FROM {table} WHERE root = ?", (root,))
+            finally:
+                conn.close()
+        logging.info(f"Invalidated metadata index for {root or 'all folders'}")
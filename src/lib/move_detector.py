@@ -0,0 +1,93 @@
+import os
+
+def match_moves(new_paths, deleted_paths, source_files, target_files,
+                source_inodes=None, previous_inodes=None, digests=None):
+    """Pair new source paths with target-only paths that hold the same file
+
+    new_paths are source files missing from the target and deleted_paths are
+    target files missing from the source. A pair matches when the sizes are
+    equal and either the source inode used to live at the old path
+    (previous_inodes, from the metadata index) or the content digests agree.
+    Empty files are never paired since copying them costs nothing.
+    Returns {old_path: new_path}.
+    """
+    moves = {}
+    by_size = {}
+    for old_path in deleted_paths:
+        size = target_files[old_path][0]
+        if size > 0:
+            by_size.setdefault(size, []).append(old_path)
+
+    for new_path in new_paths:
+        size = source_files[new_path][0]
+        candidates = by_size.get(size)
+        if not candidates:
+            continue
+        match = None
+        if source_inodes and previous_inodes:
+            old_path = previous_inodes.get(source_inodes.get(new_path))
+            if old_path in candidates:
+                match = old_path
+        if match is None and digests:
+            digest = digests.get(('source', new_path))
+            if digest is not None:
+                for old_path in candidates:
+                    if digests.get(('target', old_path)) == digest:
+                        match = old_path
+                        break
+        if match is not None:
+            candidates.remove(match)
+            moves[match] = new_path
+    return moves
+
+def collapse_directory_moves(moves, target_files, target_folder):
+    """Replace groups of file moves that amount to a directory rename with one directory move
+
+    A directory move old_dir -> new_dir is used when every target file under
+    old_dir is moved to the same relative place under new_dir and new_dir
+    does not exist on the target yet. Returns a list of (old, new, old_files)
+    operations covering every entry in moves, where old_files lists the moved
+    file paths each operation carries.
+    """
+    groups = {}
+    for old_path, new_path in moves.items():
+        old_parts = old_path.split(os.sep)
+        new_parts = new_path.split(os.sep)
+        common = 0
+        while (common < min(len(old_parts), len(new_parts)) - 1 and
+               old_parts[-1 - common] == new_parts[-1 - common]):
+            common += 1
+        if common == 0:
+            continue
+        old_dir = os.sep.join(old_parts[:-common])
+        new_dir = os.sep.join(new_parts[:-common])
+        if old_dir and new_dir:
+            groups.setdefault((old_dir, new_dir), []).append(old_path)
+
+    if not groups:
+        return [(old_path, new_path, [old_path]) for old_path, new_path in moves.items()]
+
+    # Count the target files under each candidate directory
+    candidate_dirs = {old_dir for old_dir, _ in groups}
+    totals = dict.fromkeys(candidate_dirs, 0)
+    for path in target_files:
+        parent = os.path.dirname(path)
+        while parent:
+            if parent in totals:
+                totals[parent] += 1
+            parent = os.path.dirname(parent)
+
+    operations = []
+    covered = set()
+    for (old_dir, new_dir), old_paths in sorted(groups.items(), key=lambda item: len(item[0][0])):
+        if any(old_dir.startswith(done + os.sep) or new_dir == done_new or new_dir.startswith(done_new + os.sep)
+               for done, done_new, _ in operations):
+            continue
+        if totals[old_dir] != len(old_paths) or os.path.exists(os.path.join(target_folder, new_dir)):
+            continue
+        operations.append((old_dir, new_dir, old_paths))
+        covered.update(old_paths)
+
+    operations.extend((old_path, new_path, [old_path]) for old_path, new_path in moves.items()
+                      if old_path not in covered)
+    return operations
@@ -0,0 +1,250 @@
+import os
+import sys
+import time
+import threading
+import logging
+from watchdog.observers.api import ObservedWatch
+from watchdog.events import (FileCreatedEvent, DirCreatedEvent, FileDeletedEvent, DirDeletedEvent,
+                             FileModifiedEvent, FileMovedEvent, DirMovedEvent)
+
+DEFAULT_POLL_MIN_INTERVAL = 2.0
+DEFAULT_POLL_MAX_INTERVAL = 60.0
+DEFAULT_POLL_OPS_PER_SECOND = 2000
+# Files in unchanged directories are re-checked once every this many polls
+DEFAULT_POLL_VERIFY_EVERY = 10
+
+# Directory listings this recent are redone next poll, since network file
+# systems report coarse or cached mtimes
+RACY_MTIME_WINDOW = 2.0
+
+NETWORK_FILESYSTEMS = ('nfs', 'nfs4', 'cifs', 'smbfs', 'smb3', 'ncpfs', '9p', 'afs', 'ceph', 'glusterfs',
+                       'lustre', 'davfs', 'fuse')
+
+def is_network_filesystem(path):
+    """Whether path lives on a network or FUSE mount, where native change notification misses changes"""
+    if not sys.platform.startswith('linux'):
+        return False
+    path = os.path.realpath(path)
+    best_mount, best_type = '', ''
+    try:
+        with open('/proc/mounts') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount_point = fields[1].replace('\\040', ' ')
+                if (path == mount_point or path.startswith(mount_point.rstrip('/') + '/')) and \
+                        len(mount_point) >= len(best_mount):
+                    best_mount, best_type = mount_point, fields[2]
+    except OSError:
+        return False
+    return best_type.split('.')[0] in NETWORK_FILESYSTEMS
+
+class AdaptivePollingObserver:
+    """Detects changes by polling, for mounts where inotify and friends see nothing
+
+    Every poll stats each non-excluded directory once. Only directories whose
+    mtime changed are listed again and have their entries stat'ed, and the
+    differences are dispatched to the handler as ordinary watchdog events
+    (deletions and creations of the same inode become moves). Since editing
+    a file in place does not touch its directory's mtime, the files of
+    unchanged directories are re-checked in rotation, each directory once
+    every verify_every polls. The interval drops to min_interval after a
+    poll that found changes and grows towards max_interval while nothing
+    happens, and file system operations are throttled to ops_per_second.
+    Exposes the subset of the watchdog Observer interface FileMonitor uses.
+    """
+    def __init__(self, skip_dir=None, min_interval=DEFAULT_POLL_MIN_INTERVAL,
+                 max_interval=DEFAULT_POLL_MAX_INTERVAL, ops_per_second=DEFAULT_POLL_OPS_PER_SECOND,
+                 verify_every=DEFAULT_POLL_VERIFY_EVERY):
+        self.skip_dir = skip_dir
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.ops_per_second = max(1, int(ops_per_second))
+        self.verify_every = max(1, int(verify_every))
+        self.emitters = ()
+        self.handler = None
+        self.root = None
+        self.watch = None
+        self.state = {}  # rel_dir -> (dir mtime_ns or None, {name: (is_dir, size, mtime_ns, inode)})
+        self.interval = min_interval
+        self.poll_count = 0
+        self.last_duration = 0.0
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.budget_start = 0.0
+        self.budget_used = 0
+
+    def schedule(self, event_handler, path, recursive=True):
+        self.handler = event_handler
+        self.root = path
+        self.watch = ObservedWatch(path, recursive=True)
+        return self.watch
+
+    def unschedule(self, watch):
+        pass
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='polling-observer', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def join(self, timeout=None):
+        if self.thread:
+            self.thread.join(timeout)
+
+    def is_alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def stats(self):
+        return {'interval': self.interval, 'last_duration': self.last_duration,
+                'polls': self.poll_count, 'dirs': len(self.state)}
+
+    def _spend(self, ops):
+        """Sleep as needed to keep file system operations under ops_per_second"""
+        self.budget_used += ops
+        if self.budget_used < self.ops_per_second / 10:
+            return
+        elapsed = time.monotonic() - self.budget_start
+        needed = self.budget_used / self.ops_per_second
+        if needed > elapsed:
+            self.stop_event.wait(needed - elapsed)
+        self.budget_start = time.monotonic()
+        self.budget_used = 0
+
+    def _list(self, abs_dir):
+        listing = {}
+        with os.scandir(abs_dir) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        listing[entry.name] = (True, 0, 0, entry.inode())
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        listing[entry.name] = (False, st.st_size, st.st_mtime_ns, st.st_ino)
+                except OSError:
+                    # Vanished between listing and stat; the next poll sorts it out
+                    continue
+        self._spend(len(listing) + 1)
+        return listing
+
+    def _verify(self, abs_dir, listing, modified, rel_dir):
+        """Re-stat the files of a directory whose own mtime did not change"""
+        for name, entry in listing.items():
+            if entry[0]:
+                continue
+            try:
+                st = os.stat(os.path.join(abs_dir, name))
+            except OSError:
+                continue
+            if (st.st_size, st.st_mtime_ns) != entry[1:3]:
+                listing[name] = (False, st.st_size, st.st_mtime_ns, st.st_ino)
+                modified.append(os.path.join(rel_dir, name))
+        self._spend(len(listing))
+
+    def _poll(self, baseline):
+        """Walk the tree once, returning (created, deleted, modified) relative paths with entries"""
+        created, deleted, modified = [], [], []
+        seen = set()
+        scan_time = time.time()
+        stack = ['']
+        while stack and not self.stop_event.is_set():
+            rel_dir = stack.pop()
+            abs_dir = os.path.join(self.root, rel_dir)
+            try:
+                dir_mtime = os.stat(abs_dir).st_mtime_ns
+                self._spend(1)
+                previous = self.state.get(rel_dir)
+                if previous is not None and previous[0] == dir_mtime:
+                    listing = previous[1]
+                    if hash(rel_dir) % self.verify_every == self.poll_count % self.verify_every:
+                        self._verify(abs_dir, listing, modified, rel_dir)
+                else:
+                    listing = self._list(abs_dir)
+                    if previous is not None and not baseline:
+                        self._diff(rel_dir, previous[1], listing, created, deleted, modified)
+                    stored_mtime = None if dir_mtime / 1e9 >= scan_time - RACY_MTIME_WINDOW else dir_mtime
+                    self.state[rel_dir] = (stored_mtime, listing)
+            except OSError:
+                # Gone or unreadable; its parent's listing reports the deletion
+                continue
+            seen.add(rel_dir)
+            for name, entry in listing.items():
+                if entry[0]:
+                    child = os.path.join(rel_dir, name)
+                    if not (self.skip_dir and self.skip_dir(os.path.join(self.root, child))):
+                        stack.append(child)
+        if not self.stop_event.is_set():
+            for rel_dir in [rel_dir for rel_dir in self.state if rel_dir not in seen]:
+                del self.state[rel_dir]
+        return created, deleted, modified
+
+    def _diff(self, rel_dir, old, new, created, deleted, modified):
+        for name, entry in new.items():
+            previous = old.get(name)
+            if previous is None or previous[0] != entry[0]:
+                if previous is not None:
+                    deleted.append((os.path.join(rel_dir, name), previous))
+                created.append((os.path.join(rel_dir, name), entry))
+            elif not entry[0] and entry[1:3] != previous[1:3]:
+                modified.append(os.path.join(rel_dir, name))
+        for name, previous in old.items():
+            if name not in new:
+                deleted.append((os.path.join(rel_dir, name), previous))
+
+    def _dispatch(self, created, deleted, modified):
+        # Some network file systems report no inode numbers; never pair those
+        by_inode = {(entry[0], entry[3]): rel_path for rel_path, entry in deleted if entry[3]}
+        moved_from = set()
+        events = []
+        remaining_created = []
+        for rel_path, entry in created:
+            old_path = by_inode.get((entry[0], entry[3])) if entry[3] else None
+            if old_path is not None and old_path not in moved_from:
+                moved_from.add(old_path)
+                event_class = DirMovedEvent if entry[0] else FileMovedEvent
+                events.append(event_class(os.path.join(self.root, old_path), os.path.join(self.root, rel_path)))
+            else:
+                remaining_created.append((rel_path, entry))
+        for rel_path, entry in deleted:
+            if rel_path not in moved_from:
+                event_class = DirDeletedEvent if entry[0] else FileDeletedEvent
+                events.append(event_class(os.path.join(self.root, rel_path)))
+        for rel_path, entry in remaining_created:
+            event_class = DirCreatedEvent if entry[0] else FileCreatedEvent
+            events.append(event_class(os.path.join(self.root, rel_path)))
+        events.extend(FileModifiedEvent(os.path.join(self.root, rel_path)) for rel_path in modified)
+        for event in events:
+            try:
+                self.handler.dispatch(event)
+            except Exception as e:
+                logging.error(f"Error dispatching polled event for {event.src_path}: {str(e)}", exc_info=True)
+        return len(events)
+
+    def _run(self):
+        logging.info(f"Polling {self.root} every {self.min_interval}-{self.max_interval}s, "
+                     f"at most {self.ops_per_second} file operations per second")
+        self.budget_start = time.monotonic()
+        baseline = True
+        while not self.stop_event.is_set():
+            started = time.monotonic()
+            try:
+                created, deleted, modified = self._poll(baseline)
+                changes = 0 if baseline else self._dispatch(created, deleted, modified)
+            except Exception as e:
+                logging.error(f"Error polling {self.root}: {str(e)}", exc_info=True)
+                changes = 0
+            baseline = False
+            self.poll_count += 1
+            self.last_duration = time.monotonic() - started
+            # Poll eagerly while things change, back off while they don't
+            if changes:
+                self.interval = self.min_interval
+            else:
+                self.interval = min(self.max_interval, self.interval * 1.5)
+            logging.debug(f"Poll of {self.root} took {self.last_duration:.2f}s, {changes} changes, "
+                          f"next in {self.interval:.1f}s")
+            # Never spend more than half the time polling
+            self.stop_event.wait(max(self.interval, self.last_duration))
@@ -0,0 +1,104 @@
+import os
+import time
+import threading
+import logging
+
+DEFAULT_RECONCILE_INTERVAL = 10.0
+DEFAULT_RECONCILE_IDLE = 2.0
+# Directories that could not be watched are rescanned this often
+DEFAULT_UNWATCHED_RESCAN = 300.0
+
+class Reconciler:
+    """Rescans subtrees that may have missed events, one at a time while the monitor is idle
+
+    The monitor marks a directory dirty when events there may have been
+    lost: an event burst large enough to overflow the kernel queue, a
+    watcher thread that died, or a directory that could not be watched.
+    Nested dirty directories collapse into their topmost one. A background
+    thread hands one dirty subtree at a time back to the monitor, at most
+    once per interval and only after no events have arrived for idle_time
+    seconds, so rescans never compete with live changes.
+    """
+    def __init__(self, monitor, interval=DEFAULT_RECONCILE_INTERVAL, idle_time=DEFAULT_RECONCILE_IDLE,
+                 unwatched_rescan=DEFAULT_UNWATCHED_RESCAN):
+        self.monitor = monitor
+        self.interval = interval
+        self.idle_time = idle_time
+        self.unwatched_rescan = unwatched_rescan
+        self.dirty = {}
+        self.reconciled = 0
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self._run, name='reconciler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def mark_dirty(self, rel_dir, reason):
+        """Queue a subtree for rescanning; '' stands for the whole source folder"""
+        with self.condition:
+            parent = rel_dir
+            while True:
+                if parent in self.dirty:
+                    return
+                if not parent:
+                    break
+                parent = os.path.dirname(parent)
+            prefix = rel_dir + os.sep if rel_dir else ''
+            for path in [path for path in self.dirty if path.startswith(prefix)]:
+                del self.dirty[path]
+            self.dirty[rel_dir] = reason
+            self.condition.notify()
+        logging.warning(f"Marked {rel_dir or 'source folder'} for rescan: {reason}")
+
+    def stats(self):
+        with self.condition:
+            return {'dirty': len(self.dirty), 'reconciled': self.reconciled}
+
+    def _take_next(self):
+        # Shallowest first, so a later mark on a parent does not rescan the same files twice
+        rel_dir = min(self.dirty, key=lambda path: (path.count(os.sep) if path else -1, path))
+        return rel_dir, self.dirty.pop(rel_dir)
+
+    def _run(self):
+        last_rescan = 0.0
+        last_unwatched = time.monotonic()
+        while True:
+            with self.condition:
+                if not self.running:
+                    return
+                self.condition.wait(self.interval)
+                if not self.running:
+                    return
+            try:
+                self.monitor.check_health()
+                now = time.monotonic()
+                if now - last_unwatched >= self.unwatched_rescan:
+                    last_unwatched = now
+                    for rel_dir in self.monitor.get_unwatchable():
+                        self.mark_dirty(rel_dir, "directory is not watched")
+                if now - last_rescan < self.interval or not self.monitor.is_idle(self.idle_time):
+                    continue
+                with self.condition:
+                    if not self.dirty:
+                        continue
+                    rel_dir, reason = self._take_next()
+                self.monitor.submit_rescan(rel_dir, reason)
+                last_rescan = time.monotonic()
+                with self.condition:
+                    self.reconciled += 1
+            except Exception as e:
+                logging.error(f"Error during background reconciliation: {str(e)}", exc_info=True)
@@ -1,13 +1,74 @@
 import os
 import shutil
-import fnmatch
-from pathlib import Path
 import logging
 import stat
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from lib.exclusion_matcher import ExclusionMatcher, ExclusionSnapshot
+from lib.copy_executor import CopyExecutor, DEFAULT_COPY_WORKERS
+from lib.copy_backend import CopyBackend, partial_path
+from lib.move_detector import match_moves, collapse_directory_moves
+from lib.event_coalescer import Change
+from lib.delta_transfer import delta_copy, DeltaStats, DEFAULT_DELTA_THRESHOLD
+from lib.tree_walk import walk_sorted, walk_listings, merge_join, DEFAULT_SCAN_THREADS
+from lib.file_tree import FileTree, PathList
+from lib.sync_plan import SyncPlan
+from lib.durable_writes import FSYNC_MODES, DEFAULT_FSYNC_MODE
+
+# Files at least this large are copied in checkpointed chunks when a journal is available
+DEFAULT_RESUME_THRESHOLD = 256 * 1024 * 1024
+CHECKPOINT_INTERVAL = 64 * 1024 * 1024
+
+# Files of equal size but different mtime are hashed in batches of this many when streaming
+STREAM_HASH_BATCH = 256
+# New files held back when streaming so they can be matched against deletions as renames
+STREAM_MOVE_WINDOW = 10000
 
 class SyncEngine:
     def __init__(self, app):
         self.app = app
+        self.metadata_index = None
+        self.index_stats = {}
+        self.stats_lock = threading.Lock()
+        self.matchers = {}
+        self.exclusions = None
+        self.copy_workers = DEFAULT_COPY_WORKERS
+        # Thread pool shared with other engines; None gives each sync its own
+        self.io_pool = None
+        # Copy while scanning instead of planning the whole sync first (not with the metadata index)
+        self.streaming = True
+        # Threads listing directories during a scan of each side
+        self.source_scan_threads = DEFAULT_SCAN_THREADS
+        self.target_scan_threads = DEFAULT_SCAN_THREADS
+        self.copy_backend = CopyBackend()
+        self.hash_cache = None
+        self.delta_threshold = DEFAULT_DELTA_THRESHOLD
+        self.delta_stats = DeltaStats()
+        # Journal of interrupted syncs and large-copy checkpoints; None disables resuming
+        self.journal = None
+        self.resume = True
+        self.resume_threshold = DEFAULT_RESUME_THRESHOLD
+        # (target path, callback) of copies whose bookkeeping waits for the next commit_writes
+        self.awaiting_commit = []
+        self.commit_lock = threading.Lock()
+        
+    def configure(self, settings):
+        """Apply engine tuning options from the saved configuration"""
+        self.copy_workers = max(1, int(settings.get('copy_workers', DEFAULT_COPY_WORKERS)))
+        self.delta_threshold = int(settings.get('delta_threshold', DEFAULT_DELTA_THRESHOLD))
+        self.streaming = bool(settings.get('streaming_sync', True))
+        self.source_scan_threads = max(1, int(settings.get('source_scan_threads', DEFAULT_SCAN_THREADS)))
+        self.target_scan_threads = max(1, int(settings.get('target_scan_threads', DEFAULT_SCAN_THREADS)))
+        self.resume = bool(settings.get('resume_syncs', True))
+        self.resume_threshold = int(settings.get('resume_threshold', DEFAULT_RESUME_THRESHOLD))
+        fsync_mode = settings.get('fsync_mode', DEFAULT_FSYNC_MODE)
+        if fsync_mode not in FSYNC_MODES:
+            logging.warning(f"Unknown fsync_mode {fsync_mode!r}, using {DEFAULT_FSYNC_MODE!r}")
+            fsync_mode = DEFAULT_FSYNC_MODE
+        self.copy_backend.durability.mode = fsync_mode
+        if self.hash_cache and settings.get('hash_workers'):
+            self.hash_cache.workers = max(1, int(settings['hash_workers']))
         
     def read_gitignore(self, folder):
         gitignore_path = os.path.join(folder, '.gitignore')
@@ -21,40 +82,57 @@ class SyncEngine:
             logging.error(f"Failed to read .gitignore at {gitignore_path}: {str(e)}")
         return patterns
         
-    def should_exclude_file(self, path):
-        """Check if a file should be excluded based on current patterns"""
-        try:
-            # Get the source folder from the UI
-            source_folder = self.app.ui.left_folder_var.get()
-            if not source_folder:
-                return False
-                
-            # Get patterns from UI and gitignore
+    def set_exclusions(self, source_folder, additional_patterns):
+        """Compile the exclusion snapshot used for monitor events
+        
+        Called when the source folder or the additional patterns change. The
+        snapshot is replaced in one assignment, so event handlers can read it
+        without locks and without touching the UI.
+        """
+        if source_folder:
             gitignore_patterns = self.read_gitignore(source_folder)
-            additional_patterns = [p.strip() for p in self.app.ui.exclusions_text.get("1.0", "end").split('\n') if p.strip()]
-            
-            return self.should_exclude(path, source_folder, gitignore_patterns, additional_patterns)
+            matcher = ExclusionMatcher(source_folder, gitignore_patterns, additional_patterns)
+        else:
+            gitignore_patterns = []
+            matcher = None
+        self.exclusions = ExclusionSnapshot(source_folder, tuple(gitignore_patterns),
+                                            tuple(additional_patterns), matcher)
+        logging.info(f"Exclusion rules compiled for {source_folder or 'no folder'}")
+        
+    def refresh_exclusions(self):
+        """Rebuild the snapshot after a .gitignore file changed"""
+        current = self.exclusions
+        if current is not None:
+            self.set_exclusions(current.source_folder, current.additional_patterns)
+        
+    def should_exclude_file(self, path, is_dir=False):
+        """Check if a path in the source folder is excluded by the current exclusion snapshot"""
+        snapshot = self.exclusions
+        if snapshot is None or snapshot.matcher is None:
+            return False
+        try:
+            relative_path = os.path.relpath(path, snapshot.source_folder)
+            return snapshot.matcher.is_excluded(relative_path, is_dir)
         except Exception as e:
             logging.error(f"Error checking exclusions for {path}: {str(e)}")
             return False
         
-    def should_exclude(self, path, base_path, gitignore_patterns, additional_patterns):
+    def get_matcher(self, base_path, gitignore_patterns, additional_patterns, refresh=False):
+        """Return a compiled matcher for these patterns, reusing it across calls"""
+        key = (os.path.abspath(base_path), tuple(gitignore_patterns), tuple(additional_patterns))
+        matcher = self.matchers.get(key)
+        if matcher is None or refresh:
+            matcher = ExclusionMatcher(base_path, gitignore_patterns, additional_patterns)
+            if len(self.matchers) >= 8:
+                self.matchers.clear()
+            self.matchers[key] = matcher
+        return matcher
+        
+    def should_exclude(self, path, base_path, gitignore_patterns, additional_patterns, is_dir=False):
         try:
             relative_path = os.path.relpath(path, base_path)
-            
-            # Check additional exclusions
-            for pattern in additional_patterns:
-                if fnmatch.fnmatch(relative_path, pattern):
-                    logging.debug(f"File {relative_path} excluded by pattern: {pattern}")
-                    return True
-                    
-            # Check gitignore patterns
-            for pattern in gitignore_patterns:
-                if fnmatch.fnmatch(relative_path, pattern):
-                    logging.debug(f"File {relative_path} excluded by gitignore pattern: {pattern}")
-                    return True
-                    
-            return False
+            matcher = self.get_matcher(base_path, gitignore_patterns, additional_patterns)
+            return matcher.is_excluded(relative_path, is_dir)
         except Exception as e:
             logging.error(f"Error checking exclusions for {path}: {str(e)}")
             return False
@@ -70,20 +148,44 @@ class SyncEngine:
             raise
             
     def sync_single_file(self, source_folder, target_folder, rel_path, gitignore_patterns, additional_patterns):
+        source_file = os.path.join(source_folder, rel_path)
+        if self.should_exclude(source_file, source_folder, gitignore_patterns, additional_patterns):
+            return False
+        results = []
+        if self.copy_file(source_folder, target_folder, rel_path):
+            self.after_commit(os.path.join(target_folder, rel_path), results.append)
+        self.commit_writes()
+        return bool(results and results[0])
+        
+    def copy_file(self, source_folder, target_folder, rel_path, cancel_check=None):
+        """Copy one file that has already passed the exclusion rules
+        
+        cancel_check is only consulted between the chunks of a checkpointed copy.
+        """
         try:
             source_file = os.path.join(source_folder, rel_path)
             target_file = os.path.join(target_folder, rel_path)
+            os.makedirs(os.path.dirname(target_file), exist_ok=True)
             
-            if not self.should_exclude(source_file, source_folder, gitignore_patterns, additional_patterns):
-                os.makedirs(os.path.dirname(target_file), exist_ok=True)
+            # Handle read-only target files
+            if os.path.exists(target_file) and not os.access(target_file, os.W_OK):
+                os.chmod(target_file, stat.S_IWRITE)
                 
-                # Handle read-only target files
-                if os.path.exists(target_file) and not os.access(target_file, os.W_OK):
-                    os.chmod(target_file, stat.S_IWRITE)
-                    
-                shutil.copy2(source_file, target_file)
-                logging.info(f"Synced file: {rel_path}")
+            if self.use_delta(source_file, target_file):
+                size = os.path.getsize(source_file)
+                written = delta_copy(source_file, target_file)
+                shutil.copystat(source_file, target_file)
+                self.copy_backend.durability.updated_in_place(target_file, written)
+                self.delta_stats.add(written, size)
+                logging.info(f"Delta-synced file: {rel_path} (wrote {written} of {size} bytes)")
                 return True
+                
+            if self.use_checkpoints(source_file, target_file):
+                return self.copy_checkpointed(source_file, target_file, rel_path, cancel_check)
+                
+            method = self.copy_backend.copy(source_file, target_file)
+            logging.info(f"Synced file: {rel_path} (via {method})")
+            return True
         except PermissionError as e:
             error_msg = f"Permission denied syncing {rel_path}: {str(e)}"
             self.app.log_message(error_msg, 'error')
@@ -95,6 +197,184 @@ class SyncEngine:
             logging.error(error_msg, exc_info=True)
             return False
             
+    def copy_file_to_targets(self, source_folder, target_folders, rel_path):
+        """Copy one file to several targets, reading the source only once; returns the targets that failed"""
+        source_file = os.path.join(source_folder, rel_path)
+        target_files = {}
+        delta_targets = set()
+        failed = []
+        for target_folder in target_folders:
+            target_file = os.path.join(target_folder, rel_path)
+            try:
+                os.makedirs(os.path.dirname(target_file), exist_ok=True)
+                # Handle read-only target files
+                if os.path.exists(target_file) and not os.access(target_file, os.W_OK):
+                    os.chmod(target_file, stat.S_IWRITE)
+            except OSError as e:
+                self.report_target_error(target_folder, f"Error syncing {rel_path}: {str(e)}")
+                failed.append(target_folder)
+                continue
+            target_files[target_file] = target_folder
+            if self.use_delta(source_file, target_file):
+                delta_targets.add(target_file)
+        if not target_files:
+            return failed
+        try:
+            results = self.copy_backend.copy_many(source_file, list(target_files), delta_targets)
+        except OSError as e:
+            for target_folder in target_files.values():
+                self.report_target_error(target_folder, f"Error reading {rel_path}: {str(e)}")
+            return failed + list(target_files.values())
+        for target_file, result in results.items():
+            target_folder = target_files[target_file]
+            if isinstance(result, Exception):
+                self.report_target_error(target_folder, f"Error syncing {rel_path}: {str(result)}")
+                failed.append(target_folder)
+                continue
+            method, written = result
+            if method == 'delta':
+                size = os.path.getsize(source_file)
+                self.delta_stats.add(written, size)
+                logging.info(f"Delta-synced file: {rel_path} to {target_folder} (wrote {written} of {size} bytes)")
+            else:
+                logging.info(f"Synced file: {rel_path} to {target_folder} (via {method})")
+        return failed
+        
+    def after_commit(self, target_path, callback):
+        """Call callback(committed) once a copy to target_path is durably in place
+        
+        In 'batch' mode copy_file returns before the copy is renamed into
+        place, so journal and index updates wait for commit_writes; otherwise
+        the callback runs right away.
+        """
+        if self.copy_backend.durability.mode != 'batch':
+            callback(True)
+            return
+        with self.commit_lock:
+            self.awaiting_commit.append((target_path, callback))
+            
+    def commit_writes(self):
+        """Put copies held back by the 'batch' fsync mode into place, reporting any that failed"""
+        durability = self.copy_backend.durability
+        durability.commit()
+        failed = set()
+        for target, error in durability.take_failures():
+            failed.add(target)
+            error_msg = f"Error writing {target}: {str(error)}"
+            self.app.log_message(error_msg, 'error')
+            logging.error(error_msg)
+        with self.commit_lock:
+            awaiting, self.awaiting_commit = self.awaiting_commit, []
+        for target_path, callback in awaiting:
+            try:
+                callback(target_path not in failed)
+            except Exception as e:
+                logging.warning(f"Could not record the copy to {target_path}: {str(e)}")
+        
+    def report_target_error(self, target_folder, message):
+        error_msg = f"[{target_folder}] {message}"
+        self.app.log_message(error_msg, 'error')
+        logging.error(error_msg)
+            
+    def remove_empty_parents(self, target_folder, target_path):
+        dir_path = os.path.dirname(target_path)
+        while dir_path != target_folder:
+            try:
+                if os.path.exists(dir_path) and len(os.listdir(dir_path)) == 0:
+                    # Handle read-only directories
+                    if not os.access(dir_path, os.W_OK):
+                        os.chmod(dir_path, stat.S_IWRITE)
+                    os.rmdir(dir_path)
+                    logging.info(f"Removed empty directory: {os.path.relpath(dir_path, target_folder)}")
+                else:
+                    break
+            except (PermissionError, OSError) as e:
+                logging.warning(f"Could not remove directory {dir_path}: {str(e)}")
+                break
+            dir_path = os.path.dirname(dir_path)
+            
+    def move_single_file(self, target_folder, old_rel_path, new_rel_path):
+        """Rename a file or directory on the target instead of copying it again"""
+        try:
+            old_path = os.path.join(target_folder, old_rel_path)
+            new_path = os.path.join(target_folder, new_rel_path)
+            if not os.path.exists(old_path) or os.path.exists(new_path):
+                return False
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
+            os.rename(old_path, new_path)
+            logging.info(f"Moved: {old_rel_path} → {new_rel_path}")
+            self.remove_empty_parents(target_folder, old_path)
+            return True
+        except Exception as e:
+            error_msg = f"Error moving {old_rel_path} to {new_rel_path}: {str(e)}"
+            self.app.log_message(error_msg, 'error')
+            logging.error(error_msg)
+            return False
+            
+    def use_delta(self, source_file, target_file):
+        """Large files that already exist on the target are updated in place, unless a reflink is possible"""
+        if self.delta_threshold <= 0:
+            return False
+        try:
+            source_stat = os.stat(source_file)
+            target_stat = os.stat(target_file)
+        except OSError:
+            return False
+        return (source_stat.st_size >= self.delta_threshold and
+                not self.copy_backend.may_reflink(source_stat.st_dev, target_stat.st_dev))
+            
+    def use_checkpoints(self, source_file, target_file):
+        """Large copies that cannot be reflinked are resumable when a journal is available"""
+        if not (self.journal and self.resume) or self.resume_threshold <= 0:
+            return False
+        try:
+            source_stat = os.stat(source_file)
+            target_dev = os.stat(os.path.dirname(target_file)).st_dev
+        except OSError:
+            return False
+        return (source_stat.st_size >= self.resume_threshold and
+                not self.copy_backend.may_reflink(source_stat.st_dev, target_dev))
+            
+    def copy_checkpointed(self, source_file, target_file, rel_path, cancel_check=None):
+        """Copy a large file into a partial file next to the target, recording progress after each chunk
+        
+        Each chunk is flushed to disk before its checkpoint is stored, so an
+        interrupted copy of the same source version continues from the last
+        checkpoint instead of starting over. The target is replaced in one
+        rename once the copy is complete. Returns False if cancelled.
+        """
+        partial = partial_path(target_file)
+        with open(source_file, 'rb') as fsrc:
+            source_stat = os.fstat(fsrc.fileno())
+            size, mtime = source_stat.st_size, source_stat.st_mtime
+            offset = self.journal.checkpoint(target_file, size, mtime) if os.path.exists(partial) else 0
+            offset = min(offset, os.path.getsize(partial)) if offset else 0
+            if offset:
+                logging.info(f"Resuming copy of {rel_path} at {offset} of {size} bytes")
+            with open(partial, 'r+b' if offset else 'wb') as fdst:
+                fdst.truncate(offset)
+                while offset < size:
+                    if cancel_check and cancel_check():
+                        logging.info(f"Copy of {rel_path} stopped at {offset} of {size} bytes; it resumes next sync")
+                        return False
+                    copied = self.copy_backend.copy_range(fsrc, fdst, offset, min(CHECKPOINT_INTERVAL, size - offset))
+                    if copied == 0:
+                        # The source shrank while being copied
+                        break
+                    offset += copied
+                    os.fsync(fdst.fileno())
+                    self.journal.save_checkpoint(target_file, size, mtime, offset)
+        shutil.copystat(source_file, partial)
+        self.copy_backend.durability.publish(partial, target_file, size)
+        
+        def clear_checkpoint(committed):
+            # Until the rename is committed the partial file is still the one to resume from
+            if committed:
+                self.journal.clear_checkpoint(target_file)
+        self.after_commit(target_file, clear_checkpoint)
+        logging.info(f"Synced file: {rel_path} (checkpointed, {size} bytes)")
+        return True
+            
     def delete_single_file(self, target_folder, rel_path):
         try:
             target_path = os.path.join(target_folder, rel_path)
@@ -111,21 +391,7 @@ class SyncEngine:
                     logging.info(f"Deleted file: {rel_path}")
                 
                 # Clean up empty parent directories
-                dir_path = os.path.dirname(target_path)
-                while dir_path != target_folder:
-                    try:
-                        if os.path.exists(dir_path) and len(os.listdir(dir_path)) == 0:
-                            # Handle read-only directories
-                            if not os.access(dir_path, os.W_OK):
-                                os.chmod(dir_path, stat.S_IWRITE)
-                            os.rmdir(dir_path)
-                            logging.info(f"Removed empty directory: {os.path.relpath(dir_path, target_folder)}")
-                        else:
-                            break
-                    except (PermissionError, OSError) as e:
-                        logging.warning(f"Could not remove directory {dir_path}: {str(e)}")
-                        break
-                    dir_path = os.path.dirname(dir_path)
+                self.remove_empty_parents(target_folder, target_path)
                 return True
         except PermissionError as e:
             error_msg = f"Permission denied deleting {rel_path}: {str(e)}"
@@ -138,66 +404,425 @@ class SyncEngine:
             logging.error(error_msg, exc_info=True)
             return False
 
-    def sync_folders(self, source_folder, target_folder, gitignore_patterns, additional_patterns,
-                    delete_files=True, trial_run=False, progress_callback=None, cancel_check=None):
+    def touch_single_file(self, source_folder, target_folder, rel_path):
+        """Copy only the timestamps of a source file whose content matches the target"""
         try:
-            # Get all files in both directories
-            source_files = self.get_all_files(source_folder, gitignore_patterns, additional_patterns)
-            target_files = self.get_all_files(target_folder, gitignore_patterns, additional_patterns)
+            st = os.stat(os.path.join(source_folder, rel_path))
+            os.utime(os.path.join(target_folder, rel_path), ns=(st.st_atime_ns, st.st_mtime_ns))
+            logging.info(f"Updated timestamp: {rel_path}")
+            return True
+        except Exception as e:
+            error_msg = f"Error updating timestamp of {rel_path}: {str(e)}"
+            self.app.log_message(error_msg, 'error')
+            logging.error(error_msg)
+            return False
             
-            # Files to copy (new or modified)
+    def plan_copies(self, source_folder, target_folder, source_files, target_files, compare_mode='mtime'):
+        """Split source files into those that need copying and those that only need a timestamp update
+        
+        In 'mtime' mode a file is copied when the source is newer. In 'hash' mode
+        files of different size are copied, and files of equal size but different
+        mtime are compared by content hash.
+        """
+        if isinstance(source_files, FileTree):
+            # Keep the plan as file ids of the scanned tree rather than path strings
+            files_to_copy = PathList(source_files)
+            entries = source_files.entries()
+        else:
             files_to_copy = []
-            for rel_path in source_files:
-                source_file = os.path.join(source_folder, rel_path)
-                target_file = os.path.join(target_folder, rel_path)
+            entries = ((rel_path, rel_path, stats) for rel_path, stats in source_files.items())
+        candidates = []
+        use_hash = compare_mode == 'hash' and self.hash_cache is not None
+        for key, rel_path, (source_size, source_mtime) in entries:
+            target = target_files.get(rel_path)
+            if target is None:
+                files_to_copy.append(key)
+            elif use_hash:
+                if source_size != target[0]:
+                    files_to_copy.append(key)
+                elif source_mtime != target[1]:
+                    candidates.append(rel_path)
+            elif source_mtime > target[1]:
+                files_to_copy.append(key)
+        
+        files_to_touch = []
+        if candidates:
+            hashed_before = self.hash_cache.hashed_count
+            source_paths = [os.path.join(source_folder, rel_path) for rel_path in candidates]
+            target_paths = [os.path.join(target_folder, rel_path) for rel_path in candidates]
+            digests = self.hash_cache.hash_files(source_paths + target_paths)
+            for rel_path, source_path, target_path in zip(candidates, source_paths, target_paths):
+                source_digest = digests.get(source_path)
+                if source_digest is not None and source_digest == digests.get(target_path):
+                    files_to_touch.append(rel_path)
+                else:
+                    files_to_copy.append(rel_path)
+            logging.info(f"Compared {len(candidates)} files by content "
+                         f"({self.hash_cache.hashed_count - hashed_before} hashed, rest from cache)")
+        return files_to_copy, files_to_touch
+            
+    def recheck_moved(self, source_folder, target_folder, source_stats, target_stats):
+        """Split moved files whose timestamps differ into (to_copy, to_touch)
+        
+        A rename matched by inode says nothing about the content, which may
+        have been edited as well, so only files whose hashes agree keep the
+        moved copy and get a timestamp update; without the hash cache they
+        are all copied. Both dicts are keyed by the new path.
+        """
+        if self.hash_cache is None:
+            return list(source_stats), []
+        return self.plan_copies(source_folder, target_folder, source_stats, target_stats, 'hash')
+            
+    def plan_subtree(self, source_folder, target_folder, rel_dir, delete_files=True):
+        """Compare one directory subtree of source and target, returning (to_copy, to_touch, to_delete)"""
+        matcher = self.current_matcher(source_folder)
+        source_files, target_files = self.scan_concurrently(
+            lambda: self.scan_folder(source_folder, matcher, rel_dir, self.source_scan_threads),
+            lambda: self.scan_folder(target_folder, matcher, rel_dir, self.target_scan_threads))
+        files_to_copy, files_to_touch = self.plan_copies(source_folder, target_folder, source_files, target_files)
+        files_to_delete = sorted(target_files.difference(source_files)) if delete_files else []
+        return files_to_copy, files_to_touch, files_to_delete
+        
+    def sync_changes(self, source_folder, target_folder, changes, delete_files=True):
+        """Apply a batch of coalesced monitor changes: renames first, then deletions, then copies
+        
+        The changes were already filtered against the exclusion snapshot when
+        the events arrived, so they are not checked again here. Directory
+        changes are applied as whole subtrees: a renamed directory is renamed
+        on the target, a deleted one is removed with one rmtree, and a new one
+        (or one the monitor marked for a 'rescan') is compared against the
+        target with a scan of just that subtree.
+        Directory renames run before everything else, since the coalescer
+        re-roots pending changes inside a renamed directory at its new path.
+        
+        Returns {'copied': [...], 'moved': [(old, new), ...], 'deleted': [...], 'failed': [...]},
+        failed holding the files that could not be copied.
+        """
+        results = {'copied': [], 'moved': [], 'deleted': [], 'failed': []}
+        to_copy = {}
+        subtrees = []
+        for change in changes:
+            if change.kind != 'dir_moved':
+                continue
+            if delete_files and self.move_single_file(target_folder, change.src_path, change.path):
+                results['moved'].append((change.src_path, change.path))
+                continue
+            # Old directory missing on the target, new one in the way, or deletions are off
+            subtrees.append(change.path)
+            if delete_files and self.delete_single_file(target_folder, change.src_path):
+                results['deleted'].append(change.src_path)
                 
-                needs_update = True
-                if os.path.exists(target_file):
-                    source_mtime = os.path.getmtime(source_file)
-                    target_mtime = os.path.getmtime(target_file)
-                    needs_update = source_mtime > target_mtime
+        for change in changes:
+            if change.kind == 'dir_deleted':
+                if delete_files and self.delete_single_file(target_folder, change.path):
+                    results['deleted'].append(change.path)
+            elif change.kind in ('dir_created', 'rescan'):
+                subtrees.append(change.path)
+            elif change.kind == 'moved':
+                if delete_files and self.move_single_file(target_folder, change.src_path, change.path):
+                    results['moved'].append((change.src_path, change.path))
+                    continue
+                # Old path missing on the target, rename failed, or deletions are off
+                to_copy[change.path] = None
+                if delete_files and self.delete_single_file(target_folder, change.src_path):
+                    results['deleted'].append(change.src_path)
+            elif change.kind == 'deleted':
+                if delete_files and self.delete_single_file(target_folder, change.path):
+                    results['deleted'].append(change.path)
+            elif change.kind in ('created', 'modified'):
+                to_copy[change.path] = None
                 
-                if needs_update:
-                    files_to_copy.append(rel_path)
+        for rel_dir in subtrees:
+            files_to_copy, files_to_touch, files_to_delete = self.plan_subtree(
+                source_folder, target_folder, rel_dir, delete_files)
+            logging.info(f"Scanned subtree {rel_dir}: {len(files_to_copy)} to copy, "
+                         f"{len(files_to_delete)} to delete")
+            for rel_path in files_to_delete:
+                if self.delete_single_file(target_folder, rel_path):
+                    results['deleted'].append(rel_path)
+            for rel_path in files_to_touch:
+                self.touch_single_file(source_folder, target_folder, rel_path)
+            to_copy.update(dict.fromkeys(files_to_copy))
+        
+        def copy_one(rel_path):
+            return self.copy_file(source_folder, target_folder, rel_path)
+            
+        def record_copy(rel_path, copied):
+            if copied:
+                results['copied'].append(rel_path)
+            else:
+                results['failed'].append(rel_path)
+                
+        def on_copied(rel_path, copied):
+            if copied:
+                self.after_commit(os.path.join(target_folder, rel_path),
+                                  lambda committed: record_copy(rel_path, committed))
+            else:
+                record_copy(rel_path, False)
+        
+        CopyExecutor(self.copy_workers, pool=self.io_pool).run(list(to_copy), copy_one, on_copied)
+        self.commit_writes()
+        return results
+            
+    def plan_moves(self, source_folder, target_folder, source_files, target_files,
+                   files_to_copy, files_to_delete, source_snapshot=None, previous_source_files=None,
+                   collapse=True):
+        """Find new source files that are renames of target files due for deletion
+        
+        Matches on size plus either the inode recorded by the metadata index or
+        a content hash. Returns (moves, moved_files) where moves is a list of
+        (old, new, old_files) file or directory renames and moved_files maps
+        each moved old file path to its new path. Directory renames need every
+        target file in target_files; without them, pass collapse=False to
+        keep to file renames.
+        """
+        new_paths = [rel_path for rel_path in files_to_copy if rel_path not in target_files]
+        if not new_paths or not files_to_delete:
+            return [], {}
+        
+        source_inodes = previous_inodes = None
+        if source_snapshot is not None and previous_source_files is not None:
+            source_inodes = {}
+            for rel_path in new_paths:
+                entry = source_snapshot.files.get(os.path.dirname(rel_path), {}).get(os.path.basename(rel_path))
+                if entry:
+                    source_inodes[rel_path] = entry[2]
+            previous_inodes = {}
+            for rel_dir, listing in previous_source_files.items():
+                for name, entry in listing.items():
+                    rel_path = os.path.join(rel_dir, name)
+                    if rel_path not in source_files:
+                        previous_inodes[entry[2]] = rel_path
+        
+        digests = None
+        if self.hash_cache is not None:
+            new_sizes = {source_files[rel_path][0] for rel_path in new_paths}
+            old_candidates = [rel_path for rel_path in files_to_delete
+                              if target_files[rel_path][0] in new_sizes and target_files[rel_path][0] > 0]
+            old_sizes = {target_files[rel_path][0] for rel_path in old_candidates}
+            new_candidates = [rel_path for rel_path in new_paths if source_files[rel_path][0] in old_sizes]
+            if old_candidates and new_candidates:
+                paths = {os.path.join(source_folder, rel_path): ('source', rel_path) for rel_path in new_candidates}
+                paths.update({os.path.join(target_folder, rel_path): ('target', rel_path) for rel_path in old_candidates})
+                digests = {paths[path]: digest for path, digest in self.hash_cache.hash_files(list(paths)).items()}
+        
+        moved_files = match_moves(new_paths, files_to_delete, source_files, target_files,
+                                  source_inodes, previous_inodes, digests)
+        if not moved_files:
+            return [], {}
+        if collapse:
+            moves = collapse_directory_moves(moved_files, target_files, target_folder)
+        else:
+            moves = [(old_path, new_path, [old_path]) for old_path, new_path in moved_files.items()]
+        logging.info(f"Detected {len(moved_files)} moved files ({len(moves)} rename operations)")
+        return moves, moved_files
+            
+    def sync_folders(self, source_folder, target_folder, gitignore_patterns, additional_patterns,
+                    delete_files=True, trial_run=False, progress_callback=None, cancel_check=None,
+                    use_index=False, compare_mode='mtime', plan_path=None):
+        """Sync source into target, returning (copied, deleted)
+        
+        A trial run given plan_path also saves what it would do, with the
+        metadata it was based on, as a SyncPlan that apply_plan can carry out
+        later without scanning again.
+        """
+        source_snapshot = None
+        target_snapshot = None
+        previous_source_files = None
+        plan = None
+        failed = False
+        # Counts of an interrupted sync finished before this one
+        resumed_copied, resumed_deleted = 0, 0
+        # Files whose copy, timestamp update or deletion failed, so their directories are not recorded as synced
+        unsynced = set()
+        try:
+            # Compile the exclusion rules once; the source's rules apply to both trees
+            matcher = self.get_matcher(source_folder, gitignore_patterns, additional_patterns, refresh=True)
+            
+            if self.journal and self.resume and not trial_run:
+                options = {'gitignore': list(gitignore_patterns), 'additional': list(additional_patterns),
+                           'delete_files': delete_files, 'compare_mode': compare_mode}
+                resumed = self.journal.pending(source_folder, target_folder, options)
+                if resumed and resumed.operations:
+                    resumed_copied, resumed_deleted = self.resume_sync(resumed, source_folder, target_folder,
+                                                                       progress_callback, cancel_check)
+                    if cancel_check and cancel_check():
+                        return resumed_copied, resumed_deleted
+                    # Then sync as usual, for changes made since the interruption and what a plan cut short missed
+                    self.app.log_message("Syncing changes made since the interrupted sync", 'info')
+                plan = self.journal.begin(source_folder, target_folder, options)
+            
+            # Saving a plan needs the full listings, so it always uses the planned sync
+            if self.streaming and not (use_index and self.metadata_index) and not (trial_run and plan_path):
+                copied_count, deleted_count = self.stream_sync(source_folder, target_folder, matcher, delete_files,
+                                                               trial_run, progress_callback, cancel_check,
+                                                               compare_mode, plan)
+                return resumed_copied + copied_count, resumed_deleted + deleted_count
+            
+            if use_index and self.metadata_index:
+                # Reuse stored listings for directories whose mtime is unchanged
+                self.index_stats = {'stats_performed': 0, 'dirs_scanned': 0, 'dirs_reused': 0}
+                source_snapshot = self.metadata_index.load(source_folder)
+                target_snapshot = self.metadata_index.load(target_folder)
+                previous_source_files = dict(source_snapshot.files)
+                source_files, target_files = self.scan_concurrently(
+                    lambda: self.get_indexed_files(source_folder, source_snapshot, matcher,
+                                                   self.source_scan_threads),
+                    lambda: self.get_indexed_files(target_folder, target_snapshot, matcher,
+                                                   self.target_scan_threads))
+            else:
+                # Get all files in both directories along with their size and mtime, scanning both at once
+                source_files, target_files = self.scan_concurrently(
+                    lambda: self.scan_folder(source_folder, matcher, threads=self.source_scan_threads),
+                    lambda: self.scan_folder(target_folder, matcher, threads=self.target_scan_threads))
+            
+            # Files to copy (new or modified) and files whose timestamp alone is out of date
+            files_to_copy, files_to_touch = self.plan_copies(source_folder, target_folder,
+                                                             source_files, target_files, compare_mode)
             
             # Files to delete
-            files_to_delete = []
+            files_to_delete = PathList(target_files)
             if delete_files:
-                files_to_delete = [f for f in target_files if f not in source_files]
+                files_to_delete = target_files.difference(source_files)
+            
+            # Renamed files become target renames instead of a copy plus a delete
+            moves, moved_files = [], {}
+            if files_to_delete:
+                moves, moved_files = self.plan_moves(source_folder, target_folder, source_files, target_files,
+                                                     files_to_copy, files_to_delete, source_snapshot,
+                                                     previous_source_files)
+                if moved_files:
+                    moved_new_paths = set(moved_files.values())
+                    files_to_copy = files_to_copy.without(moved_new_paths)
+                    files_to_delete = files_to_delete.without(moved_files)
+            
+            if trial_run and plan_path:
+                self.save_plan(plan_path, source_folder, target_folder, source_files, target_files, moves,
+                               files_to_copy, files_to_touch, files_to_delete if delete_files else (),
+                               {'delete_files': delete_files, 'compare_mode': compare_mode})
             
             # Log sync operation details
             logging.info(f"Starting {'trial run' if trial_run else 'sync'}")
             logging.info(f"Files to copy: {len(files_to_copy)}")
+            if moves:
+                logging.info(f"Files to move: {len(moved_files)}")
+            if files_to_touch:
+                logging.info(f"Files needing only a timestamp update: {len(files_to_touch)}")
             logging.info(f"Files to delete: {len(files_to_delete)}")
             
             # Calculate total operations
-            total_operations = len(files_to_copy) + len(files_to_delete)
+            total_operations = len(moves) + len(files_to_copy) + len(files_to_touch) + len(files_to_delete)
             if total_operations == 0:
                 logging.info("No changes needed")
-                return 0, 0  # No changes needed
+                return resumed_copied, resumed_deleted  # No changes needed
+            
+            if plan:
+                # Persist the plan so an interrupted sync resumes without rescanning
+                for old_path, new_path, _ in moves:
+                    plan.add('move', old_path, new_path)
+                for kind, rel_paths in (('copy', files_to_copy), ('touch', files_to_touch),
+                                        ('delete', files_to_delete if delete_files else ())):
+                    for rel_path in rel_paths:
+                        plan.add(kind, rel_path)
+                plan.mark_complete()
             
             completed_operations = 0
             copied_count = 0
+            moved_count = 0
             deleted_count = 0
+            methods_before = self.copy_backend.snapshot_counts()
+            delta_before = self.delta_stats.snapshot()
             
-            # Copy files
-            for rel_path in files_to_copy:
+            # Apply renames first; any that fail fall back to copy plus delete
+            for old_path, new_path, old_files in moves:
                 if cancel_check and cancel_check():
-                    logging.info("Sync operation cancelled by user")
                     break
-                    
+                if trial_run:
+                    logging.info(f"Would move: {old_path} → {new_path}")
+                    moved_count += len(old_files)
+                elif self.move_single_file(target_folder, old_path, new_path):
+                    moved_count += len(old_files)
+                    # Files whose timestamps differ may have been edited too; check them before trusting the move
+                    stale = [old_file for old_file in old_files
+                             if source_files[moved_files[old_file]][1] != target_files[old_file][1]]
+                    if stale:
+                        stale_copy, stale_touch = self.recheck_moved(
+                            source_folder, target_folder,
+                            {moved_files[old_file]: source_files[moved_files[old_file]] for old_file in stale},
+                            {moved_files[old_file]: target_files[old_file] for old_file in stale})
+                        files_to_copy.extend(stale_copy)
+                        files_to_touch.extend(stale_touch)
+                        total_operations += len(stale)
+                    if target_snapshot:
+                        target_snapshot.invalidate_dir(os.path.dirname(old_path))
+                        target_snapshot.invalidate_dir(os.path.dirname(new_path))
+                else:
+                    files_to_copy.extend(moved_files[old_file] for old_file in old_files)
+                    files_to_delete.extend(old_files)
+                    total_operations += 2 * len(old_files)
+                if plan:
+                    # A resume re-checks the move; the fallbacks above are covered by the next full sync
+                    plan.mark_done('move', old_path)
+                completed_operations += 1
+                if progress_callback:
+                    progress_callback((completed_operations / total_operations) * 100)
+            
+            def copy_one(rel_path):
                 if trial_run:
                     logging.info(f"Would copy: {rel_path}")
+                    return True
+                # Scanned paths already passed the exclusion rules
+                return self.copy_file(source_folder, target_folder, rel_path, cancel_check)
+                
+            def record_copy(rel_path, copied, done):
+                nonlocal copied_count
+                if copied:
                     copied_count += 1
+                    if source_snapshot and not trial_run:
+                        source_snapshot.mark_synced(rel_path, time.time())
+                        target_snapshot.invalidate_dir(os.path.dirname(rel_path))
+                else:
+                    unsynced.add(rel_path)
+                if done:
+                    plan.mark_done('copy', rel_path)
+                
+            def on_copied(rel_path, copied):
+                nonlocal completed_operations
+                done = plan and not (cancel_check and cancel_check())
+                if copied and not trial_run:
+                    # Recorded once the copy is in place, which the 'batch' fsync mode defers
+                    self.after_commit(os.path.join(target_folder, rel_path),
+                                      lambda committed: record_copy(rel_path, committed, done))
                 else:
-                    if self.sync_single_file(source_folder, target_folder, rel_path,
-                                          gitignore_patterns, additional_patterns):
-                        copied_count += 1
+                    record_copy(rel_path, copied, done)
                 
                 completed_operations += 1
                 if progress_callback:
                     progress_callback((completed_operations / total_operations) * 100)
             
+            # Copy files, several at a time unless configured for a single worker
+            executor = CopyExecutor(1 if trial_run else self.copy_workers, pool=self.io_pool)
+            if not executor.run(files_to_copy, copy_one, on_copied, cancel_check):
+                logging.info("Sync operation cancelled by user")
+            self.commit_writes()
+            
+            # Update timestamps of files whose content already matches
+            for rel_path in files_to_touch:
+                if cancel_check and cancel_check():
+                    break
+                if trial_run:
+                    logging.info(f"Would update timestamp: {rel_path}")
+                elif self.touch_single_file(source_folder, target_folder, rel_path):
+                    if target_snapshot:
+                        target_snapshot.invalidate_dir(os.path.dirname(rel_path))
+                else:
+                    unsynced.add(rel_path)
+                if plan:
+                    plan.mark_done('touch', rel_path)
+                completed_operations += 1
+                if progress_callback:
+                    progress_callback((completed_operations / total_operations) * 100)
+            
             # Delete files
             if delete_files:
                 for rel_path in files_to_delete:
@@ -211,31 +836,946 @@ class SyncEngine:
                     else:
                         if self.delete_single_file(target_folder, rel_path):
                             deleted_count += 1
+                            if target_snapshot:
+                                target_snapshot.invalidate_dir(os.path.dirname(rel_path))
+                        else:
+                            unsynced.add(rel_path)
+                        if plan:
+                            plan.mark_done('delete', rel_path)
                     
                     completed_operations += 1
                     if progress_callback:
                         progress_callback((completed_operations / total_operations) * 100)
             
-            logging.info(f"Sync completed: {copied_count} copied, {deleted_count} deleted")
-            return copied_count, deleted_count
+            logging.info(f"Sync completed: {copied_count} copied, {moved_count} moved, {deleted_count} deleted")
+            if copied_count and not trial_run:
+                methods_used = self.copy_backend.summary(since=methods_before)
+                if methods_used:
+                    logging.info(f"Copy methods used: {methods_used}")
+                delta_files, delta_written, delta_total = (
+                    now - before for now, before in zip(self.delta_stats.snapshot(), delta_before))
+                if delta_files:
+                    logging.info(f"Delta transfer: {delta_files} files, wrote {delta_written} of {delta_total} bytes")
+            return resumed_copied + copied_count, resumed_deleted + deleted_count
             
         except Exception as e:
+            failed = True
             error_msg = f"Error during sync: {str(e)}"
             self.app.log_message(error_msg, 'error')
             logging.error(error_msg, exc_info=True)
-            return 0, 0
+            return resumed_copied, resumed_deleted
+        finally:
+            if plan:
+                self.close_plan(plan, failed or (cancel_check and cancel_check()))
+            # Trial, cancelled and failed runs leave the index and the synced state as they were,
+            # since the scanned listings were not (all) applied to the target
+            if (source_snapshot and target_snapshot and not trial_run and not failed and
+                    not (cancel_check and cancel_check())):
+                self.save_index(source_snapshot, target_snapshot)
+                self.save_synced_state(source_snapshot, unsynced)
             
-    def get_all_files(self, folder, gitignore_patterns, additional_patterns):
-        files = set()
+    def save_plan(self, plan_path, source_folder, target_folder, source_files, target_files, moves,
+                  files_to_copy, files_to_touch, files_to_delete, options):
+        plan = SyncPlan(os.path.abspath(source_folder), os.path.abspath(target_folder), options)
+        for old_path, new_path, _ in moves:
+            # Directory moves have no stats of their own; applying them only checks that the paths are free
+            plan.add('move', old_path, source_files.get(new_path), target_files.get(old_path), new_path)
+        for kind, rel_paths in (('copy', files_to_copy), ('touch', files_to_touch)):
+            for rel_path in rel_paths:
+                plan.add(kind, rel_path, source_files.get(rel_path), target_files.get(rel_path))
+        for rel_path in files_to_delete:
+            plan.add('delete', rel_path, None, target_files.get(rel_path))
+        plan.save(plan_path)
+        counts = plan.counts()
+        self.app.log_message(f"Saved sync plan to {plan_path}: " +
+                             ", ".join(f"{count} {kind}" for kind, count in counts.items()), 'info')
+        
+    def apply_plan(self, plan, progress_callback=None, cancel_check=None, stale='replan'):
+        """Carry out a SyncPlan from a trial run without rescanning either folder
+        
+        Each entry is first checked with a stat of the files it touches: it
+        is applied as planned only while both sides still have the size and
+        mtime recorded in the plan. Entries that changed since are skipped
+        with stale='reject', or with stale='replan' decided again from the
+        current state of those files alone, the way a sync would. Returns
+        {'copied', 'moved', 'touched', 'deleted', 'stale', 'rejected'}.
+        """
+        source_folder, target_folder = plan.source, plan.target
+        compare_mode = plan.options.get('compare_mode', 'mtime')
+        delete_files = plan.options.get('delete_files', True)
+        results = {'copied': 0, 'moved': 0, 'touched': 0, 'deleted': 0, 'stale': 0, 'rejected': 0}
+        total_operations = len(plan.entries)
+        completed_operations = 0
+        
+        def current(folder, rel_path):
+            try:
+                st = os.stat(os.path.join(folder, rel_path))
+            except OSError:
+                return None
+            return [st.st_size, st.st_mtime]
+        
+        def advance(count=1):
+            nonlocal completed_operations
+            completed_operations += count
+            if progress_callback and total_operations:
+                progress_callback((completed_operations / total_operations) * 100)
+        
+        def reject(entry):
+            results['stale'] += 1
+            if stale == 'reject':
+                results['rejected'] += 1
+                self.app.log_message(f"Skipped {entry['op']} of {entry['path']}: changed since the trial run",
+                                     'info')
+                return True
+            logging.info(f"Replanning {entry['op']} of {entry['path']}: changed since the trial run")
+            return False
+        
+        def replan_file(rel_path, source_stats, target_stats):
+            """The operation a sync would now do for one file: 'copy', 'touch', 'delete' or None"""
+            if source_stats is None:
+                return 'delete' if target_stats is not None and delete_files else None
+            if target_stats is None:
+                return 'copy'
+            to_copy, to_touch = self.plan_copies(source_folder, target_folder, {rel_path: tuple(source_stats)},
+                                                 {rel_path: tuple(target_stats)}, compare_mode)
+            return 'copy' if to_copy else 'touch' if to_touch else None
+        
+        files_to_copy = []
+        files_to_touch = []
+        files_to_delete = []
+        try:
+            for entry in plan.entries:
+                if cancel_check and cancel_check():
+                    break
+                kind, rel_path = entry['op'], entry['path']
+                if kind == 'move':
+                    new_path = entry['to']
+                    fresh = not os.path.exists(os.path.join(target_folder, new_path))
+                    if entry['target'] is None:
+                        # A directory move
+                        fresh = fresh and os.path.isdir(os.path.join(target_folder, rel_path))
+                    else:
+                        fresh = (fresh and current(target_folder, rel_path) == entry['target'] and
+                                 current(source_folder, new_path) == entry['source'])
+                    if fresh and self.move_single_file(target_folder, rel_path, new_path):
+                        results['moved'] += 1
+                    elif fresh or not reject(entry):
+                        # Fall back to what a sync would do with each of the two paths
+                        for path in (new_path, rel_path):
+                            if os.path.isdir(os.path.join(source_folder, path)):
+                                copies, _, deletes = self.plan_subtree(source_folder, target_folder, path,
+                                                                       delete_files)
+                                files_to_copy.extend(copies)
+                                files_to_delete.extend(deletes)
+                                continue
+                            decision = replan_file(path, current(source_folder, path), current(target_folder, path))
+                            {'copy': files_to_copy, 'touch': files_to_touch, 'delete': files_to_delete}.get(
+                                decision, []).append(path)
+                    advance()
+                    continue
+                source_stats = current(source_folder, rel_path)
+                target_stats = current(target_folder, rel_path)
+                if source_stats == entry['source'] and target_stats == entry['target']:
+                    decision = kind
+                elif reject(entry):
+                    advance()
+                    continue
+                else:
+                    decision = replan_file(rel_path, source_stats, target_stats)
+                if decision is None:
+                    advance()
+                    continue
+                {'copy': files_to_copy, 'touch': files_to_touch, 'delete': files_to_delete}[decision].append(rel_path)
+            
+            total_operations = completed_operations + len(files_to_copy) + len(files_to_touch) + len(files_to_delete)
+            
+            def record_copy(committed):
+                if committed:
+                    results['copied'] += 1
+                    
+            def on_copied(rel_path, copied):
+                if copied:
+                    self.after_commit(os.path.join(target_folder, rel_path), record_copy)
+                advance()
+            
+            executor = CopyExecutor(self.copy_workers, pool=self.io_pool)
+            executor.run(files_to_copy, lambda rel_path: self.copy_file(source_folder, target_folder, rel_path,
+                                                                        cancel_check), on_copied, cancel_check)
+            self.commit_writes()
+            for rel_path in files_to_touch:
+                if cancel_check and cancel_check():
+                    break
+                if self.touch_single_file(source_folder, target_folder, rel_path):
+                    results['touched'] += 1
+                advance()
+            for rel_path in files_to_delete:
+                if cancel_check and cancel_check():
+                    break
+                if self.delete_single_file(target_folder, rel_path):
+                    results['deleted'] += 1
+                advance()
+            logging.info(f"Applied sync plan: {results['copied']} copied, {results['moved']} moved, "
+                         f"{results['touched']} timestamps updated, {results['deleted']} deleted, "
+                         f"{results['stale']} changed since planning ({results['rejected']} skipped)")
+        except Exception as e:
+            error_msg = f"Error applying sync plan: {str(e)}"
+            self.app.log_message(error_msg, 'error')
+            logging.error(error_msg, exc_info=True)
+        return results
+        
+    def close_plan(self, plan, interrupted=False):
+        """Drop a finished sync's journal, or keep an interrupted one for the next sync to resume"""
+        try:
+            if interrupted:
+                plan.flush()
+                self.app.log_message("Sync interrupted; the next sync of these folders resumes where it stopped",
+                                     'info')
+            else:
+                plan.finish()
+        except Exception as e:
+            error_msg = f"Error updating sync journal: {str(e)}"
+            self.app.log_message(error_msg, 'error')
+            logging.error(error_msg, exc_info=True)
+            
+    def resume_sync(self, plan, source_folder, target_folder, progress_callback=None, cancel_check=None):
+        """Finish the remaining operations of an interrupted sync without rescanning, returning (copied, deleted)
+        
+        Every operation is checked against the disk first, so those already
+        done before the interruption cost a stat or two: copies whose target
+        matches the source's size and mtime are skipped, as are deletions of
+        files that reappeared in the source. Large copies continue from their
+        last checkpoint. A plan cut short while planning only has its copies,
+        timestamp updates and renames carried out, since its deletions may
+        include files that a later rename would have claimed. sync_folders
+        follows a resume with a normal sync, which picks up changes made
+        after the plan was stored and whatever the plan was missing.
+        """
+        order = {'move': 0, 'copy': 1, 'touch': 2, 'delete': 3}
+        operations = plan.operations
+        if not plan.complete:
+            operations = [operation for operation in operations if operation[0] != 'delete']
+        operations = sorted(operations, key=lambda operation: order.get(operation[0], 4))
+        total_operations = len(operations)
+        self.app.log_message(f"Resuming interrupted sync: {total_operations} operations left", 'info')
+        completed_operations = 0
+        copied_count = 0
+        deleted_count = 0
+        failed = False
+        
+        def advance():
+            nonlocal completed_operations
+            completed_operations += 1
+            if progress_callback:
+                progress_callback((completed_operations / total_operations) * 100)
+        
+        def needs_copy(rel_path):
+            try:
+                source_stat = os.stat(os.path.join(source_folder, rel_path))
+            except OSError:
+                # Gone from the source since the plan was made
+                return False
+            try:
+                target_stat = os.stat(os.path.join(target_folder, rel_path))
+            except OSError:
+                return True
+            return (source_stat.st_size, source_stat.st_mtime) != (target_stat.st_size, target_stat.st_mtime)
+        
+        try:
+            files_to_copy = [rel_path for kind, rel_path, _ in operations if kind == 'copy']
+            for kind, rel_path, new_path in operations:
+                if cancel_check and cancel_check():
+                    break
+                if kind != 'move':
+                    continue
+                if not self.move_single_file(target_folder, rel_path, new_path) and \
+                        not os.path.exists(os.path.join(target_folder, new_path)):
+                    # The old path is gone too; copy the new one from the source instead
+                    if os.path.isdir(os.path.join(source_folder, new_path)):
+                        files_to_copy.extend(self.plan_subtree(source_folder, target_folder, new_path, False)[0])
+                    else:
+                        files_to_copy.append(new_path)
+                    total_operations += 1
+                plan.mark_done('move', rel_path)
+                advance()
+            
+            def copy_one(rel_path):
+                if not needs_copy(rel_path):
+                    return None
+                return self.copy_file(source_folder, target_folder, rel_path, cancel_check)
+            
+            def record_copy(rel_path, copied, done):
+                nonlocal copied_count
+                if copied:
+                    copied_count += 1
+                if done:
+                    plan.mark_done('copy', rel_path)
+                    
+            def on_copied(rel_path, copied):
+                done = not (cancel_check and cancel_check())
+                if copied:
+                    self.after_commit(os.path.join(target_folder, rel_path),
+                                      lambda committed: record_copy(rel_path, committed, done))
+                else:
+                    record_copy(rel_path, copied, done)
+                advance()
+            
+            executor = CopyExecutor(self.copy_workers, pool=self.io_pool)
+            executor.run(files_to_copy, copy_one, on_copied, cancel_check)
+            self.commit_writes()
+            
+            for kind, rel_path, _ in operations:
+                if cancel_check and cancel_check():
+                    break
+                if kind == 'touch':
+                    if os.path.exists(os.path.join(target_folder, rel_path)):
+                        self.touch_single_file(source_folder, target_folder, rel_path)
+                elif kind == 'delete':
+                    # Skip files that reappeared in the source since the plan was made
+                    if not os.path.lexists(os.path.join(source_folder, rel_path)) and \
+                            self.delete_single_file(target_folder, rel_path):
+                        deleted_count += 1
+                else:
+                    continue
+                plan.mark_done(kind, rel_path)
+                advance()
+            logging.info(f"Resumed sync completed: {copied_count} copied, {deleted_count} deleted")
+        except Exception as e:
+            failed = True
+            error_msg = f"Error resuming sync: {str(e)}"
+            self.app.log_message(error_msg, 'error')
+            logging.error(error_msg, exc_info=True)
+        finally:
+            self.close_plan(plan, failed or (cancel_check and cancel_check()))
+        return copied_count, deleted_count
+            
+    def stream_sync(self, source_folder, target_folder, matcher, delete_files=True, trial_run=False,
+                    progress_callback=None, cancel_check=None, compare_mode='mtime', plan=None):
+        """Sync while both trees are still being walked, returning (copied, deleted)
+        
+        Both folders are walked in sorted order and merge-joined, and each
+        file that needs copying goes to the copy workers as soon as it is
+        found, so the first transfer starts right away and memory holds only
+        the copies in flight rather than every path of both trees. Deletions
+        and timestamp-only updates are collected and applied after the
+        copies, as in a planned sync. With the hash cache enabled, new files
+        are held back (up to STREAM_MOVE_WINDOW at a time, oldest released
+        first) until the walk ends, when they are matched against the
+        deletions by content and renamed on the target instead of copied;
+        renames are per file, as directory renames need the full target
+        listing. Since the total is not known while scanning,
+        progress_callback also receives (completed, discovered, scanning).
+        Copies are added to the journal plan as they are found, so a sync
+        cancelled during the walk resumes the copies it had found; deletions
+        are added once the walk has finished.
+        """
+        use_hash = compare_mode == 'hash' and self.hash_cache is not None
+        # Renames are matched by content, so new files are only held back when they can be hashed
+        detect_moves = delete_files and self.hash_cache is not None
+        files_to_touch = []
+        files_to_delete = []
+        counts = {'discovered': 0, 'completed': 0, 'copied': 0, 'moved': 0, 'deleted': 0}
+        scanning = True
+        
+        def report_progress():
+            if progress_callback:
+                discovered = counts['discovered']
+                percent = (counts['completed'] / discovered) * 100 if discovered else 0
+                progress_callback(percent, counts['completed'], discovered, scanning)
+        
+        def hashed(batch_source, batch_target):
+            files_to_copy, touched = self.plan_copies(source_folder, target_folder, batch_source, batch_target,
+                                                      compare_mode)
+            files_to_touch.extend(touched)
+            if plan:
+                for rel_path in touched:
+                    plan.add('touch', rel_path)
+            counts['discovered'] += len(files_to_copy) + len(touched)
+            batch_source.clear()
+            batch_target.clear()
+            return files_to_copy
+        
+        def apply_moves(held, deleted_stats):
+            """Rename target files due for deletion that match held-back new files; returns the unmatched ones"""
+            moves, moved_files = self.plan_moves(source_folder, target_folder, held, deleted_stats,
+                                                 list(held), list(deleted_stats), collapse=False)
+            if not moved_files:
+                return list(held)
+            files_to_delete[:] = [rel_path for rel_path in files_to_delete if rel_path not in moved_files]
+            counts['discovered'] -= len(moved_files)
+            unmatched = [rel_path for rel_path in held if rel_path not in set(moved_files.values())]
+            for old_path, new_path, _ in moves:
+                if cancel_check and cancel_check():
+                    # Left for the next sync, which copies the new path and deletes the old one
+                    return unmatched
+                if trial_run:
+                    logging.info(f"Would move: {old_path} → {new_path}")
+                    counts['moved'] += 1
+                elif self.move_single_file(target_folder, old_path, new_path):
+                    counts['moved'] += 1
+                    # The content matched, so the timestamp alone may be out of date
+                    if held[new_path][1] != deleted_stats[old_path][1]:
+                        files_to_touch.append(new_path)
+                        counts['discovered'] += 1
+                        if plan:
+                            plan.add('touch', new_path)
+                else:
+                    unmatched.append(new_path)
+                    files_to_delete.append(old_path)
+                    counts['discovered'] += 1
+                counts['completed'] += 1
+                report_progress()
+            return unmatched
+        
+        def operations():
+            nonlocal scanning
+            batch_source, batch_target = {}, {}
+            # New files waiting to be matched against deletions, and the stats of the files to delete
+            held, deleted_stats = {}, {}
+            joined = merge_join(walk_sorted(source_folder, matcher, self.source_scan_threads),
+                                walk_sorted(target_folder, matcher, self.target_scan_threads))
+            for rel_path, source_stats, target_stats in joined:
+                if cancel_check and cancel_check():
+                    return
+                if source_stats is None:
+                    if delete_files:
+                        files_to_delete.append(rel_path)
+                        counts['discovered'] += 1
+                        if detect_moves:
+                            deleted_stats[rel_path] = target_stats
+                    continue
+                if target_stats is None and detect_moves and source_stats[0] > 0:
+                    held[rel_path] = source_stats
+                    counts['discovered'] += 1
+                    if len(held) > STREAM_MOVE_WINDOW:
+                        oldest = next(iter(held))
+                        del held[oldest]
+                        yield oldest
+                    continue
+                if target_stats is not None:
+                    if not use_hash:
+                        if source_stats[1] <= target_stats[1]:
+                            continue
+                    elif source_stats[0] == target_stats[0]:
+                        # Same size: only the content hash can tell whether it changed
+                        if source_stats[1] != target_stats[1]:
+                            batch_source[rel_path] = source_stats
+                            batch_target[rel_path] = target_stats
+                            if len(batch_source) >= STREAM_HASH_BATCH:
+                                yield from hashed(batch_source, batch_target)
+                        continue
+                counts['discovered'] += 1
+                yield rel_path
+            if batch_source:
+                yield from hashed(batch_source, batch_target)
+            scanning = False
+            if held:
+                unmatched = apply_moves(held, deleted_stats) if deleted_stats else list(held)
+                if cancel_check and cancel_check():
+                    return
+                yield from unmatched
+            if plan:
+                # Deletions are journaled last, once the renames have claimed theirs
+                for rel_path in files_to_delete:
+                    plan.add('delete', rel_path)
+                plan.mark_complete()
+            report_progress()
+        
+        def journaled(items):
+            for rel_path in items:
+                plan.add('copy', rel_path)
+                yield rel_path
+        
+        def copy_one(rel_path):
+            if trial_run:
+                logging.info(f"Would copy: {rel_path}")
+                return True
+            # Walked paths already passed the exclusion rules
+            return self.copy_file(source_folder, target_folder, rel_path, cancel_check)
+            
+        def record_copy(rel_path, copied, done):
+            if copied:
+                counts['copied'] += 1
+            if done:
+                plan.mark_done('copy', rel_path)
+                
+        def on_copied(rel_path, copied):
+            done = plan and not (cancel_check and cancel_check())
+            if copied and not trial_run:
+                self.after_commit(os.path.join(target_folder, rel_path),
+                                  lambda committed: record_copy(rel_path, committed, done))
+            else:
+                record_copy(rel_path, copied, done)
+            counts['completed'] += 1
+            report_progress()
+        
+        logging.info(f"Starting streaming {'trial run' if trial_run else 'sync'}")
+        methods_before = self.copy_backend.snapshot_counts()
+        executor = CopyExecutor(1 if trial_run else self.copy_workers, pool=self.io_pool)
+        if not executor.run(journaled(operations()) if plan else operations(), copy_one, on_copied, cancel_check):
+            logging.info("Sync operation cancelled by user")
+        self.commit_writes()
+        
+        for rel_path in files_to_touch:
+            if cancel_check and cancel_check():
+                break
+            if trial_run:
+                logging.info(f"Would update timestamp: {rel_path}")
+            else:
+                self.touch_single_file(source_folder, target_folder, rel_path)
+                if plan:
+                    plan.mark_done('touch', rel_path)
+            counts['completed'] += 1
+            report_progress()
+        
+        for rel_path in files_to_delete:
+            if cancel_check and cancel_check():
+                logging.info("Sync operation cancelled by user")
+                break
+            if trial_run:
+                logging.info(f"Would delete: {rel_path}")
+                counts['deleted'] += 1
+            else:
+                if self.delete_single_file(target_folder, rel_path):
+                    counts['deleted'] += 1
+                if plan:
+                    plan.mark_done('delete', rel_path)
+            counts['completed'] += 1
+            report_progress()
+        
+        logging.info(f"Sync completed: {counts['copied']} copied, {counts['moved']} moved, "
+                     f"{len(files_to_touch)} timestamps updated, {counts['deleted']} deleted")
+        if counts['copied'] and not trial_run:
+            methods_used = self.copy_backend.summary(since=methods_before)
+            if methods_used:
+                logging.info(f"Copy methods used: {methods_used}")
+        return counts['copied'], counts['deleted']
+            
+    def sync_to_targets(self, source_folder, target_folders, gitignore_patterns, additional_patterns,
+                        delete_files=True, trial_run=False, progress_callback=None, cancel_check=None,
+                        compare_mode='mtime'):
+        """Sync one source folder to several targets from a single scan and a single read of each file
+        
+        Every target gets its own plan (renames, copies, timestamp updates
+        and deletions) against the one source listing. Each file that any
+        target needs is then read once and written to all targets needing
+        it, so source I/O does not grow with the number of targets.
+        progress_callback receives (target_folder, percent). Returns
+        {target_folder: {'copied', 'moved', 'deleted', 'errors'}}.
+        """
+        results = {target_folder: {'copied': 0, 'moved': 0, 'deleted': 0, 'errors': 0}
+                   for target_folder in target_folders}
+        progress = {target_folder: [0, 0] for target_folder in target_folders}
+        
+        def advance(target_folder, count=1):
+            done_total = progress[target_folder]
+            done_total[0] += count
+            if progress_callback and done_total[1]:
+                progress_callback(target_folder, (done_total[0] / done_total[1]) * 100)
+                
+        try:
+            matcher = self.get_matcher(source_folder, gitignore_patterns, additional_patterns, refresh=True)
+            # The source and every target are scanned at once
+            scanned = self.scan_concurrently(
+                *[lambda folder=target_folder: self.scan_folder(folder, matcher, threads=self.target_scan_threads)
+                  for target_folder in target_folders],
+                lambda: self.scan_folder(source_folder, matcher, threads=self.source_scan_threads))
+            source_files = scanned[-1]
+            plans = {}
+            for target_folder, target_files in zip(target_folders, scanned):
+                files_to_copy, files_to_touch = self.plan_copies(source_folder, target_folder,
+                                                                 source_files, target_files, compare_mode)
+                files_to_delete = target_files.difference(source_files) if delete_files else PathList(target_files)
+                moves, moved_files = [], {}
+                if files_to_delete:
+                    moves, moved_files = self.plan_moves(source_folder, target_folder, source_files, target_files,
+                                                         files_to_copy, files_to_delete)
+                    if moved_files:
+                        moved_new_paths = set(moved_files.values())
+                        files_to_copy = files_to_copy.without(moved_new_paths)
+                        files_to_delete = files_to_delete.without(moved_files)
+                plans[target_folder] = (target_files, files_to_copy, files_to_touch, files_to_delete,
+                                        moves, moved_files)
+                progress[target_folder][1] = (len(moves) + len(files_to_copy) + len(files_to_touch) +
+                                              len(files_to_delete))
+                logging.info(f"Plan for {target_folder}: {len(files_to_copy)} to copy, {len(moved_files)} to move, "
+                             f"{len(files_to_touch)} timestamps, {len(files_to_delete)} to delete")
+            
+            # Renames first, per target; failed ones fall back to copy plus delete
+            for target_folder, (target_files, files_to_copy, files_to_touch, files_to_delete,
+                                moves, moved_files) in plans.items():
+                for old_path, new_path, old_files in moves:
+                    if cancel_check and cancel_check():
+                        break
+                    if trial_run:
+                        logging.info(f"Would move in {target_folder}: {old_path} → {new_path}")
+                        results[target_folder]['moved'] += len(old_files)
+                    elif self.move_single_file(target_folder, old_path, new_path):
+                        results[target_folder]['moved'] += len(old_files)
+                        stale = [old_file for old_file in old_files
+                                 if source_files[moved_files[old_file]][1] != target_files[old_file][1]]
+                        if stale:
+                            stale_copy, stale_touch = self.recheck_moved(
+                                source_folder, target_folder,
+                                {moved_files[old_file]: source_files[moved_files[old_file]] for old_file in stale},
+                                {moved_files[old_file]: target_files[old_file] for old_file in stale})
+                            files_to_copy.extend(stale_copy)
+                            files_to_touch.extend(stale_touch)
+                            progress[target_folder][1] += len(stale)
+                    else:
+                        results[target_folder]['errors'] += 1
+                        files_to_copy.extend(moved_files[old_file] for old_file in old_files)
+                        files_to_delete.extend(old_files)
+                        progress[target_folder][1] += 2 * len(old_files)
+                    advance(target_folder)
+            
+            # Each file once, for all the targets that need it
+            needed_by = {}
+            for target_folder, plan in plans.items():
+                for rel_path in plan[1]:
+                    needed_by.setdefault(rel_path, []).append(target_folder)
+                    
+            def copy_one(rel_path):
+                if trial_run:
+                    logging.info(f"Would copy: {rel_path} to {len(needed_by[rel_path])} targets")
+                    return []
+                return self.copy_file_to_targets(source_folder, needed_by[rel_path], rel_path)
+                
+            def record_copy(target_folder, committed):
+                results[target_folder]['copied' if committed else 'errors'] += 1
+                
+            def on_copied(rel_path, failed):
+                if failed is False:
+                    failed = needed_by[rel_path]
+                for target_folder in needed_by[rel_path]:
+                    if target_folder in failed:
+                        record_copy(target_folder, False)
+                    elif trial_run:
+                        record_copy(target_folder, True)
+                    else:
+                        # Counted once the copy is in place, which the 'batch' fsync mode defers
+                        self.after_commit(os.path.join(target_folder, rel_path),
+                                          lambda committed, target_folder=target_folder:
+                                          record_copy(target_folder, committed))
+                    advance(target_folder)
+                    
+            methods_before = self.copy_backend.snapshot_counts()
+            executor = CopyExecutor(1 if trial_run else self.copy_workers, pool=self.io_pool)
+            if not executor.run(list(needed_by), copy_one, on_copied, cancel_check):
+                logging.info("Sync operation cancelled by user")
+            self.commit_writes()
+            
+            for target_folder, (target_files, files_to_copy, files_to_touch, files_to_delete,
+                                moves, moved_files) in plans.items():
+                for rel_path in files_to_touch:
+                    if cancel_check and cancel_check():
+                        break
+                    if trial_run:
+                        logging.info(f"Would update timestamp in {target_folder}: {rel_path}")
+                    elif not self.touch_single_file(source_folder, target_folder, rel_path):
+                        results[target_folder]['errors'] += 1
+                    advance(target_folder)
+                for rel_path in files_to_delete:
+                    if cancel_check and cancel_check():
+                        logging.info("Sync operation cancelled by user")
+                        break
+                    if trial_run:
+                        logging.info(f"Would delete from {target_folder}: {rel_path}")
+                        results[target_folder]['deleted'] += 1
+                    elif self.delete_single_file(target_folder, rel_path):
+                        results[target_folder]['deleted'] += 1
+                    else:
+                        results[target_folder]['errors'] += 1
+                    advance(target_folder)
+            
+            for target_folder, counts in results.items():
+                logging.info(f"Sync to {target_folder} completed: {counts['copied']} copied, "
+                             f"{counts['moved']} moved, {counts['deleted']} deleted, {counts['errors']} errors")
+            if needed_by and not trial_run:
+                methods_used = self.copy_backend.summary(since=methods_before)
+                if methods_used:
+                    logging.info(f"Copy methods used: {methods_used}")
+        except Exception as e:
+            error_msg = f"Error during sync: {str(e)}"
+            self.app.log_message(error_msg, 'error')
+            logging.error(error_msg, exc_info=True)
+        return results
+            
+    def topmost_dirs(self, rel_dirs):
+        """Keep only directories that are not inside another one of the set"""
+        topmost = []
+        for rel_dir in sorted(rel_dirs):
+            if not topmost or not rel_dir.startswith(topmost[-1] + os.sep):
+                topmost.append(rel_dir)
+        return topmost
+        
+    def current_matcher(self, source_folder):
+        snapshot = self.exclusions
+        if snapshot is not None and snapshot.matcher is not None and snapshot.source_folder == source_folder:
+            return snapshot.matcher
+        return self.get_matcher(source_folder, self.read_gitignore(source_folder), [])
+        
+    def catch_up(self, source_folder, target_folder, delete_files=True):
+        """Sync what changed in the source while nothing was monitoring it
+        
+        The synced state kept next to the metadata index is a journal of the
+        source as it was last fully synced: its directory mtimes are compared
+        with the source, and only directories that changed are diffed
+        against the target. New and removed
+        directories become subtree syncs and deletions, and everything is
+        applied through sync_changes. Files are stat'ed even in unchanged
+        directories, so a file rewritten in place is found as well.
+        Without a journal for the folder, a full indexed sync runs instead.
+        Returns a summary dict for reporting.
+        """
+        start_time = time.monotonic()
+        summary = {'full': False, 'dirs_scanned': 0, 'dirs_changed': 0, 'copied': 0, 'moved': 0, 'deleted': 0}
+        snapshot = self.metadata_index.load(source_folder, 'synced')
+        if not snapshot.known:
+            summary['full'] = True
+            exclusions = self.exclusions
+            gitignore_patterns = exclusions.gitignore_patterns if exclusions else self.read_gitignore(source_folder)
+            additional_patterns = exclusions.additional_patterns if exclusions else []
+            copied, deleted = self.sync_folders(source_folder, target_folder, list(gitignore_patterns),
+                                                list(additional_patterns), delete_files, use_index=True)
+            summary.update(copied=copied, deleted=deleted, dirs_scanned=self.index_stats.get('dirs_scanned', 0))
+            summary['duration'] = time.monotonic() - start_time
+            return summary
+            
+        matcher = self.current_matcher(source_folder)
+        previous_dirs = set(snapshot.dirs)
+        self.index_stats = {'stats_performed': 0, 'dirs_scanned': 0, 'dirs_reused': 0}
+        self.get_indexed_files(source_folder, snapshot, matcher, self.source_scan_threads)
+        summary['dirs_scanned'] = self.index_stats['dirs_scanned'] + self.index_stats['dirs_reused']
+        
+        new_dirs = self.topmost_dirs(set(snapshot.dirs) - previous_dirs)
+        removed_dirs = self.topmost_dirs(rel_dir for rel_dir in snapshot.removed
+                                         if not matcher.is_dir_excluded(rel_dir))
+        changes = [Change('dir_created', rel_dir, None) for rel_dir in new_dirs]
+        changes.extend(Change('dir_deleted', rel_dir, None) for rel_dir in removed_dirs)
+        # Directories the walk had to rescan, apart from those inside new directories
+        changed_dirs = [rel_dir for rel_dir in snapshot.dirty
+                        if not any(rel_dir == new_dir or rel_dir.startswith(new_dir + os.sep) for new_dir in new_dirs)]
+        summary['dirs_changed'] = len(changed_dirs) + len(new_dirs) + len(removed_dirs)
+        
+        for rel_dir in changed_dirs:
+            source_listing = {name: entry for name, entry in snapshot.files.get(rel_dir, {}).items()
+                              if not matcher.is_excluded(os.path.join(rel_dir, name))}
+            target_listing = {}
+            try:
+                with os.scandir(os.path.join(target_folder, rel_dir)) as entries:
+                    for entry in entries:
+                        if entry.is_file() and not matcher.is_excluded(os.path.join(rel_dir, entry.name)):
+                            target_listing[entry.name] = entry.stat().st_mtime
+            except FileNotFoundError:
+                pass
+            for name, entry in source_listing.items():
+                target_mtime = target_listing.get(name)
+                if target_mtime is None:
+                    changes.append(Change('created', os.path.join(rel_dir, name), None))
+                elif entry[1] > target_mtime:
+                    changes.append(Change('modified', os.path.join(rel_dir, name), None))
+            changes.extend(Change('deleted', os.path.join(rel_dir, name), None)
+                           for name in target_listing if name not in source_listing)
+            
+        if changes:
+            results = self.sync_changes(source_folder, target_folder, changes, delete_files)
+            summary.update(copied=len(results['copied']), moved=len(results['moved']),
+                           deleted=len(results['deleted']))
+            for rel_path in results['failed']:
+                snapshot.invalidate_dir(os.path.dirname(rel_path))
+        self.metadata_index.save(snapshot)
+        summary['duration'] = time.monotonic() - start_time
+        return summary
+        
+    def scan_journal(self, source_folder, unsynced_dirs=()):
+        """Scan the source's directory mtimes as the next synced state for catch_up, without saving it
+        
+        The caller saves it with save_journal once every change seen so far
+        has been synced. unsynced_dirs are subtrees that may hold changes
+        which were never synced; they are stored as changed so the next
+        catch-up looks at them. Returns None if there is nothing to record.
+        """
+        if not self.metadata_index:
+            return None
+        try:
+            snapshot = self.metadata_index.load(source_folder, 'synced')
+            self.index_stats = {'stats_performed': 0, 'dirs_scanned': 0, 'dirs_reused': 0}
+            self.get_indexed_files(source_folder, snapshot, self.current_matcher(source_folder),
+                                   self.source_scan_threads)
+            for unsynced in unsynced_dirs:
+                for rel_dir in list(snapshot.dirs):
+                    if not unsynced or rel_dir == unsynced or rel_dir.startswith(unsynced + os.sep):
+                        snapshot.invalidate_dir(rel_dir)
+            return snapshot
+        except Exception as e:
+            error_msg = f"Error recording sync journal: {str(e)}"
+            self.app.log_message(error_msg, 'error')
+            logging.error(error_msg, exc_info=True)
+            return None
+            
+    def save_journal(self, snapshot):
         try:
-            for root, _, filenames in os.walk(folder):
-                for filename in filenames:
-                    file_path = os.path.join(root, filename)
-                    if not self.should_exclude(file_path, folder, gitignore_patterns, additional_patterns):
-                        rel_path = os.path.relpath(file_path, folder)
-                        files.add(rel_path)
+            self.metadata_index.save(snapshot)
+        except Exception as e:
+            error_msg = f"Error recording sync journal: {str(e)}"
+            self.app.log_message(error_msg, 'error')
+            logging.error(error_msg, exc_info=True)
+            
+    def save_synced_state(self, source_snapshot, unsynced_paths=()):
+        """Record the source listings a completed sync applied as the synced state for the next catch_up"""
+        try:
+            synced = self.metadata_index.load(source_snapshot.root, 'synced')
+            synced.copy_from(source_snapshot)
+            for rel_path in unsynced_paths:
+                synced.invalidate_dir(os.path.dirname(rel_path))
+            self.metadata_index.save(synced)
+        except Exception as e:
+            error_msg = f"Error recording sync journal: {str(e)}"
+            self.app.log_message(error_msg, 'error')
+            logging.error(error_msg, exc_info=True)
+            
+    def save_index(self, source_snapshot, target_snapshot):
+        try:
+            self.metadata_index.save(source_snapshot)
+            self.metadata_index.save(target_snapshot)
+            logging.info(f"Metadata index: {self.index_stats['stats_performed']} stat calls "
+                         f"({self.index_stats['dirs_reused']} directories reused, "
+                         f"{self.index_stats['dirs_scanned']} rescanned)")
+        except Exception as e:
+            error_msg = f"Error saving metadata index: {str(e)}"
+            self.app.log_message(error_msg, 'error')
+            logging.error(error_msg, exc_info=True)
+            
+    def scan_concurrently(self, *scans):
+        """Run several folder scans at the same time, returning their results in order
+        
+        The last scan runs on the calling thread and the others on helper
+        threads, so a slow network target is listed while the local source is.
+        """
+        if len(scans) == 1:
+            return [scans[0]()]
+        with ThreadPoolExecutor(max_workers=len(scans) - 1, thread_name_prefix='scan-side') as pool:
+            futures = [pool.submit(scan) for scan in scans[:-1]]
+            last = scans[-1]()
+            return [future.result() for future in futures] + [last]
+            
+    def get_indexed_files(self, folder, snapshot, matcher, threads=1):
+        """Walk a folder using stored listings for directories whose mtime has not changed, returning a FileTree
+        
+        Directories are stat'ed and, when changed, listed on up to `threads`
+        threads; the snapshot is only updated from the calling thread. A file
+        edited in place leaves its directory's mtime alone, so the files of a
+        reused listing are still stat'ed, and any difference from the stored
+        size, mtime or inode has the directory listed again.
+        """
+        files = FileTree()
+        seen_dirs = set()
+        scan_time = time.time()
+        stats = {'stats_performed': 0, 'dirs_scanned': 0, 'dirs_reused': 0}
+        
+        def list_dir(rel_dir):
+            abs_dir = os.path.join(folder, rel_dir)
+            try:
+                dir_mtime = os.stat(abs_dir).st_mtime
+            except OSError:
+                return None
+            if (snapshot.is_current(rel_dir, dir_mtime) and
+                    self.listing_unchanged(abs_dir, snapshot.files.get(rel_dir, {}))):
+                listing = snapshot.files.get(rel_dir, {})
+                subdirs = snapshot.subdirs.get(rel_dir, [])
+                changed = False
+            else:
+                listing = {}
+                subdirs = []
+                previous = snapshot.files.get(rel_dir, {})
+                with os.scandir(abs_dir) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.name)
+                        elif entry.is_file():
+                            st = entry.stat()
+                            synced = previous.get(entry.name, [None] * 4)[3]
+                            listing[entry.name] = [st.st_size, st.st_mtime, st.st_ino, synced]
+                changed = True
+            walk_into = [os.path.join(rel_dir, name) for name in subdirs
+                         if not matcher.is_dir_excluded(os.path.join(rel_dir, name))]
+            return (dir_mtime, listing, subdirs, changed), walk_into
+        
+        try:
+            for rel_dir, (dir_mtime, listing, subdirs, changed) in walk_listings('', list_dir, threads):
+                seen_dirs.add(rel_dir)
+                stats['stats_performed'] += 1
+                if changed:
+                    snapshot.replace_dir(rel_dir, dir_mtime, listing, subdirs, scan_time)
+                    stats['dirs_scanned'] += 1
+                else:
+                    stats['dirs_reused'] += 1
+                stats['stats_performed'] += len(listing)
+                files.add_dir(rel_dir, [(name, entry[0], entry[1]) for name, entry in listing.items()
+                                        if not matcher.is_excluded(os.path.join(rel_dir, name))])
+            snapshot.prune(seen_dirs)
+        except Exception as e:
+            error_msg = f"Error scanning directory {folder}: {str(e)}"
+            self.app.log_message(error_msg, 'error')
+            logging.error(error_msg, exc_info=True)
+        # Both sides of a sync may be scanned at once
+        with self.stats_lock:
+            for key, count in stats.items():
+                self.index_stats[key] = self.index_stats.get(key, 0) + count
+        return files
+            
+    def listing_unchanged(self, abs_dir, listing):
+        """Whether every file of a stored directory listing still has its stored size, mtime and inode"""
+        for name, entry in listing.items():
+            try:
+                st = os.stat(os.path.join(abs_dir, name))
+            except OSError:
+                return False
+            if (st.st_size, st.st_mtime, st.st_ino) != tuple(entry[:3]):
+                return False
+        return True
+            
+    def scan_folder(self, folder, matcher, start='', threads=1):
+        """Walk a folder with os.scandir, returning a FileTree of rel_path -> (size, mtime)
+        
+        Excluded directories are dropped before descending, and file metadata
+        comes from the directory entries so no extra stat calls are needed.
+        start limits the walk to one subdirectory; paths stay relative to folder.
+        With several threads, directories are listed concurrently; the result
+        is the same whatever the thread count.
+        """
+        files = FileTree()
+        if start and (matcher.is_dir_excluded(start) or not os.path.isdir(os.path.join(folder, start))):
+            return files
+        
+        def list_dir(rel_dir):
+            listing = []
+            subdirs = []
+            try:
+                with os.scandir(os.path.join(folder, rel_dir)) as entries:
+                    for entry in entries:
+                        rel_path = os.path.join(rel_dir, entry.name)
+                        if entry.is_dir(follow_symlinks=False):
+                            if not matcher.is_dir_excluded(rel_path):
+                                subdirs.append(rel_path)
+                        elif entry.is_file():
+                            if not matcher.is_excluded(rel_path):
+                                st = entry.stat()
+                                listing.append((entry.name, st.st_size, st.st_mtime))
+            except OSError as e:
+                logging.warning(f"Could not scan directory {os.path.join(folder, rel_dir)}: {str(e)}")
+                return [], subdirs
+            return listing, subdirs
+        
+        try:
+            for rel_dir, listing in walk_listings(start, list_dir, threads):
+                files.add_dir(rel_dir, listing)
         except Exception as e:
             error_msg = f"Error scanning directory {folder}: {str(e)}"
             self.app.log_message(error_msg, 'error')
             logging.error(error_msg, exc_info=True)
         return files
+        
+    def get_all_files(self, folder, gitignore_patterns, additional_patterns):
+        """The non-excluded files of folder as a FileTree, which supports `in`, len() and iteration like a set"""
+        return self.scan_folder(folder, self.get_matcher(folder, gitignore_patterns, additional_patterns))
@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import logging
+
+# Added and completed operations are written to disk in batches of this many, or this often
+DONE_BATCH = 500
+DONE_FLUSH_SECONDS = 2.0
+# Plans older than this are not resumed; the next sync plans from scratch
+DEFAULT_RESUME_MAX_AGE = 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plans (
+    id INTEGER PRIMARY KEY,
+    source TEXT,
+    target TEXT,
+    options TEXT,
+    created REAL,
+    complete INTEGER DEFAULT 0,
+    UNIQUE (source, target)
+);
+CREATE TABLE IF NOT EXISTS operations (
+    plan_id INTEGER,
+    kind TEXT,
+    path TEXT,
+    new_path TEXT,
+    done INTEGER DEFAULT 0,
+    PRIMARY KEY (plan_id, kind, path)
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    target TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    copied INTEGER,
+    updated REAL
+);
+"""
+
+class JournalPlan:
+    """One persisted sync plan; operations are added as they are planned and marked done as they complete
+
+    Both are buffered and written in batches, so a crash can lose the last
+    few marks; those operations are redone on resume, and each one is
+    checked against the disk first, so redoing is cheap. A plan not marked
+    complete was cut short while still being planned, so it holds only the
+    operations found so far.
+    """
+    def __init__(self, journal, plan_id, created, operations=(), complete=True):
+        self.journal = journal
+        self.plan_id = plan_id
+        self.created = created
+        self.complete = complete
+        # (kind, path, new_path) still to do when loaded for a resume
+        self.operations = list(operations)
+        self.lock = threading.Lock()
+        # Held across a whole flush so batches reach the database in the order they were taken
+        self.flush_lock = threading.Lock()
+        self.added = []
+        self.done = []
+        self.last_flush = time.monotonic()
+
+    def add(self, kind, path, new_path=None):
+        with self.lock:
+            self.added.append((self.plan_id, kind, path, new_path))
+            due = self._flush_due()
+        if due:
+            self.flush()
+
+    def mark_done(self, kind, path):
+        with self.lock:
+            self.done.append((self.plan_id, kind, path))
+            due = self._flush_due()
+        if due:
+            self.flush()
+
+    def _flush_due(self):
+        """Called with self.lock held"""
+        return (len(self.added) + len(self.done) >= DONE_BATCH or
+                time.monotonic() - self.last_flush >= DONE_FLUSH_SECONDS)
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                added, self.added = self.added, []
+                done, self.done = self.done, []
+                self.last_flush = time.monotonic()
+            if added or done:
+                self.journal._write(added, done)
+
+    def mark_complete(self):
+        """Record that every operation of the sync has been added"""
+        self.flush()
+        self.journal._mark_complete(self.plan_id)
+
+    def finish(self):
+        """Forget the plan once every operation has been attempted"""
+        with self.lock:
+            self.added = []
+            self.done = []
+        self.journal._delete_plan(self.plan_id)
+
+class SyncJournal:
+    """SQLite journal of in-progress syncs, so an interrupted sync can resume
+
+    Holds at most one plan per (source, target) pair, with the operations
+    still to do, and the progress of large copies written in checkpointed
+    chunks. Written by one sync at a time per pair; shared across pairs.
+    """
+    def __init__(self, db_path, max_age=DEFAULT_RESUME_MAX_AGE):
+        self.db_path = db_path
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        with self.lock:
+            conn = self._connect()
+            try:
+                conn.executescript(SCHEMA)
+            finally:
+                conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def begin(self, source, target, options, operations=(), complete=False):
+        """Persist a new plan of (kind, path, new_path) operations, replacing any older one for the pair"""
+        source, target = os.path.abspath(source), os.path.abspath(target)
+        created = time.time()
+        with self.lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    self._delete_pair(conn, source, target)
+                    plan_id = conn.execute("INSERT INTO plans (source, target, options, created, complete) "
+                                           "VALUES (?, ?, ?, ?, ?)",
+                                           (source, target, json.dumps(options, sort_keys=True), created,
+                                            int(complete))).lastrowid
+                    conn.executemany("INSERT OR IGNORE INTO operations (plan_id, kind, path, new_path) "
+                                     "VALUES (?, ?, ?, ?)",
+                                     ((plan_id, kind, path, new_path) for kind, path, new_path in operations))
+            finally:
+                conn.close()
+        return JournalPlan(self, plan_id, created)
+
+    def pending(self, source, target, options):
+        """The unfinished plan for a pair if it is recent and made with the same options, else None
+
+        The plan may be incomplete; see JournalPlan.complete. A plan that
+        cannot be resumed is dropped.
+        """
+        source, target = os.path.abspath(source), os.path.abspath(target)
+        with self.lock:
+            conn = self._connect()
+            try:
+                row = conn.execute("SELECT id, options, created, complete FROM plans WHERE source = ? AND target = ?",
+                                   (source, target)).fetchone()
+                if row is None:
+                    return None
+                plan_id, stored_options, created, complete = row
+                if (stored_options != json.dumps(options, sort_keys=True) or
+                        time.time() - created > self.max_age):
+                    with conn:
+                        self._delete_pair(conn, source, target)
+                    logging.info(f"Dropped interrupted sync plan for {source} -> {target} (outdated)")
+                    return None
+                operations = conn.execute("SELECT kind, path, new_path FROM operations "
+                                          "WHERE plan_id = ? AND done = 0 ORDER BY rowid", (plan_id,)).fetchall()
+            finally:
+                conn.close()
+        return JournalPlan(self, plan_id, created, operations, bool(complete))
+
+    def discard(self, source, target):
+        with self.lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    self._delete_pair(conn, os.path.abspath(source), os.path.abspath(target))
+            finally:
+                conn.close()
+
+    def _delete_pair(self, conn, source, target):
+        for (plan_id,) in conn.execute("SELECT id FROM plans WHERE source = ? AND target = ?",
+                                       (source, target)).fetchall():
+            conn.execute("DELETE FROM operations WHERE plan_id = ?", (plan_id,))
+            conn.execute("DELETE FROM plans WHERE id = ?", (plan_id,))
+
+    def _delete_plan(self, plan_id):
+        with self.lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("DELETE FROM operations WHERE plan_id = ?", (plan_id,))
+                    conn.execute("DELETE FROM plans WHERE id = ?", (plan_id,))
+            finally:
+                conn.close()
+
+    def _write(self, added, done):
+        with self.lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany("INSERT OR IGNORE INTO operations (plan_id, kind, path, new_path) "
+                                     "VALUES (?, ?, ?, ?)", added)
+                    conn.executemany("UPDATE operations SET done = 1 WHERE plan_id = ? AND kind = ? AND path = ?",
+                                     done)
+            finally:
+                conn.close()
+
+    def _mark_complete(self, plan_id):
+        with self.lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("UPDATE plans SET complete = 1 WHERE id = ?", (plan_id,))
+            finally:
+                conn.close()
+
+    def checkpoint(self, target, size, mtime):
+        """Bytes of target's partial copy known to be on disk, if it was copying this version (size, mtime)"""
+        with self.lock:
+            conn = self._connect()
+            try:
+                row = conn.execute("SELECT size, mtime, copied FROM checkpoints WHERE target = ?",
+                                   (os.path.abspath(target),)).fetchone()
+            finally:
+                conn.close()
+        if row is None or (row[0], row[1]) != (size, mtime):
+            return 0
+        return row[2]
+
+    def save_checkpoint(self, target, size, mtime, copied):
+        with self.lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("INSERT OR REPLACE INTO checkpoints (target, size, mtime, copied, updated) "
+                                 "VALUES (?, ?, ?, ?, ?)", (os.path.abspath(target), size, mtime, copied, time.time()))
+            finally:
+                conn.close()
+
+    def clear_checkpoint(self, target):
+        with self.lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("DELETE FROM checkpoints WHERE target = ?", (os.path.abspath(target),))
+            finally:
+                conn.close()
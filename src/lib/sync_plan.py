@@ -0,0 +1,97 @@
+import os
+import json
+import time
+from collections import Counter
+from lib.exclusion_matcher import ExclusionMatcher
+
+PLAN_VERSION = 1
+# Order in which a plan is written and applied
+OPERATION_KINDS = ('move', 'copy', 'touch', 'delete')
+
+class PlanError(Exception):
+    pass
+
+def plan_entry(kind, rel_path, source_stats=None, target_stats=None, new_path=None):
+    """One operation with the (size, mtime) of each side it was planned from; None means the file was absent"""
+    entry = {'op': kind, 'path': rel_path}
+    if new_path is not None:
+        entry['to'] = new_path
+    entry['source'] = list(source_stats) if source_stats is not None else None
+    entry['target'] = list(target_stats) if target_stats is not None else None
+    return entry
+
+class SyncPlan:
+    """The operations of a trial run and the metadata they were based on
+
+    Saved as JSON lines: a header with the folders and sync options, then
+    one operation per line, ordered by kind and path, so two plans can be
+    compared with diff and a plan can be reviewed or trimmed with grep or
+    a text editor before it is applied.
+    """
+    def __init__(self, source, target, options, entries=None, created=None):
+        self.source = source
+        self.target = target
+        self.options = options
+        self.entries = entries if entries is not None else []
+        self.created = created if created is not None else time.time()
+
+    def add(self, kind, rel_path, source_stats=None, target_stats=None, new_path=None):
+        self.entries.append(plan_entry(kind, rel_path, source_stats, target_stats, new_path))
+
+    def counts(self):
+        counts = Counter(entry['op'] for entry in self.entries)
+        return {kind: counts.get(kind, 0) for kind in OPERATION_KINDS}
+
+    def save(self, path):
+        """Write the plan, replacing any file at path only once it is complete"""
+        order = {kind: index for index, kind in enumerate(OPERATION_KINDS)}
+        header = {'plan': PLAN_VERSION, 'source': self.source, 'target': self.target,
+                  'options': self.options, 'created': self.created}
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(header, sort_keys=True) + '\n')
+            for entry in sorted(self.entries, key=lambda entry: (order[entry['op']], entry['path'])):
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                raise PlanError(f"{path} is not a sync plan")
+            if not isinstance(header, dict) or header.get('plan') != PLAN_VERSION:
+                raise PlanError(f"{path} is not a version {PLAN_VERSION} sync plan")
+            entries = []
+            for number, line in enumerate(f, start=2):
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    raise PlanError(f"{path}:{number}: not a JSON operation")
+                if entry.get('op') not in OPERATION_KINDS or not entry.get('path'):
+                    raise PlanError(f"{path}:{number}: unknown operation")
+                entries.append(entry)
+        return cls(header['source'], header['target'], header.get('options', {}), entries, header.get('created'))
+
+    def filtered(self, kinds=None, include=(), exclude=()):
+        """A copy of the plan with only the given kinds and the paths matching include but not exclude
+
+        Patterns use .gitignore syntax, as in the exclusions box; a move
+        matches when either of its paths does.
+        """
+        included = ExclusionMatcher(self.source, [], include, read_nested=False) if include else None
+        excluded = ExclusionMatcher(self.source, [], exclude, read_nested=False) if exclude else None
+
+        def keep(entry):
+            if kinds and entry['op'] not in kinds:
+                return False
+            paths = [entry['path']] + ([entry['to']] if 'to' in entry else [])
+            if included and not any(included.is_excluded(path) for path in paths):
+                return False
+            return not (excluded and any(excluded.is_excluded(path) for path in paths))
+
+        return SyncPlan(self.source, self.target, self.options, [entry for entry in self.entries if keep(entry)],
+                        self.created)
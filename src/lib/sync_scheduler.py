@@ -0,0 +1,297 @@
+import os
+import time
+import threading
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from lib.sync_engine import SyncEngine
+from lib.sync_journal import SyncJournal
+
+DEFAULT_IO_WORKERS = 16
+DEFAULT_MAX_JOBS = 8
+# Jobs reading from, or writing to, the same device at once
+DEFAULT_DEVICE_CONCURRENCY = 2
+
+def device_of(path):
+    try:
+        return os.stat(path).st_dev
+    except OSError:
+        return None
+
+class DeviceLimiter:
+    """Caps how many jobs use each source and each target device at the same time
+
+    A job takes its source and target slots together or waits for both, so
+    it never holds one device while waiting for another and jobs cannot
+    deadlock on each other.
+    """
+    def __init__(self, source_limit=DEFAULT_DEVICE_CONCURRENCY, target_limit=DEFAULT_DEVICE_CONCURRENCY):
+        self.limits = {'source': max(1, int(source_limit)), 'target': max(1, int(target_limit))}
+        self.busy = Counter()
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def hold(self, source_device, target_device):
+        slots = [('source', source_device), ('target', target_device)]
+        with self.condition:
+            while any(self.busy[slot] >= self.limits[slot[0]] for slot in slots):
+                self.condition.wait()
+            self.busy.update(slots)
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.busy.subtract(slots)
+                for slot in slots:
+                    if self.busy[slot] <= 0:
+                        del self.busy[slot]
+                self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {f"{role} {device}": count for (role, device), count in self.busy.items()}
+
+class ProfileJob:
+    """One named folder pair, standing in for the app towards its own engine and monitor
+
+    Messages go to the scheduler's app prefixed with the profile name, and
+    every sync of the pair, full or from monitored changes, holds the
+    pair's device slots while it runs.
+    """
+    def __init__(self, scheduler, name, settings):
+        self.scheduler = scheduler
+        self.name = name
+        self.settings = settings
+        self.source_folder = settings['left_folder']
+        self.target_folder = settings['right_folder']
+        self.additional_patterns = [p.strip() for p in settings.get('exclusions', '').split('\n') if p.strip()]
+        self.delete_files = settings.get('delete_files', True)
+        # Seconds between scheduled full syncs; 0 only syncs when asked to
+        self.sync_interval = float(settings.get('sync_interval', 0))
+        self.sync_engine = None
+        self.file_monitor = None
+        self.source_device = device_of(self.source_folder)
+        self.target_device = device_of(self.target_folder)
+        self.lock = threading.Lock()
+        self.errors = 0
+        self.busy = False
+        self.last_sync = 0.0
+
+    def log_message(self, message, message_type='info'):
+        if message_type == 'error':
+            with self.lock:
+                self.errors += 1
+        self.scheduler.app.log_message(f"[{self.name}] {message}", message_type)
+
+    def auto_sync_enabled(self):
+        return self.settings.get('auto_sync', True)
+
+    def build_engine(self):
+        sync_engine = SyncEngine(self)
+        sync_engine.io_pool = self.scheduler.io_pool
+        sync_engine.metadata_index = self.scheduler.metadata_index
+        sync_engine.journal = self.scheduler.journal
+        if self.settings.get('compare_mode', 'mtime') == 'hash':
+            sync_engine.hash_cache = self.scheduler.get_hash_cache()
+        sync_engine.configure(self.settings)
+        sync_engine.set_exclusions(self.source_folder, self.additional_patterns)
+        self.sync_engine = sync_engine
+
+    def device_slots(self):
+        return self.scheduler.limiter.hold(self.source_device, self.target_device)
+
+    def handle_changes(self, changes):
+        with self.device_slots():
+            results = self.sync_engine.sync_changes(self.source_folder, self.target_folder, changes,
+                                                    self.delete_files)
+        self.scheduler.report(self, 'synced', {'copied': results['copied'], 'deleted': results['deleted'],
+                                               'moved': [list(pair) for pair in results['moved']]})
+
+    def handle_catch_up(self):
+        if not self.sync_engine.metadata_index:
+            return
+        with self.device_slots():
+            summary = self.sync_engine.catch_up(self.source_folder, self.target_folder, self.delete_files)
+        self.scheduler.report(self, 'catch_up', dict(summary, duration=round(summary['duration'], 3)))
+
+    def run_sync(self, trial_run=False):
+        """Full sync of the pair; waits for its device slots first"""
+        errors_before = self.errors
+        queued_time = time.monotonic()
+        with self.device_slots():
+            start_time = time.monotonic()
+            # Pick up .gitignore edits made since the last run
+            self.sync_engine.refresh_exclusions()
+            copied, deleted = self.sync_engine.sync_folders(
+                self.source_folder, self.target_folder, list(self.sync_engine.exclusions.gitignore_patterns),
+                self.additional_patterns, self.delete_files, trial_run,
+                use_index=self.settings.get('use_index', False) and self.sync_engine.metadata_index is not None,
+                compare_mode=self.settings.get('compare_mode', 'mtime'))
+        summary = {
+            'mode': 'trial' if trial_run else 'sync',
+            'source': self.source_folder,
+            'target': self.target_folder,
+            'copied': copied,
+            'deleted': deleted,
+            'errors': self.errors - errors_before,
+            'waited': round(start_time - queued_time, 3),
+            'duration': round(time.monotonic() - start_time, 3),
+        }
+        self.scheduler.report(self, 'summary', summary)
+        return summary
+
+class SyncScheduler:
+    """Runs many folder pairs concurrently on shared resources
+
+    All pairs copy through one I/O thread pool, use one metadata index,
+    hash cache and sync journal, and their monitors schedule their watches on one observer
+    (pairs on network mounts still poll on their own). A device limiter
+    keeps the number of pairs syncing from or to the same disk at once
+    below the configured caps, and at most max_jobs full syncs run at a
+    time. Profiles with a sync_interval get a full sync that often.
+    """
+    def __init__(self, app, config_manager, settings, profiles, on_result=None):
+        self.app = app
+        self.config_manager = config_manager
+        self.on_result = on_result
+        self.io_pool = ThreadPoolExecutor(max_workers=max(1, int(settings.get('io_workers', DEFAULT_IO_WORKERS))),
+                                          thread_name_prefix='io')
+        self.job_pool = ThreadPoolExecutor(max_workers=max(1, int(settings.get('max_jobs', DEFAULT_MAX_JOBS))),
+                                           thread_name_prefix='sync-job')
+        self.limiter = DeviceLimiter(settings.get('source_device_concurrency', DEFAULT_DEVICE_CONCURRENCY),
+                                     settings.get('target_device_concurrency', DEFAULT_DEVICE_CONCURRENCY))
+        self.metadata_index = None
+        if any(profile.get('use_index', False) for profile in profiles.values()):
+            self.open_index()
+        self.hash_cache = None
+        self.hash_lock = threading.Lock()
+        self.journal = SyncJournal(config_manager.get_data_path('syncer_journal.db'))
+        self.jobs = [ProfileJob(self, name, profile) for name, profile in sorted(profiles.items())]
+        for job in self.jobs:
+            job.build_engine()
+        self.observer = None
+        self.monitoring = False
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def open_index(self):
+        from lib.metadata_index import MetadataIndex
+        self.metadata_index = MetadataIndex(self.config_manager.get_data_path('syncer_index.db'))
+
+    def get_hash_cache(self):
+        with self.hash_lock:
+            if self.hash_cache is None:
+                from lib.hash_cache import HashCache
+                self.hash_cache = HashCache(self.config_manager.get_data_path('syncer_hashes.db'))
+            return self.hash_cache
+
+    def report(self, job, event, details):
+        if self.on_result:
+            record = {'event': event, 'profile': job.name}
+            record.update(details)
+            self.on_result(record)
+
+    def submit_sync(self, job, trial_run=False):
+        """Queue a full sync of one pair unless one is already queued or running"""
+        with job.lock:
+            if job.busy:
+                return None
+            job.busy = True
+
+        def run():
+            try:
+                return job.run_sync(trial_run)
+            except Exception as e:
+                job.log_message(f"Sync failed: {str(e)}", 'error')
+                logging.error(f"Sync of profile {job.name} failed: {str(e)}", exc_info=True)
+                return None
+            finally:
+                with job.lock:
+                    job.busy = False
+                    job.last_sync = time.monotonic()
+        return self.job_pool.submit(run)
+
+    def run_all(self, trial_run=False):
+        """Full sync of every pair, concurrently within the caps; returns the summaries by profile"""
+        futures = {job.name: self.submit_sync(job, trial_run) for job in self.jobs}
+        return {name: future.result() for name, future in futures.items() if future}
+
+    def start(self):
+        """Monitor every pair, catching up on changes made while not running, and start scheduled syncs"""
+        from lib.file_monitor import FileMonitor, SharedObserver
+        if self.metadata_index is None:
+            # The index also holds the journal monitors catch up from
+            self.open_index()
+            for job in self.jobs:
+                job.sync_engine.metadata_index = self.metadata_index
+        self.observer = SharedObserver()
+        self.observer.start()
+        started = 0
+        for job in self.jobs:
+            # Startup catches up, so the first scheduled sync is a full interval away
+            job.last_sync = time.monotonic()
+            job.file_monitor = FileMonitor(job)
+            job.file_monitor.configure(job.settings)
+            job.file_monitor.shared_observer = self.observer
+            if job.file_monitor.start(job.source_folder, catch_up=True):
+                started += 1
+        self.monitoring = True
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name='sync-scheduler', daemon=True)
+        self.thread.start()
+        self.app.log_message(f"Monitoring {started} of {len(self.jobs)} profiles", 'info')
+        return started == len(self.jobs)
+
+    def stop(self):
+        """Stop monitoring and scheduling, then wait for running syncs and release the pools"""
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        for job in self.jobs:
+            if job.file_monitor:
+                job.file_monitor.stop()
+                job.file_monitor = None
+        if self.observer:
+            self.observer.stop()
+            self.observer.join()
+            self.observer = None
+        self.monitoring = False
+        self.job_pool.shutdown(wait=True)
+        self.io_pool.shutdown(wait=True)
+        if self.hash_cache:
+            self.hash_cache.close()
+
+    def stats(self):
+        return {
+            'profiles': len(self.jobs),
+            'syncing': sum(1 for job in self.jobs if job.busy),
+            'devices': self.limiter.stats(),
+            'monitors': {job.name: job.file_monitor.get_stats() for job in self.jobs if job.file_monitor},
+        }
+
+    def check_observer(self):
+        """Replace the shared observer if its thread died; each monitor rescans what it covers"""
+        if self.observer is None or self.observer.is_alive():
+            return
+        from lib.file_monitor import SharedObserver
+        self.app.log_message("Shared file system observer stopped unexpectedly, restarting it", 'error')
+        self.observer = SharedObserver()
+        self.observer.start()
+        for job in self.jobs:
+            monitor = job.file_monitor
+            if monitor and monitor.watch_mode != 'polling':
+                monitor.shared_observer = self.observer
+                monitor.restart_observer()
+
+    def _run(self):
+        while not self.stop_event.wait(1.0):
+            try:
+                self.check_observer()
+                now = time.monotonic()
+                for job in self.jobs:
+                    if job.sync_interval and now - job.last_sync >= job.sync_interval:
+                        self.submit_sync(job)
+            except Exception as e:
+                logging.error(f"Error in sync scheduler: {str(e)}", exc_info=True)
@@ -0,0 +1,152 @@
+import os
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Directory listings requested ahead of the walk, per scan thread
+SCAN_PREFETCH = 4
+DEFAULT_SCAN_THREADS = 8
+
+def walk_listings(start, list_dir, threads=1):
+    """Yield (rel_dir, listing) for start and every directory below it, breadth first
+
+    list_dir(rel_dir) returns (listing, subdirs), with subdirs as relative
+    paths, or None to skip the directory. With several threads the next
+    directories in line are listed on a pool while earlier ones are
+    consumed, which hides per-directory latency on network mounts.
+    Subdirectories are queued in sorted order and results are consumed in
+    queue order, so the output does not depend on thread timing.
+    """
+    pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='scan') if threads > 1 else None
+    window = threads * SCAN_PREFETCH if pool else 0
+    # [rel_dir, future]; the first `ahead` entries have been submitted
+    pending = deque([[start, None]])
+    ahead = 0
+    try:
+        while pending:
+            while ahead < min(window, len(pending)):
+                pending[ahead][1] = pool.submit(list_dir, pending[ahead][0])
+                ahead += 1
+            rel_dir, future = pending.popleft()
+            if future:
+                ahead -= 1
+            result = future.result() if future else list_dir(rel_dir)
+            if result is None:
+                continue
+            listing, subdirs = result
+            yield rel_dir, listing
+            pending.extend([subdir, None] for subdir in sorted(subdirs))
+    finally:
+        if pool:
+            for _, future in pending:
+                if future:
+                    future.cancel()
+            pool.shutdown(wait=True)
+
+def walk_sorted(folder, matcher, threads=1):
+    """Yield (rel_path, (size, mtime)) for the files under folder, in sorted path order
+
+    Entries of each directory are visited by name, descending into
+    directories where they sort, so two trees walked this way produce their
+    paths in the same order (compared component by component) and can be
+    merge-joined. Only the listings of the directories on the current path
+    are held in memory, plus, with several threads, the listings of the
+    next few subdirectories at each level, fetched ahead on a pool.
+    Excluded directories are not entered.
+    """
+    pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='scan') if threads > 1 else None
+    window = threads * SCAN_PREFETCH if pool else 0
+
+    def list_dir(rel_dir):
+        return _list_sorted(folder, rel_dir, matcher)
+
+    def prefetch(rel_dir):
+        return pool.submit(list_dir, rel_dir)
+
+    stack = [_DirFrame(list_dir(''), prefetch, window)]
+    try:
+        while stack:
+            entry = next(stack[-1].entries, None)
+            if entry is None:
+                stack.pop()
+                continue
+            rel_path, is_dir, stats = entry
+            if is_dir:
+                stack.append(_DirFrame(stack[-1].take(rel_path, list_dir), prefetch, window))
+            else:
+                yield rel_path, stats
+    finally:
+        if pool:
+            for frame in stack:
+                frame.cancel()
+            pool.shutdown(wait=True)
+
+class _DirFrame:
+    """Entries of one directory being walked, with the listings of its next subdirectories requested early"""
+    def __init__(self, listing, prefetch, window):
+        self.entries = iter(listing)
+        self.subdirs = [rel_path for rel_path, is_dir, _ in listing if is_dir]
+        self.prefetch = prefetch
+        self.window = window
+        self.submitted = 0
+        self.futures = {}
+        self.fill()
+
+    def fill(self):
+        while len(self.futures) < self.window and self.submitted < len(self.subdirs):
+            rel_path = self.subdirs[self.submitted]
+            self.futures[rel_path] = self.prefetch(rel_path)
+            self.submitted += 1
+
+    def take(self, rel_path, list_dir):
+        future = self.futures.pop(rel_path, None)
+        self.fill()
+        return future.result() if future else list_dir(rel_path)
+
+    def cancel(self):
+        for future in self.futures.values():
+            future.cancel()
+
+def _list_sorted(folder, rel_dir, matcher):
+    listing = []
+    try:
+        with os.scandir(os.path.join(folder, rel_dir)) as entries:
+            for entry in entries:
+                rel_path = os.path.join(rel_dir, entry.name)
+                if entry.is_dir(follow_symlinks=False):
+                    if not matcher.is_dir_excluded(rel_path):
+                        listing.append((rel_path, True, None))
+                elif entry.is_file():
+                    if not matcher.is_excluded(rel_path):
+                        st = entry.stat()
+                        listing.append((rel_path, False, (st.st_size, st.st_mtime)))
+    except OSError as e:
+        logging.warning(f"Could not scan directory {os.path.join(folder, rel_dir)}: {str(e)}")
+    listing.sort(key=lambda item: os.path.basename(item[0]))
+    return listing
+
+def merge_join(source_walk, target_walk):
+    """Pair two sorted walks by path, yielding (rel_path, source_stats, target_stats)
+
+    The stats of a side are None when the path only exists on the other one.
+    """
+    missing = object()
+    source = next(source_walk, missing)
+    target = next(target_walk, missing)
+    source_key = source[0].split(os.sep) if source is not missing else None
+    target_key = target[0].split(os.sep) if target is not missing else None
+    while source is not missing or target is not missing:
+        if target is missing or (source is not missing and source_key < target_key):
+            yield source[0], source[1], None
+            source = next(source_walk, missing)
+            source_key = source[0].split(os.sep) if source is not missing else None
+        elif source is missing or target_key < source_key:
+            yield target[0], None, target[1]
+            target = next(target_walk, missing)
+            target_key = target[0].split(os.sep) if target is not missing else None
+        else:
+            yield source[0], source[1], target[1]
+            source = next(source_walk, missing)
+            source_key = source[0].split(os.sep) if source is not missing else None
+            target = next(target_walk, missing)
+            target_key = target[0].split(os.sep) if target is not missing else None
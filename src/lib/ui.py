@@ -4,8 +4,12 @@ import queue
 import threading
 import os
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import logging
 
+# Exclusion and folder edits are applied once they have paused for this long (ms)
+EXCLUSIONS_APPLY_DELAY = 500
+
 class LogColors:
     IGNORED = '#808080'  # Grey
     NEW_FILE = '#4CAF50'  # Green
@@ -47,6 +51,8 @@ class SyncerUI:
         self.progress_var = tk.DoubleVar()
         self.progress_bar = ttk.Progressbar(top_frame, variable=self.progress_var, maximum=100)
         self.progress_bar.grid(row=5, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=5)
+        self.progress_text = tk.StringVar()
+        ttk.Label(top_frame, textvariable=self.progress_text).grid(row=6, column=0, columnspan=3, sticky=tk.W)
         
         # Output log area
         self.create_log_area(main_frame)
@@ -64,9 +70,23 @@ class SyncerUI:
         # Maximum number of log entries to keep
         self.max_log_entries = 1000
         
+        # Plain copy of the widget state for worker threads, which must not call into Tk
+        self.live_settings = {}
+        self._published_exclusions = None
+        self._apply_exclusions_job = None
+        # Recompiling the rules and refreshing the watches walks the tree, so it stays off the Tk thread
+        self.exclusions_worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix='apply-exclusions')
+        
         # Load saved settings
         self.load_settings()
         
+        # Keep the live settings and the engine's exclusion rules in step with the widgets
+        for var in (self.left_folder_var, self.right_folder_var, self.auto_sync_var, self.delete_files_var):
+            var.trace_add('write', self.publish_settings)
+        # Half-typed patterns are not applied; the rules change when the box loses focus
+        self.exclusions_text.bind('<FocusOut>', self.publish_settings)
+        self.publish_settings()
+        
         # Save settings on window close
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
 
@@ -101,6 +121,14 @@ class SyncerUI:
         ttk.Checkbutton(options_frame, text="Delete files in right folder that don't exist in left folder",
                        variable=self.delete_files_var).pack(anchor=tk.W)
         
+        self.use_index_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="Use metadata index (detect renamed files by inode)",
+                       variable=self.use_index_var).pack(anchor=tk.W)
+        
+        self.compare_contents_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="Compare file contents when timestamps differ",
+                       variable=self.compare_contents_var).pack(anchor=tk.W)
+        
         # Real-time monitoring options
         monitor_frame = ttk.Frame(options_frame)
         monitor_frame.pack(fill=tk.X, pady=5)
@@ -128,8 +156,16 @@ class SyncerUI:
         self.sync_button = ttk.Button(buttons_frame, text="Synchronize", command=lambda: self.start_sync(trial_run=False))
         self.sync_button.pack(side=tk.LEFT, padx=5)
         
+        # Carries out the last trial run's plan without scanning again
+        self.apply_button = ttk.Button(buttons_frame, text="Apply Trial Run", command=self.start_apply_plan,
+                                       state=tk.DISABLED)
+        self.apply_button.pack(side=tk.LEFT, padx=5)
+        
         self.cancel_button = ttk.Button(buttons_frame, text="Cancel", command=self.cancel_sync_operation, state=tk.DISABLED)
         self.cancel_button.pack(side=tk.LEFT, padx=5)
+        
+        self.rebuild_index_button = ttk.Button(buttons_frame, text="Rebuild Index", command=self.rebuild_index)
+        self.rebuild_index_button.pack(side=tk.LEFT, padx=5)
 
     def create_log_area(self, parent):
         # Create log frame
@@ -215,29 +251,113 @@ class SyncerUI:
         else:
             self.stop_monitoring()
             
-    def start_monitoring(self):
-        if self.file_monitor and self.file_monitor.start(self.left_folder_var.get()):
+    def start_monitoring(self, catch_up=False):
+        self.apply_exclusions(wait=True)
+        if self.file_monitor and self.file_monitor.start(self.left_folder_var.get(), catch_up):
             self.monitor_status.config(text="Status: Monitoring")
+            self.root.after(1000, self.refresh_monitor_status)
         else:
             self.monitor_var.set(False)
             
+    def refresh_monitor_status(self):
+        """Show the auto-sync queue depth and latency while monitoring"""
+        stats = self.file_monitor.get_stats() if self.file_monitor else None
+        if stats is None:
+            return
+        if stats['watch_mode'] == 'polling':
+            watches = f"polling every {stats['polling']['interval']:.0f}s, "
+        elif stats['watch_mode'] == 'per_directory':
+            watches = f"watches: {stats['watches']}, "
+        else:
+            watches = ""
+        if stats['unwatchable']:
+            watches += f"unwatchable: {len(stats['unwatchable'])}, "
+        if stats['dirty']:
+            watches += f"pending rescans: {stats['dirty']}, "
+        self.monitor_status.config(
+            text=f"Status: Monitoring ({watches}queued: {stats['queued'] + stats['active']}, "
+                 f"avg latency: {stats['avg_latency'] * 1000:.0f} ms)")
+        self.root.after(1000, self.refresh_monitor_status)
+            
     def stop_monitoring(self):
         if self.file_monitor:
             self.file_monitor.stop()
             self.monitor_status.config(text="Status: Not monitoring")
         
-    def sync_single_file(self, rel_path):
-        gitignore_patterns = self.sync_engine.read_gitignore(self.left_folder_var.get())
-        additional_patterns = [p.strip() for p in self.exclusions_text.get("1.0", tk.END).split('\n') if p.strip()]
+    def get_additional_patterns(self):
+        return [p.strip() for p in self.exclusions_text.get("1.0", tk.END).split('\n') if p.strip()]
         
-        if self.sync_engine.sync_single_file(self.left_folder_var.get(), self.right_folder_var.get(),
-                                           rel_path, gitignore_patterns, additional_patterns):
-            self.log_message(f"Auto-synced: {rel_path}", 'changed')
+    def publish_settings(self, *args):
+        """Copy the widget state into live_settings and schedule the exclusion rules to be applied"""
+        self.live_settings = {
+            'left_folder': self.left_folder_var.get(),
+            'right_folder': self.right_folder_var.get(),
+            'auto_sync': self.auto_sync_var.get(),
+            'delete_files': self.delete_files_var.get(),
+        }
+        if not self.sync_engine:
+            return
+        # Typing a folder path fires on every key, so wait for a pause
+        if self._apply_exclusions_job:
+            self.root.after_cancel(self._apply_exclusions_job)
+        self._apply_exclusions_job = self.root.after(EXCLUSIONS_APPLY_DELAY, self.apply_exclusions)
+        
+    def apply_exclusions(self, wait=False):
+        """Recompile the exclusion rules on the worker thread if the folder or patterns changed
+        
+        With wait, returns once they are in place, for callers about to scan
+        or start monitoring.
+        """
+        if self._apply_exclusions_job:
+            self.root.after_cancel(self._apply_exclusions_job)
+            self._apply_exclusions_job = None
+        if not self.sync_engine:
+            return
+        exclusions = (self.left_folder_var.get(), tuple(self.get_additional_patterns()))
+        if exclusions == self._published_exclusions:
+            return
+        self._published_exclusions = exclusions
+        future = self.exclusions_worker.submit(self.update_exclusions, *exclusions)
+        if wait:
+            future.result()
             
-    def delete_single_file(self, rel_path):
-        if self.sync_engine.delete_single_file(self.right_folder_var.get(), rel_path):
+    def update_exclusions(self, left_folder, additional_patterns):
+        """Runs on the exclusions worker thread"""
+        try:
+            self.sync_engine.set_exclusions(left_folder, list(additional_patterns))
+            if self.file_monitor:
+                self.file_monitor.refresh_watches()
+        except Exception as e:
+            logging.error(f"Error applying exclusions: {str(e)}", exc_info=True)
+        
+    def sync_changes(self, changes):
+        """Apply a batch of monitored changes to the right folder (runs on a worker thread)"""
+        settings = self.live_settings
+        results = self.sync_engine.sync_changes(settings['left_folder'], settings['right_folder'], changes,
+                                                settings['delete_files'])
+        for rel_path in results['copied']:
+            self.log_message(f"Auto-synced: {rel_path}", 'changed')
+        for src_rel_path, rel_path in results['moved']:
+            self.log_message(f"Auto-moved: {src_rel_path} → {rel_path}", 'changed')
+        for rel_path in results['deleted']:
             self.log_message(f"Auto-deleted: {rel_path}", 'deleted')
             
+    def catch_up(self):
+        """Sync changes made while the app was not running (runs on a worker thread)"""
+        settings = self.live_settings
+        if not settings['right_folder'] or not os.path.exists(settings['right_folder']):
+            self.log_message("Right folder not available, skipping catch-up", 'error')
+            return
+        if not self.sync_engine.metadata_index:
+            return
+        self.log_message("Catching up on changes made while not monitoring...", 'info')
+        summary = self.sync_engine.catch_up(settings['left_folder'], settings['right_folder'],
+                                            settings['delete_files'])
+        scope = "no journal yet, ran a full sync" if summary['full'] else \
+            f"{summary['dirs_changed']} of {summary['dirs_scanned']} directories changed"
+        self.log_message(f"Catch-up finished in {summary['duration']:.2f}s ({scope}): "
+                         f"{summary['copied']} copied, {summary['moved']} moved, {summary['deleted']} deleted", 'info')
+            
     def start_sync(self, trial_run=False):
         if self.sync_thread and self.sync_thread.is_alive():
             self.log_message("Sync operation already in progress!", 'error')
@@ -251,9 +371,12 @@ class SyncerUI:
             self.log_message("One or both folders do not exist!", 'error')
             return
             
+        # Patterns typed just before clicking still reach the monitor
+        self.apply_exclusions()
         self.cancel_sync = False
         self.trial_button.config(state=tk.DISABLED)
         self.sync_button.config(state=tk.DISABLED)
+        self.apply_button.config(state=tk.DISABLED)
         self.cancel_button.config(state=tk.NORMAL)
         
         self.sync_thread = threading.Thread(
@@ -263,6 +386,47 @@ class SyncerUI:
         )
         self.sync_thread.start()
         
+    def trial_plan_path(self):
+        return self.config_manager.get_data_path('last_trial_plan.jsonl')
+        
+    def start_apply_plan(self):
+        if self.sync_thread and self.sync_thread.is_alive():
+            self.log_message("Sync operation already in progress!", 'error')
+            return
+            
+        self.cancel_sync = False
+        self.trial_button.config(state=tk.DISABLED)
+        self.sync_button.config(state=tk.DISABLED)
+        self.apply_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        
+        self.sync_thread = threading.Thread(target=self.perform_apply_plan, daemon=True)
+        self.sync_thread.start()
+        
+    def perform_apply_plan(self):
+        from lib.sync_plan import SyncPlan, PlanError
+        try:
+            plan = SyncPlan.load(self.trial_plan_path())
+            if (plan.source, plan.target) != (os.path.abspath(self.left_folder_var.get()),
+                                              os.path.abspath(self.right_folder_var.get())):
+                self.log_message("The last trial run was for other folders; run a new trial first", 'error')
+                return
+            self.log_message("Applying the last trial run", 'info')
+            results = self.sync_engine.apply_plan(plan, self.update_progress, lambda: self.cancel_sync)
+            if not self.cancel_sync:
+                self.log_message(f"Trial run applied: {results['copied']} copied, {results['moved']} moved, "
+                                 f"{results['deleted']} deleted", 'info')
+                if results['stale']:
+                    self.log_message(f"{results['stale']} files had changed since the trial run and were "
+                                     f"compared again", 'info')
+        except (OSError, PlanError) as e:
+            self.log_message(f"Could not read the trial run plan: {str(e)}", 'error')
+        finally:
+            self.trial_button.config(state=tk.NORMAL)
+            self.sync_button.config(state=tk.NORMAL)
+            self.cancel_button.config(state=tk.DISABLED)
+            self.progress_var.set(0)
+        
     def perform_sync(self, trial_run):
         try:
             mode = "Trial run" if trial_run else "Synchronization"
@@ -270,7 +434,7 @@ class SyncerUI:
             
             # Get patterns
             gitignore_patterns = self.sync_engine.read_gitignore(self.left_folder_var.get())
-            additional_patterns = [p.strip() for p in self.exclusions_text.get("1.0", tk.END).split('\n') if p.strip()]
+            additional_patterns = self.get_additional_patterns()
             
             self.log_message("Using .gitignore patterns: " + ", ".join(gitignore_patterns), 'info')
             self.log_message("Using additional exclusions: " + ", ".join(additional_patterns), 'info')
@@ -284,10 +448,15 @@ class SyncerUI:
                 self.delete_files_var.get(),
                 trial_run,
                 self.update_progress,
-                lambda: self.cancel_sync
+                lambda: self.cancel_sync,
+                self.use_index_var.get(),
+                'hash' if self.compare_contents_var.get() else 'mtime',
+                self.trial_plan_path() if trial_run else None
             )
             
             if not self.cancel_sync:
+                if trial_run:
+                    self.apply_button.config(state=tk.NORMAL)
                 self.log_message(f"{mode} completed!", 'info')
                 self.log_message(f"Files copied: {copied}", 'info')
                 self.log_message(f"Files deleted: {deleted}", 'info')
@@ -297,13 +466,29 @@ class SyncerUI:
             self.sync_button.config(state=tk.NORMAL)
             self.cancel_button.config(state=tk.DISABLED)
             self.progress_var.set(0)
+            self.progress_text.set('')
             
     def cancel_sync_operation(self):
         self.cancel_sync = True
         self.log_message("Cancelling sync operation...", 'info')
         
-    def update_progress(self, value):
+    def rebuild_index(self):
+        if self.sync_thread and self.sync_thread.is_alive():
+            self.log_message("Cannot rebuild the index while a sync is running!", 'error')
+            return
+        if not self.sync_engine or not self.sync_engine.metadata_index:
+            return
+        for folder in (self.left_folder_var.get(), self.right_folder_var.get()):
+            if folder:
+                self.sync_engine.metadata_index.invalidate(folder)
+        self.log_message("Metadata index cleared, it will be rebuilt on the next sync", 'info')
+        
+    def update_progress(self, value, completed=None, discovered=None, scanning=False):
+        """Streaming syncs also pass counts, since their total is only known once scanning ends"""
         self.progress_var.set(value)
+        if discovered is not None:
+            suffix = " found so far, still scanning" if scanning else ""
+            self.progress_text.set(f"{completed} of {discovered} operations done{suffix}")
 
     def load_settings(self):
         config = self.config_manager.load_config()
@@ -313,27 +498,36 @@ class SyncerUI:
         self.exclusions_text.insert('1.0', config.get('exclusions', ''))
         self.delete_files_var.set(config.get('delete_files', True))
         self.auto_sync_var.set(config.get('auto_sync', True))
+        self.use_index_var.set(config.get('use_index', False))
+        self.compare_contents_var.set(config.get('compare_mode', 'mtime') == 'hash')
         # Store monitoring state but don't start it yet
         self._should_monitor = config.get('monitoring', False)
             
     def initialize_monitoring(self):
         """Called after all components are set up to start monitoring if needed"""
+        self.publish_settings()
+        self.apply_exclusions(wait=True)
         if hasattr(self, '_should_monitor') and self._should_monitor:
             self.monitor_var.set(True)
-            self.start_monitoring()
+            self.start_monitoring(catch_up=True)
             
     def save_settings(self):
-        config = {
+        # Keep settings that have no widget (engine tuning options) intact
+        config = self.config_manager.load_config()
+        config.update({
             'left_folder': self.left_folder_var.get(),
             'right_folder': self.right_folder_var.get(),
             'exclusions': self.exclusions_text.get('1.0', tk.END).strip(),
             'delete_files': self.delete_files_var.get(),
             'monitoring': self.monitor_var.get(),
-            'auto_sync': self.auto_sync_var.get()
-        }
+            'auto_sync': self.auto_sync_var.get(),
+            'use_index': self.use_index_var.get(),
+            'compare_mode': 'hash' if self.compare_contents_var.get() else 'mtime'
+        })
         self.config_manager.save_config(config)
         
     def on_closing(self):
         self.stop_monitoring()
+        self.exclusions_worker.shutdown(wait=True)
         self.save_settings()
         self.root.destroy()
@@ -3,10 +3,14 @@ from lib.ui import SyncerUI
 from lib.sync_engine import SyncEngine
 from lib.file_monitor import FileMonitor
 from lib.config_manager import ConfigManager
+from lib.metadata_index import MetadataIndex
+from lib.hash_cache import HashCache
+from lib.sync_journal import SyncJournal
 import sys
 import logging
 import datetime
 import codecs
+import multiprocessing
 
 # Configure stderr to handle Unicode
 if sys.stderr.encoding != 'utf-8':
@@ -49,13 +53,17 @@ class MessageHandler:
         else:
             logging.info(message)
             
-    def handle_file_change(self, rel_path, event_type):
-        if self.ui and self.ui.auto_sync_var.get():
-            self.ui.sync_single_file(rel_path)
+    def auto_sync_enabled(self):
+        # Called from monitor threads, so read the plain settings copy rather than Tk variables
+        return bool(self.ui and self.ui.live_settings.get('auto_sync'))
             
-    def handle_file_deletion(self, rel_path):
-        if self.ui and self.ui.auto_sync_var.get() and self.ui.delete_files_var.get():
-            self.ui.delete_single_file(rel_path)
+    def handle_changes(self, changes):
+        if self.auto_sync_enabled():
+            self.ui.sync_changes(changes)
+            
+    def handle_catch_up(self):
+        if self.auto_sync_enabled():
+            self.ui.catch_up()
 
 def handle_exception(exc_type, exc_value, exc_traceback):
     """Handle uncaught exceptions by logging them"""
@@ -84,7 +92,12 @@ def main():
         
         # Create components with message handler
         sync_engine = SyncEngine(message_handler)
+        sync_engine.metadata_index = MetadataIndex(config_manager.get_data_path('syncer_index.db'))
+        sync_engine.hash_cache = HashCache(config_manager.get_data_path('syncer_hashes.db'))
+        sync_engine.journal = SyncJournal(config_manager.get_data_path('syncer_journal.db'))
+        sync_engine.configure(config_manager.load_config())
         file_monitor = FileMonitor(message_handler)
+        file_monitor.configure(config_manager.load_config())
         
         # Update UI with component references
         ui.sync_engine = sync_engine
@@ -94,9 +107,6 @@ def main():
         message_handler.set_ui(ui)
         message_handler.set_sync_engine(sync_engine)
         
-        # Update sync engine with UI reference
-        sync_engine.ui = ui
-        
         # Initialize monitoring after all components are set up
         ui.initialize_monitoring()
         
@@ -108,4 +118,6 @@ def main():
         raise
 
 if __name__ == "__main__":
+    # Needed for the hashing process pool in frozen (PyInstaller) builds
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,44 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import pytest
+
+class QuietApp:
+    """Stands in for the window: collects log messages instead of showing them"""
+    def __init__(self, sync_engine=None):
+        self.sync_engine = sync_engine
+        self.messages = []
+        self.changes = []
+
+    def log_message(self, message, message_type='info'):
+        self.messages.append((message_type, message))
+
+    def auto_sync_enabled(self):
+        return True
+
+    def handle_changes(self, changes):
+        self.changes.extend(changes)
+
+    def handle_catch_up(self):
+        pass
+
+def write_file(root, rel_path, content):
+    path = os.path.join(root, rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+    return path
+
+def read_file(root, rel_path):
+    with open(os.path.join(root, rel_path)) as f:
+        return f.read()
+
+@pytest.fixture
+def folders(tmp_path):
+    source = tmp_path / 'source'
+    target = tmp_path / 'target'
+    source.mkdir()
+    target.mkdir()
+    return str(source), str(target)
@@ -0,0 +1,74 @@
+import os
+import time
+
+from conftest import QuietApp, write_file, read_file
+from lib.sync_engine import SyncEngine
+from lib.metadata_index import MetadataIndex
+
+def make_engine(tmp_path):
+    engine = SyncEngine(QuietApp())
+    engine.metadata_index = MetadataIndex(str(tmp_path / 'index.db'))
+    return engine
+
+def age(root, *rel_paths):
+    """Push mtimes out of the racy window so the index trusts the stored listings"""
+    past = time.time() - 60
+    for rel_path in rel_paths:
+        os.utime(os.path.join(root, rel_path), (past, past))
+
+def test_catch_up_after_trial_run_still_syncs_changes(tmp_path, folders):
+    source, target = folders
+    write_file(source, os.path.join('a', 'one.txt'), 'one')
+    write_file(source, os.path.join('b', 'keep.txt'), 'keep')
+    age(source, 'a', 'b', '.')
+    engine = make_engine(tmp_path)
+    engine.set_exclusions(source, [])
+    assert engine.sync_folders(source, target, [], [], use_index=True) == (2, 0)
+
+    write_file(source, os.path.join('b', 'two.txt'), 'two')
+    write_file(source, os.path.join('a', 'new.txt'), 'new')
+    age(source, 'a', 'b')
+    engine.sync_folders(source, target, [], [], trial_run=True, use_index=True)
+    assert not os.path.exists(os.path.join(target, 'b', 'two.txt'))
+
+    summary = engine.catch_up(source, target)
+    assert summary['copied'] == 2
+    assert read_file(target, os.path.join('b', 'two.txt')) == 'two'
+    assert read_file(target, os.path.join('a', 'new.txt')) == 'new'
+
+def test_cancelled_indexed_sync_records_no_synced_state(tmp_path, folders):
+    source, target = folders
+    write_file(source, os.path.join('a', 'one.txt'), 'one')
+    age(source, 'a', '.')
+    engine = make_engine(tmp_path)
+    engine.sync_folders(source, target, [], [], use_index=True, cancel_check=lambda: True)
+    assert not engine.metadata_index.load(source, 'synced').known
+    assert not engine.metadata_index.load(source).known
+
+def test_monitor_saves_journal_only_after_pending_changes_are_synced(tmp_path, folders):
+    from lib.file_monitor import FileMonitor
+    source, target = folders
+    engine = make_engine(tmp_path)
+    engine.set_exclusions(source, [])
+    app = QuietApp(engine)
+    journal_known_while_syncing = []
+
+    def handle_changes(changes):
+        journal_known_while_syncing.append(engine.metadata_index.load(source, 'synced').known)
+        engine.sync_changes(source, target, changes)
+    app.handle_changes = handle_changes
+
+    monitor = FileMonitor(app)
+    # Long quiet period: the change is still waiting in the coalescer when the monitor stops
+    monitor.configure({'debounce_quiet_period': 30, 'debounce_max_delay': 60, 'monitor_mode': 'native'})
+    assert monitor.start(source)
+    write_file(source, 'late.txt', 'late')
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline and not monitor.coalescer.pending:
+        time.sleep(0.05)
+    monitor.stop()
+
+    assert journal_known_while_syncing == [False]
+    assert read_file(target, 'late.txt') == 'late'
+    assert engine.metadata_index.load(source, 'synced').known
+    assert engine.catch_up(source, target)['copied'] == 0
@@ -0,0 +1,94 @@
+import os
+
+import pytest
+
+from conftest import QuietApp, write_file, read_file
+from lib.sync_engine import SyncEngine
+from lib.event_coalescer import Change
+from lib.sync_journal import JournalPlan, SyncJournal
+from lib.copy_backend import partial_path, NAME_MAX
+from lib import durable_writes
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_batch_mode_marks_copies_done_only_once_they_are_in_place(tmp_path, folders, monkeypatch, streaming):
+    source, target = folders
+    for index in range(5):
+        write_file(source, f'file_{index}.txt', f'content {index}')
+    engine = SyncEngine(QuietApp())
+    engine.journal = SyncJournal(str(tmp_path / 'journal.db'))
+    engine.configure({'fsync_mode': 'batch', 'streaming_sync': streaming})
+
+    in_place_when_done = []
+    original_mark_done = JournalPlan.mark_done
+    def mark_done(plan, kind, path):
+        if kind == 'copy':
+            in_place_when_done.append(os.path.exists(os.path.join(target, path)))
+        original_mark_done(plan, kind, path)
+    monkeypatch.setattr(JournalPlan, 'mark_done', mark_done)
+
+    assert engine.sync_folders(source, target, [], []) == (5, 0)
+    assert in_place_when_done == [True] * 5
+
+def test_failed_commit_is_not_counted_as_copied(folders, monkeypatch):
+    source, target = folders
+    write_file(source, 'good.txt', 'good')
+    write_file(source, 'bad.txt', 'bad')
+    engine = SyncEngine(QuietApp())
+    engine.configure({'fsync_mode': 'batch'})
+
+    original_replace = os.replace
+    def replace(src, dst):
+        if os.path.basename(dst) == 'bad.txt':
+            raise OSError('disk full')
+        original_replace(src, dst)
+    monkeypatch.setattr(durable_writes.os, 'replace', replace)
+
+    results = engine.sync_changes(source, target, [Change('created', 'good.txt', None),
+                                                   Change('created', 'bad.txt', None)])
+    assert results['copied'] == ['good.txt']
+    assert results['failed'] == ['bad.txt']
+    assert read_file(target, 'good.txt') == 'good'
+    assert not os.path.exists(os.path.join(target, 'bad.txt'))
+    assert any('Error writing' in message for _, message in engine.app.messages)
+
+def test_partial_path_fits_long_names(tmp_path):
+    name = 'x' * NAME_MAX
+    partial = partial_path(str(tmp_path / name))
+    assert len(os.fsencode(os.path.basename(partial))) <= NAME_MAX
+    assert partial == partial_path(str(tmp_path / name))
+    assert partial != partial_path(str(tmp_path / ('x' * (NAME_MAX - 1) + 'y')))
+    with open(partial, 'w') as f:
+        f.write('fits')
+
+def test_failed_commit_counts_as_an_error_for_that_target(tmp_path, monkeypatch):
+    source = str(tmp_path / 'source')
+    targets = [str(tmp_path / 'one'), str(tmp_path / 'two')]
+    write_file(source, 'file.txt', 'content')
+    engine = SyncEngine(QuietApp())
+    engine.configure({'fsync_mode': 'batch'})
+
+    original_replace = os.replace
+    def replace(src, dst):
+        if dst.startswith(targets[1] + os.sep):
+            raise OSError('disk full')
+        original_replace(src, dst)
+    monkeypatch.setattr(durable_writes.os, 'replace', replace)
+
+    results = engine.sync_to_targets(source, targets, [], [])
+    assert (results[targets[0]]['copied'], results[targets[0]]['errors']) == (1, 0)
+    assert (results[targets[1]]['copied'], results[targets[1]]['errors']) == (0, 1)
+
+def test_batch_commit_flushes_each_file_system_once(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(durable_writes, '_syncfs', lambda fd: calls.append(fd) or 0)
+    monkeypatch.setattr(durable_writes, 'fsync_path', lambda path: pytest.fail(f"fsync of {path}"))
+    writes = durable_writes.DurableWrites('batch')
+    for index in range(20):
+        temp = str(tmp_path / f'.file_{index}.tmp')
+        with open(temp, 'w') as f:
+            f.write('x')
+        writes.publish(temp, str(tmp_path / f'file_{index}'))
+    assert writes.commit() == 20
+    # Once for the data before the renames, once for the renames
+    assert len(calls) == 2
+    assert sorted(os.listdir(tmp_path)) == sorted(f'file_{index}' for index in range(20))
@@ -0,0 +1,61 @@
+import os
+
+from lib.event_coalescer import EventCoalescer, Change
+
+def coalesce(*events):
+    """Feed events to a coalescer that only flushes when stopped, returning what it flushed"""
+    flushed = []
+    coalescer = EventCoalescer(flushed.extend, quiet_period=60, max_delay=60)
+    coalescer.start()
+    for event in events:
+        coalescer.add(*event)
+    coalescer.stop()
+    return sorted(flushed)
+
+def test_create_then_delete_cancels_out():
+    assert coalesce(('created', 'a.txt'), ('modified', 'a.txt'), ('deleted', 'a.txt')) == []
+    assert coalesce(('dir_created', 'new'), ('dir_deleted', 'new')) == []
+
+def test_repeated_writes_collapse_into_one_change():
+    assert coalesce(('created', 'a.txt'), ('modified', 'a.txt'), ('modified', 'a.txt')) == [
+        Change('created', 'a.txt', None)]
+    # Deleted and recreated: the target copy is replaced
+    assert coalesce(('deleted', 'a.txt'), ('created', 'a.txt')) == [Change('modified', 'a.txt', None)]
+
+def test_chained_moves_become_a_single_move():
+    assert coalesce(('moved', 'b.txt', 'a.txt'), ('moved', 'c.txt', 'b.txt')) == [
+        Change('moved', 'c.txt', 'a.txt')]
+    # A file created and then moved never reached the target under its old name
+    assert coalesce(('created', 'a.txt'), ('moved', 'b.txt', 'a.txt')) == [Change('created', 'b.txt', None)]
+
+def test_modify_after_a_move_is_kept():
+    assert coalesce(('moved', 'b.txt', 'a.txt'), ('modified', 'b.txt')) == [
+        Change('modified', 'b.txt', None), Change('moved', 'b.txt', 'a.txt')]
+    assert coalesce(('modified', 'a.txt'), ('moved', 'b.txt', 'a.txt'), ('moved', 'c.txt', 'b.txt')) == [
+        Change('modified', 'c.txt', None), Change('moved', 'c.txt', 'a.txt')]
+    # Moved and then deleted: only the old path needs removing
+    assert coalesce(('moved', 'b.txt', 'a.txt'), ('deleted', 'b.txt')) == [Change('deleted', 'a.txt', None)]
+
+def test_directory_move_re_roots_pending_child_events():
+    old, new = 'old', 'new'
+    changes = coalesce(('modified', os.path.join(old, 'x.txt')),
+                       ('created', os.path.join(old, 'sub', 'y.txt')),
+                       ('moved', 'top.txt', os.path.join(old, 'z.txt')),
+                       ('dir_moved', new, old))
+    assert changes == sorted([
+        Change('dir_moved', new, old),
+        Change('modified', os.path.join(new, 'x.txt'), None),
+        Change('created', os.path.join(new, 'sub', 'y.txt'), None),
+        Change('moved', 'top.txt', os.path.join(new, 'z.txt')),
+    ])
+
+def test_per_file_echoes_of_a_directory_move_are_dropped():
+    assert coalesce(('dir_moved', 'new', 'old'),
+                    ('moved', os.path.join('new', 'x.txt'), os.path.join('old', 'x.txt'))) == [
+        Change('dir_moved', 'new', 'old')]
+
+def test_directory_changes_absorb_events_below_them():
+    assert coalesce(('modified', os.path.join('gone', 'x.txt')), ('dir_deleted', 'gone'),
+                    ('deleted', os.path.join('gone', 'y.txt'))) == [Change('dir_deleted', 'gone', None)]
+    assert coalesce(('dir_created', 'fresh'), ('created', os.path.join('fresh', 'x.txt'))) == [
+        Change('dir_created', 'fresh', None)]
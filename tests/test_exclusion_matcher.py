@@ -0,0 +1,84 @@
+from conftest import write_file
+from lib.exclusion_matcher import ExclusionMatcher
+
+def matcher_for(tmp_path, patterns):
+    return ExclusionMatcher(str(tmp_path), patterns, read_nested=False)
+
+def test_negation_re_includes_and_the_last_matching_rule_decides(tmp_path):
+    matcher = matcher_for(tmp_path, ['*.log', '!keep.log'])
+    assert matcher.is_excluded('debug.log')
+    assert not matcher.is_excluded('keep.log')
+    assert not matcher.is_excluded('sub/keep.log')
+
+    matcher = matcher_for(tmp_path, ['!keep.log', '*.log'])
+    assert matcher.is_excluded('keep.log')
+
+def test_negation_cannot_re_include_inside_an_excluded_directory(tmp_path):
+    matcher = matcher_for(tmp_path, ['build/', '!build/keep.txt'])
+    assert matcher.is_excluded('build/keep.txt')
+    assert matcher.is_excluded('build/deeper/keep.txt')
+
+def test_patterns_with_a_slash_are_anchored(tmp_path):
+    matcher = matcher_for(tmp_path, ['/todo.txt', 'doc/notes.txt'])
+    assert matcher.is_excluded('todo.txt')
+    assert not matcher.is_excluded('sub/todo.txt')
+    assert matcher.is_excluded('doc/notes.txt')
+    assert not matcher.is_excluded('sub/doc/notes.txt')
+
+    # Without a slash a pattern matches at any depth
+    matcher = matcher_for(tmp_path, ['todo.txt'])
+    assert matcher.is_excluded('todo.txt')
+    assert matcher.is_excluded('a/b/todo.txt')
+
+def test_dir_only_patterns_match_directories_but_not_files(tmp_path):
+    matcher = matcher_for(tmp_path, ['cache/'])
+    assert matcher.is_excluded('cache', is_dir=True)
+    assert matcher.is_excluded('sub/cache', is_dir=True)
+    assert matcher.is_excluded('cache/data.bin')
+    assert not matcher.is_excluded('cache')
+    assert not matcher.is_excluded('sub/cache')
+
+def test_double_star_matches_any_number_of_directories(tmp_path):
+    matcher = matcher_for(tmp_path, ['**/logs', 'a/**/b', 'out/**'])
+    assert matcher.is_excluded('logs')
+    assert matcher.is_excluded('x/y/logs')
+    assert matcher.is_excluded('a/b')
+    assert matcher.is_excluded('a/x/b')
+    assert matcher.is_excluded('a/x/y/b')
+    assert not matcher.is_excluded('c/a/x/b')
+    # A trailing '/**' matches everything inside the directory, not the directory itself
+    assert matcher.is_excluded('out/file.txt')
+    assert matcher.is_excluded('out/x/file.txt')
+    assert not matcher.is_excluded('out', is_dir=True)
+
+    # A '**' that is not a whole path component is an ordinary '*'
+    matcher = matcher_for(tmp_path, ['a**.txt'])
+    assert matcher.is_excluded('abc.txt')
+    assert not matcher.is_excluded('a/b.txt')
+
+def test_nested_gitignore_overrides_its_parents_inside_its_directory(tmp_path):
+    root = str(tmp_path)
+    write_file(root, '.gitignore', '*.txt\n')
+    write_file(root, 'sub/.gitignore', '!keep.txt\n/local.bin\n')
+    matcher = ExclusionMatcher(root)
+    assert matcher.is_excluded('keep.txt')
+    assert matcher.is_excluded('sub/other.txt')
+    assert not matcher.is_excluded('sub/keep.txt')
+    assert not matcher.is_excluded('sub/deeper/keep.txt')
+    # Anchored patterns in a nested .gitignore are relative to its directory
+    assert matcher.is_excluded('sub/local.bin')
+    assert not matcher.is_excluded('sub/deeper/local.bin')
+    assert not matcher.is_excluded('local.bin')
+
+def test_additional_patterns_take_precedence_over_every_gitignore(tmp_path):
+    root = str(tmp_path)
+    write_file(root, '.gitignore', '!important.txt\n')
+    write_file(root, 'sub/.gitignore', '!keep.txt\n')
+    matcher = ExclusionMatcher(root, additional_patterns=['*.txt'])
+    assert matcher.is_excluded('important.txt')
+    assert matcher.is_excluded('sub/keep.txt')
+
+def test_partial_copies_stay_excluded_despite_negations(tmp_path):
+    matcher =ExclusionMatcher(str(tmp_path), [], ['!.*.syncer-part'], read_nested=False)
+    assert matcher.is_excluded('.big.iso.syncer-part')
+    assert matcher.is_excluded('sub/.big.iso.syncer-part')
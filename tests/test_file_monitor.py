@@ -0,0 +1,118 @@
+import os
+import sys
+import time
+
+import pytest
+
+from conftest import QuietApp, write_file
+from lib.sync_engine import SyncEngine
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith('linux'), reason="inotify watches are Linux only")
+
+def has_directory_observer():
+    from lib.file_monitor import DirectoryObserver
+    return DirectoryObserver is not None
+
+requires_directory_observer = pytest.mark.skipif(not has_directory_observer(),
+                                                 reason="the installed watchdog only supports recursive watches")
+
+def inotify_instances():
+    count = 0
+    for fd in os.listdir('/proc/self/fd'):
+        try:
+            if os.readlink(f'/proc/self/fd/{fd}') == 'anon_inode:inotify':
+                count += 1
+        except OSError:
+            pass
+    return count
+
+@requires_directory_observer
+def test_per_directory_watches_share_one_inotify_instance(folders):
+    from lib.file_monitor import FileMonitor
+    source, _ = folders
+    # More directories than the default limit of 128 inotify instances per user
+    for index in range(300):
+        os.makedirs(os.path.join(source, f'group_{index // 20}', f'dir_{index}'))
+    engine = SyncEngine(QuietApp())
+    engine.set_exclusions(source, [])
+    app = QuietApp(engine)
+    monitor = FileMonitor(app)
+    monitor.configure({'debounce_quiet_period': 0.1, 'debounce_max_delay': 0.5, 'monitor_mode': 'native'})
+    before = inotify_instances()
+    assert monitor.start(source)
+    try:
+        assert monitor.watch_mode == 'per_directory'
+        assert monitor.get_stats()['watches'] == 316
+        assert inotify_instances() - before == 1
+        write_file(source, os.path.join('group_14', 'dir_299', 'new.txt'), 'x')
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and not app.changes:
+            time.sleep(0.05)
+        assert os.path.join('group_14', 'dir_299', 'new.txt') in {change.path for change in app.changes}
+    finally:
+        monitor.stop()
+    assert inotify_instances() == before
+
+@requires_directory_observer
+def test_removing_watches_keeps_the_shared_instance_reading(folders):
+    from lib.file_monitor import FileMonitor
+    source, _ = folders
+    for index in range(20):
+        os.makedirs(os.path.join(source, f'dir_{index}'))
+    engine = SyncEngine(QuietApp())
+    engine.set_exclusions(source, [])
+    app = QuietApp(engine)
+    monitor = FileMonitor(app)
+    monitor.configure({'debounce_quiet_period': 0.1, 'debounce_max_delay': 0.5, 'monitor_mode': 'native'})
+    assert monitor.start(source)
+    try:
+        engine.set_exclusions(source, ['dir_1*'])
+        monitor.refresh_watches()
+        assert monitor.get_stats()['watches'] == 10
+        write_file(source, os.path.join('dir_5', 'after.txt'), 'x')
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and not app.changes:
+            time.sleep(0.05)
+        assert [change.path for change in app.changes] == [os.path.join('dir_5', 'after.txt')]
+    finally:
+        monitor.stop()
+
+def start_monitor(source):
+    from lib.file_monitor import FileMonitor
+    engine = SyncEngine(QuietApp())
+    engine.set_exclusions(source, [])
+    monitor = FileMonitor(QuietApp(engine))
+    monitor.configure({'debounce_quiet_period': 0.1, 'debounce_max_delay': 0.5, 'monitor_mode': 'native'})
+    assert monitor.start(source)
+    marked = []
+    monitor.reconciler.mark_dirty = lambda rel_dir, reason: marked.append(rel_dir)
+    return monitor, marked
+
+def test_event_burst_spread_over_directories_marks_the_folder(folders):
+    source, _ = folders
+    monitor, marked = start_monitor(source)
+    try:
+        monitor.overflow_threshold = 50
+        for index in range(60):
+            monitor.note_event(os.path.join(source, f'dir_{index}', 'file.txt'))
+        assert marked == ['']
+    finally:
+        monitor.stop()
+
+@requires_directory_observer
+def test_queue_overflow_notice_marks_the_folder(folders):
+    import struct
+    import threading
+    from watchdog.observers.inotify_c import Inotify, InotifyConstants
+    from lib import file_monitor
+    source, _ = folders
+    monitor, marked = start_monitor(source)
+    try:
+        # As the reader thread of the monitor's inotify instance would see it
+        file_monitor.overflow_emitters[threading.current_thread()] = monitor.directory_emitter
+        overflow = struct.pack('iIII', -1, InotifyConstants.IN_Q_OVERFLOW, 0, 0)
+        assert list(Inotify._parse_event_buffer(overflow)) == [(-1, InotifyConstants.IN_Q_OVERFLOW, 0, b'')]
+        assert marked == ['']
+    finally:
+        del file_monitor.overflow_emitters[threading.current_thread()]
+        monitor.stop()
@@ -0,0 +1,25 @@
+import os
+
+from conftest import write_file
+from lib.hash_cache import HashCache, PROCESS_POOL_THRESHOLD, hash_file
+
+def test_worker_pool_is_started_once_and_reused(tmp_path):
+    root = str(tmp_path / 'files')
+    paths = []
+    for index in range(2 * PROCESS_POOL_THRESHOLD):
+        write_file(root, f'file_{index}.txt', f'content {index}')
+        paths.append(os.path.join(root, f'file_{index}.txt'))
+    cache = HashCache(str(tmp_path / 'hashes.db'), workers=2)
+    try:
+        first = cache.hash_files(paths[:PROCESS_POOL_THRESHOLD])
+        pool = cache.pool
+        assert pool is not None
+        assert pool._mp_context.get_start_method() != 'fork'
+        second = cache.hash_files(paths[PROCESS_POOL_THRESHOLD:])
+        assert cache.pool is pool
+        assert cache.hashed_count == len(paths)
+        digests = dict(first, **second)
+        assert all(digests[path] == hash_file(path) for path in paths)
+    finally:
+        cache.close()
+    assert cache.pool is None
@@ -0,0 +1,51 @@
+import os
+
+from conftest import write_file, read_file
+from test_catch_up import make_engine, age
+
+def edit_in_place(root, rel_path, extra):
+    """Append to a file, leaving its directory's mtime as it was"""
+    directory = os.path.dirname(os.path.join(root, rel_path))
+    dir_stat = os.stat(directory)
+    with open(os.path.join(root, rel_path), 'a') as f:
+        f.write(extra)
+    os.utime(directory, ns=(dir_stat.st_atime_ns, dir_stat.st_mtime_ns))
+
+def test_indexed_sync_picks_up_in_place_edit(tmp_path, folders):
+    source, target = folders
+    write_file(source, os.path.join('a', 'one.txt'), 'one')
+    write_file(source, os.path.join('a', 'two.txt'), 'two')
+    age(source, os.path.join('a', 'one.txt'), os.path.join('a', 'two.txt'), 'a', '.')
+    engine = make_engine(tmp_path)
+    assert engine.sync_folders(source, target, [], [], use_index=True) == (2, 0)
+
+    edit_in_place(source, os.path.join('a', 'one.txt'), ' edited')
+    assert engine.sync_folders(source, target, [], [], use_index=True) == (1, 0)
+    assert read_file(target, os.path.join('a', 'one.txt')) == 'one edited'
+
+def test_catch_up_picks_up_in_place_edit(tmp_path, folders):
+    source, target = folders
+    write_file(source, os.path.join('a', 'one.txt'), 'one')
+    age(source, os.path.join('a', 'one.txt'), 'a', '.')
+    engine = make_engine(tmp_path)
+    engine.set_exclusions(source, [])
+    engine.sync_folders(source, target, [], [], use_index=True)
+
+    edit_in_place(source, os.path.join('a', 'one.txt'), ' edited')
+    assert engine.catch_up(source, target)['copied'] == 1
+    assert read_file(target, os.path.join('a', 'one.txt')) == 'one edited'
+
+def test_file_moved_and_edited_is_copied_after_the_move(tmp_path, folders):
+    source, target = folders
+    write_file(source, os.path.join('a', 'one.txt'), 'one')
+    age(source, os.path.join('a', 'one.txt'), 'a', '.')
+    engine = make_engine(tmp_path)
+    engine.sync_folders(source, target, [], [], use_index=True)
+
+    # Same inode and size, new content and mtime: the index matches it as a rename
+    os.renames(os.path.join(source, 'a', 'one.txt'), os.path.join(source, 'b', 'one.txt'))
+    with open(os.path.join(source, 'b', 'one.txt'), 'w') as f:
+        f.write('new')
+    assert engine.sync_folders(source, target, [], [], use_index=True) == (1, 0)
+    assert read_file(target, os.path.join('b', 'one.txt')) == 'new'
+    assert not os.path.exists(os.path.join(target, 'a'))
@@ -0,0 +1,116 @@
+import os
+
+import pytest
+
+from conftest import QuietApp, write_file, read_file
+from lib.sync_engine import SyncEngine
+from lib.hash_cache import HashCache
+from lib.sync_journal import SyncJournal
+
+def make_engine(tmp_path):
+    engine = SyncEngine(QuietApp())
+    engine.hash_cache = HashCache(str(tmp_path / 'hashes.db'))
+    engine.configure({'streaming_sync': True})
+    return engine
+
+def test_streaming_sync_moves_renamed_files(tmp_path, folders):
+    source, target = folders
+    write_file(source, os.path.join('a', 'one.txt'), 'one' * 100)
+    write_file(source, os.path.join('z', 'two.txt'), 'two' * 100)
+    engine = make_engine(tmp_path)
+    assert engine.sync_folders(source, target, [], []) == (2, 0)
+
+    # One rename sorts after its old path and one before it
+    os.renames(os.path.join(source, 'a', 'one.txt'), os.path.join(source, 'b', 'one.txt'))
+    os.renames(os.path.join(source, 'z', 'two.txt'), os.path.join(source, 'c', 'two.txt'))
+    copied = []
+    original_copy_file = engine.copy_file
+    def copy_file(source_folder, target_folder, rel_path, *args):
+        copied.append(rel_path)
+        return original_copy_file(source_folder, target_folder, rel_path, *args)
+    engine.copy_file = copy_file
+
+    assert engine.sync_folders(source, target, [], []) == (0, 0)
+    assert copied == []
+    assert read_file(target, os.path.join('b', 'one.txt')) == 'one' * 100
+    assert read_file(target, os.path.join('c', 'two.txt')) == 'two' * 100
+    assert not os.path.exists(os.path.join(target, 'a'))
+    assert not os.path.exists(os.path.join(target, 'z'))
+
+def test_streaming_sync_copies_new_files_that_match_no_deletion(tmp_path, folders):
+    source, target = folders
+    write_file(source, 'old.txt', 'old')
+    engine = make_engine(tmp_path)
+    engine.sync_folders(source, target, [], [])
+
+    os.remove(os.path.join(source, 'old.txt'))
+    write_file(source, 'new.txt', 'new content')
+    assert engine.sync_folders(source, target, [], []) == (1, 1)
+    assert read_file(target, 'new.txt') == 'new content'
+    assert not os.path.exists(os.path.join(target, 'old.txt'))
+
+def journal_options():
+    return {'gitignore': [], 'additional': [], 'delete_files': True, 'compare_mode': 'mtime'}
+
+def test_streaming_sync_cancelled_during_the_walk_resumes_its_copies(tmp_path, folders):
+    source, target = folders
+    for index in range(50):
+        write_file(source, f'file_{index:02}.txt', f'content {index}')
+    engine = make_engine(tmp_path)
+    engine.journal = SyncJournal(str(tmp_path / 'journal.db'))
+
+    cancelled = []
+    original_copy_file = engine.copy_file
+    def copy_file(source_folder, target_folder, rel_path, *args):
+        cancelled.append(rel_path)
+        return original_copy_file(source_folder, target_folder, rel_path, *args)
+    engine.copy_file = copy_file
+    engine.sync_folders(source, target, [], [], cancel_check=lambda: bool(cancelled))
+
+    plan = engine.journal.pending(source, target, journal_options())
+    assert plan is not None and not plan.complete
+    assert plan.operations and all(kind == 'copy' for kind, _, _ in plan.operations)
+
+    engine.copy_file = original_copy_file
+    engine.app.messages.clear()
+    engine.sync_folders(source, target, [], [])
+    assert any(message.startswith('Resuming interrupted sync') for _, message in engine.app.messages)
+    assert sorted(os.listdir(target)) == sorted(os.listdir(source))
+    assert engine.journal.pending(source, target, journal_options()) is None
+
+def test_partial_plan_resume_leaves_deletions_to_the_sync_that_follows(tmp_path, folders):
+    source, target = folders
+    write_file(source, 'kept.txt', 'kept')
+    write_file(target, 'extra.txt', 'extra')
+    engine = make_engine(tmp_path)
+    engine.journal = SyncJournal(str(tmp_path / 'journal.db'))
+    engine.journal.begin(source, target, journal_options(), [('copy', 'kept.txt', None),
+                                                              ('delete', 'extra.txt', None)])
+
+    deleted_during_resume = []
+    original_resume_sync = engine.resume_sync
+    def resume_sync(*args):
+        counts = original_resume_sync(*args)
+        deleted_during_resume.append(not os.path.exists(os.path.join(target, 'extra.txt')))
+        return counts
+    engine.resume_sync = resume_sync
+
+    assert engine.sync_folders(source, target, [], []) == (1, 1)
+    assert deleted_during_resume == [False]
+    assert not os.path.exists(os.path.join(target, 'extra.txt'))
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_resume_is_followed_by_a_sync_of_later_changes(tmp_path, folders, streaming):
+    source, target = folders
+    write_file(source, 'planned.txt', 'planned')
+    engine = make_engine(tmp_path)
+    engine.configure({'streaming_sync': streaming})
+    engine.journal = SyncJournal(str(tmp_path / 'journal.db'))
+    engine.journal.begin(source, target, journal_options(), [('copy', 'planned.txt', None)], complete=True)
+    # Changed after the sync was interrupted, so not in its plan
+    write_file(source, 'later.txt', 'later')
+
+    assert engine.sync_folders(source, target, [], []) == (2, 0)
+    assert read_file(target, 'planned.txt') == 'planned'
+    assert read_file(target, 'later.txt') == 'later'
+    assert engine.journal.pending(source, target, journal_options()) is None